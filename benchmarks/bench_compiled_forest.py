@@ -0,0 +1,59 @@
+"""
+Parity check and microbenchmark of CompiledForest against the fitted
+RandomForestClassifier, run from the repository root:
+
+    python -m benchmarks.bench_compiled_forest
+    python -m benchmarks.bench_compiled_forest --n-estimators 300 --batch-sizes 1 8 64 512
+"""
+import argparse
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+
+from benchmarks.synthetic import make_applications_frame, make_fake_model
+from us_visa.entity.compiled_forest import CompiledForest
+
+
+def _time_per_call(fn: Callable, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 64, 256, 1024])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    model = make_fake_model(nEstimators=args.n_estimators)
+    forest = model.trained_model_object
+    compiled = CompiledForest.from_forest(forest)
+
+    # Parity on fresh data and on inputs sitting right on the split thresholds
+    features = model.preprocessing_object.transform(make_applications_frame(20000, seed=1))
+    if not compiled.matches(forest, features) or not compiled.matches(forest):
+        print("FAIL: compiled predictions differ from the forest")
+        return 1
+    print(f"parity: {len(compiled.roots)} trees, {len(compiled.feature)} nodes, "
+          f"depth {compiled.maxDepth}, predict_proba identical to the forest")
+
+    for batchSize in args.batch_sizes:
+        batch = np.ascontiguousarray(features[:batchSize])
+        repeat = max(5, args.repeat // max(1, batchSize // 64))
+        forestSeconds = _time_per_call(lambda: forest.predict(batch), repeat)
+        compiledSeconds = _time_per_call(lambda: compiled.predict(batch), repeat)
+        print(f"{batchSize:>6} rows  forest {forestSeconds * 1e6:>10.1f} us  "
+              f"compiled {compiledSeconds * 1e6:>10.1f} us  "
+              f"x{forestSeconds / compiledSeconds:.1f}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Parity check and microbenchmark of CompiledPreprocessor against the fitted
+ColumnTransformer, run from the repository root:
+
+    python -m benchmarks.bench_compiled_preprocessor
+"""
+import argparse
+import sys
+import time
+from typing import Callable
+
+from benchmarks.synthetic import make_applications_frame, make_fitted_preprocessor
+from us_visa.entity.compiled_preprocessor import CompiledPreprocessor
+
+
+def _time_per_call(fn: Callable, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    preprocessor = make_fitted_preprocessor()
+    compiled = CompiledPreprocessor.from_column_transformer(preprocessor)
+
+    # Parity on fresh data, every category and both the batch and single-row paths
+    for seed in range(1, 6):
+        frame = make_applications_frame(args.batch_size, seed=seed)
+        if not compiled.matches(preprocessor, frame):
+            print(f"FAIL: compiled output differs from preprocessor (seed={seed})")
+            return 1
+    if not compiled.matches(preprocessor, compiled.sample_frame()):
+        print("FAIL: compiled output differs from preprocessor on sample frame")
+        return 1
+    print("parity: compiled output identical to preprocessor.transform")
+
+    row = make_applications_frame(1, seed=7)
+    record = row.iloc[0].to_dict()
+    batch = make_applications_frame(args.batch_size, seed=8)
+    batchRepeat = max(1, args.repeat // 100)
+
+    results = {
+        "single row, ColumnTransformer": _time_per_call(
+            lambda: preprocessor.transform(row), args.repeat // 10),
+        "single row, compiled": _time_per_call(
+            lambda: compiled.transform_row(record), args.repeat),
+        f"{args.batch_size} rows, ColumnTransformer": _time_per_call(
+            lambda: preprocessor.transform(batch), batchRepeat),
+        f"{args.batch_size} rows, compiled": _time_per_call(
+            lambda: compiled.transform(batch), batchRepeat),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:<36} {seconds * 1e6:>12.1f} us/call")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
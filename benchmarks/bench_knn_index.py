@@ -0,0 +1,96 @@
+"""
+Benchmark of the KNNIndex searches against the kd_tree, ball_tree and brute
+neighbor searches that the model grid searches, for growing training sets.
+Run from the repository root:
+
+    python -m benchmarks.bench_knn_index
+    python -m benchmarks.bench_knn_index --train-sizes 20000 100000 400000 --n-probe 4 8 16
+
+Reports the latency per batch size, the recall@k of the approximate search
+against the exact one, and the share of predictions equal to the classifier's.
+"index tuned" is what KNN_INDEX_MODE=approximate serves: nprobe doubled until
+the recall reaches KNN_INDEX_MIN_RECALL.
+"""
+import argparse
+import sys
+import time
+from typing import Callable
+
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+
+from benchmarks.synthetic import make_applications_frame, make_fitted_preprocessor
+from us_visa.constants import KNN_INDEX_MAX_PROBE, KNN_INDEX_MIN_RECALL
+from us_visa.entity.knn_index import KNNIndex
+
+
+def _time_per_call(fn: Callable, repeat: int) -> float:
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--train-sizes", type=int, nargs="+", default=[20000, 100000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64, 1000])
+    parser.add_argument("--n-neighbors", type=int, default=5)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[8])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    preprocessor = make_fitted_preprocessor()
+    queries = preprocessor.transform(make_applications_frame(max(args.batch_sizes), seed=99))
+
+    for trainSize in args.train_sizes:
+        frame = make_applications_frame(trainSize, seed=1)
+        X = preprocessor.transform(frame)
+        y = ((frame["prevailing_wage"] > frame["prevailing_wage"].median())
+             ^ (frame["has_job_experience"] == "N")).astype(int).to_numpy()
+
+        classifiers = {
+            algorithm: KNeighborsClassifier(n_neighbors=args.n_neighbors, algorithm=algorithm).fit(X, y)
+            for algorithm in ("kd_tree", "ball_tree", "brute")
+        }
+        start = time.perf_counter()
+        index = KNNIndex.from_classifier(classifiers["brute"])
+        print(f"\n{trainSize} training rows: index of {index.nLists} clusters "
+              f"built in {time.perf_counter() - start:.1f}s")
+
+        searches = {f"sklearn {name}": classifier.predict for name, classifier in classifiers.items()}
+        recall = index.tune_n_probe(queries[:500], minRecall=KNN_INDEX_MIN_RECALL, maxProbe=KNN_INDEX_MAX_PROBE)
+        tunedProbe = index.nProbe
+        tunedName = f"index tuned nprobe={tunedProbe}"
+        print(f"  {tunedName}: recall@{index.nNeighbors} {recall:.4f}")
+        searches[tunedName] = lambda batch: _predict(index, batch, tunedProbe, exact=False)
+        searches["index exact"] = lambda batch: _predict(index, batch, tunedProbe, exact=True)
+        agreement = {tunedName: index.agreement(classifiers["brute"], queries, exact=False),
+                     "index exact": index.agreement(classifiers["brute"], queries)}
+        for nProbe in args.n_probe:
+            nProbe = min(nProbe, index.nLists)
+            index.nProbe = nProbe
+            name = f"index approx nprobe={nProbe}"
+            searches[name] = lambda batch, n=nProbe: _predict(index, batch, n, exact=False)
+            agreement[name] = index.agreement(classifiers["brute"], queries, exact=False)
+            print(f"  {name}: recall@{index.nNeighbors} {index.measure_recall(queries[:500]):.4f}")
+
+        for name, search in searches.items():
+            timings = "  ".join(
+                f"{batchSize:>5} rows {_time_per_call(lambda: search(queries[:batchSize]), args.repeat) * 1000:8.2f}ms"
+                for batchSize in args.batch_sizes)
+            agrees = f"  agreement {agreement[name]:.4f}" if name in agreement else ""
+            print(f"  {name:<26} {timings}{agrees}")
+
+    return 0
+
+
+def _predict(index: KNNIndex, batch: np.ndarray, nProbe: int, exact: bool) -> np.ndarray:
+    index.nProbe = nProbe
+    return index.predict(batch, exact=exact)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""
+Compares the model artifact format against the dill pickle the trainer used
+to write: file size, load time in a fresh process, and prediction parity.
+Run from the repository root:
+
+    python -m benchmarks.bench_model_artifact
+    python -m benchmarks.bench_model_artifact --n-estimators 300 --knn-rows 200000
+
+Loads are timed in a subprocess that imports sklearn first, so that only
+deserialization is measured, not module imports or objects already in memory.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict
+
+import numpy as np
+from sklearn.neighbors import KNeighborsClassifier
+
+from benchmarks.synthetic import make_applications_frame, make_fake_model, make_fitted_preprocessor
+from us_visa.entity.estimator import USvisaModel
+from us_visa.utils.main_utils import load_object, save_object
+from us_visa.utils.model_artifact import save_model_artifact
+
+_LOAD_SCRIPT = """
+import sys, time
+import sklearn.compose, sklearn.ensemble, sklearn.neighbors, sklearn.pipeline, sklearn.preprocessing
+import us_visa.entity.estimator
+from us_visa.utils.main_utils import load_object
+start = time.perf_counter()
+load_object(sys.argv[1])
+print(time.perf_counter() - start)
+"""
+
+
+def make_knn_model(nRows: int, seed: int = 0) -> USvisaModel:
+    frame = make_applications_frame(nRows, seed=seed)
+    target = (frame["prevailing_wage"] > frame["prevailing_wage"].median()).astype(int)
+
+    preprocessor = make_fitted_preprocessor(seed=seed)
+    classifier = KNeighborsClassifier(n_neighbors=5)
+    classifier.fit(preprocessor.transform(frame), target)
+
+    return USvisaModel(preprocessing_object=preprocessor, trained_model_object=classifier)
+
+
+def _time_load(filePath: str, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, "-c", _LOAD_SCRIPT, filePath],
+                                check=True, capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return float(np.median(timings))
+
+
+def bench_model(name: str, model: USvisaModel, workDir: str, repeats: int) -> Dict[str, dict]:
+    frame = make_applications_frame(2000, seed=99)
+    expected = model.predict(frame)
+
+    writers = {
+        "dill": lambda path: save_object(path, model),
+        "artifact": lambda path: save_model_artifact(path, model),
+        "artifact-zlib": lambda path: save_model_artifact(path, model, compression="zlib"),
+    }
+    results = {}
+    for formatName, write in writers.items():
+        filePath = os.path.join(workDir, f"{name}-{formatName}.pkl")
+        write(filePath)
+
+        if not np.array_equal(load_object(filePath).predict(frame), expected):
+            raise AssertionError(f"{name} predictions differ after a {formatName} round trip")
+
+        results[formatName] = {
+            "bytes": os.path.getsize(filePath),
+            "loadSeconds": _time_load(filePath, repeats),
+        }
+        print(f"{name:<14} {formatName:<14} {results[formatName]['bytes'] / 1e6:9.1f} MB "
+              f"load {results[formatName]['loadSeconds'] * 1000:9.1f} ms")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n-estimators", type=int, default=200)
+    parser.add_argument("--knn-rows", type=int, default=100000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    models = {
+        "random_forest": make_fake_model(nRows=20000, nEstimators=args.n_estimators),
+        "knn": make_knn_model(args.knn_rows),
+    }
+    with tempfile.TemporaryDirectory() as workDir:
+        for name, model in models.items():
+            bench_model(name, model, workDir, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
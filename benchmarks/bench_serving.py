@@ -0,0 +1,203 @@
+"""
+In-process load test of the FastAPI app, no network and no s3: requests go
+through httpx.ASGITransport to a local fake model. Run from the repository root:
+
+    python -m benchmarks.bench_serving
+    python -m benchmarks.bench_serving --save-baseline
+
+Latency percentiles and throughput are measured per route and concurrency
+level, written to a JSON report and compared against the stored baseline.
+The exit code is 1 when a run regresses past the tolerance, and 2 when there
+is no baseline to compare against.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+import httpx
+import numpy as np
+
+from benchmarks.synthetic import make_applications_frame, make_fake_model
+from server.main import app
+from us_visa.pipline.prediction_pipeline import usVisaModelHolder
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_REPORT_PATH = os.path.join(BENCHMARKS_DIR, "results", "serving.json")
+DEFAULT_BASELINE_PATH = os.path.join(BENCHMARKS_DIR, "baselines", "serving.json")
+
+
+def _make_bodies(route: str, nRequests: int, batchSize: int, seed: int) -> List[dict]:
+    # Fresh rows for every run, so that the prediction cache never answers
+    records = make_applications_frame(nRequests * batchSize, seed=seed).to_dict(orient="records")
+    if route == "/v1/predict":
+        return records
+    return [{"records": records[index:index + batchSize]}
+            for index in range(0, len(records), batchSize)]
+
+
+async def _run_load(client: httpx.AsyncClient,
+                    route: str,
+                    bodies: List[dict],
+                    concurrency: int,
+                    ) -> Dict[str, float]:
+    latencies: List[float] = []
+    errors = 0
+    nextBody = iter(bodies)
+
+    async def user() -> None:
+        nonlocal errors
+        for body in nextBody:
+            start = time.perf_counter()
+            response = await client.post(route, json=body)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latenciesMs = np.array(latencies) * 1000
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50Ms": float(np.percentile(latenciesMs, 50)),
+        "p95Ms": float(np.percentile(latenciesMs, 95)),
+        "p99Ms": float(np.percentile(latenciesMs, 99)),
+        "meanMs": float(latenciesMs.mean()),
+        "requestsPerSecond": len(latencies) / elapsed,
+    }
+
+
+async def run_benchmarks(concurrencyLevels: List[int],
+                         nRequests: int,
+                         batchSize: int,
+                         log: Callable[[str], None] = print,
+                         ) -> Dict[str, Dict[str, dict]]:
+    routes = {"/v1/predict": 1, "/v1/predict/batch": batchSize}
+    results: Dict[str, Dict[str, dict]] = {}
+    seed = 100
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for route, recordsPerRequest in routes.items():
+            # Warm up the scheduler, executor threads and compiled encoder
+            await _run_load(client, route, _make_bodies(route, 50, recordsPerRequest, seed=1), 4)
+
+            results[route] = {}
+            for concurrency in concurrencyLevels:
+                seed += 1
+                bodies = _make_bodies(route, nRequests, recordsPerRequest, seed=seed)
+                stats = await _run_load(client, route, bodies, concurrency)
+                stats["rowsPerSecond"] = stats["requestsPerSecond"] * recordsPerRequest
+                results[route][str(concurrency)] = stats
+
+                log(f"{route:<20} c={concurrency:<4} p50={stats['p50Ms']:8.2f}ms "
+                    f"p95={stats['p95Ms']:8.2f}ms p99={stats['p99Ms']:8.2f}ms "
+                    f"{stats['requestsPerSecond']:9.1f} req/s "
+                    f"{stats['rowsPerSecond']:10.1f} rows/s errors={stats['errors']}")
+
+    return results
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Return one message per route and concurrency level whose p99 latency grew,
+    or whose throughput dropped, by more than the tolerance
+    """
+    regressions = []
+    for route, levels in results.items():
+        for concurrency, stats in levels.items():
+            reference = baseline.get(route, {}).get(concurrency)
+            if reference is None:
+                continue
+
+            if stats["p99Ms"] > reference["p99Ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{route} c={concurrency}: p99 {stats['p99Ms']:.2f}ms "
+                    f"> baseline {reference['p99Ms']:.2f}ms")
+            if stats["requestsPerSecond"] < reference["requestsPerSecond"] * (1 - tolerance):
+                regressions.append(
+                    f"{route} c={concurrency}: {stats['requestsPerSecond']:.1f} req/s "
+                    f"< baseline {reference['requestsPerSecond']:.1f} req/s")
+            if stats["errors"] > reference["errors"]:
+                regressions.append(
+                    f"{route} c={concurrency}: {stats['errors']} errors "
+                    f"> baseline {reference['errors']}")
+    return regressions
+
+
+def _write_json(path: str, content: dict) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(content, file, indent=2)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=1000,
+                        help="Requests sent per route and concurrency level")
+    parser.add_argument("--batch-size", type=int, default=100,
+                        help="Records per /v1/predict/batch request")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--report", default=DEFAULT_REPORT_PATH)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store this run as the new baseline instead of comparing")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative p99 growth or throughput drop")
+    args = parser.parse_args()
+
+    # httpx logs every request at info level, which would be measured as well
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    usVisaModelHolder.set_model(make_fake_model(nEstimators=args.n_estimators))
+
+    results = asyncio.run(run_benchmarks(args.concurrency, args.requests, args.batch_size))
+    report = {
+        "createdAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "cpuCount": os.cpu_count(),
+        "settings": {
+            "requests": args.requests,
+            "batchSize": args.batch_size,
+            "nEstimators": args.n_estimators,
+        },
+        "results": results,
+    }
+    _write_json(args.report, report)
+    print(f"report written to {args.report}")
+
+    if args.save_baseline:
+        _write_json(args.baseline, report)
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"no baseline stored at {args.baseline}, run with --save-baseline to create one")
+        return 2
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    if baseline.get("settings") != report["settings"]:
+        print("WARNING: baseline was recorded with different settings")
+
+    regressions = compare_to_baseline(results, baseline["results"], args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    if regressions:
+        return 1
+
+    print(f"no regression past {args.tolerance:.0%} of the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
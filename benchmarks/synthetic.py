@@ -0,0 +1,63 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import RandomForestClassifier
+
+from us_visa.components.data_transformation import DataTransformation
+from us_visa.entity.estimator import USvisaModel
+
+CATEGORIES = {
+    "continent": ["Asia", "Africa", "North America", "Europe", "South America", "Oceania"],
+    "education_of_employee": ["High School", "Master's", "Bachelor's", "Doctorate"],
+    "has_job_experience": ["Y", "N"],
+    "region_of_employment": ["West", "Northeast", "South", "Midwest", "Island"],
+    "unit_of_wage": ["Hour", "Year", "Week", "Month"],
+    "full_time_position": ["Y", "N"],
+}
+
+
+def make_applications_frame(nRows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Random applications shaped like the prediction payload, company_age already derived
+    """
+    rng = np.random.default_rng(seed)
+    data = {column: rng.choice(categories, nRows)
+            for column, categories in CATEGORIES.items()}
+    data["no_of_employees"] = rng.integers(1, 100000, nRows)
+    data["company_age"] = date.today().year - rng.integers(1800, 2016, nRows)
+    data["prevailing_wage"] = rng.lognormal(mean=10, sigma=1.5, size=nRows).round(2)
+
+    return pd.DataFrame(data)
+
+
+def make_fitted_preprocessor(nRows: int = 5000, seed: int = 0) -> ColumnTransformer:
+    """
+    Fit the production preprocessor layout from DataTransformation on synthetic data
+    """
+    preprocessor = DataTransformation(
+        dataIngestionArtifact=None,
+        dataValidationArtifact=None,
+        dataTransformationConfig=None,
+    )._get_data_transformer_object()
+    preprocessor.fit(make_applications_frame(nRows, seed=seed))
+
+    return preprocessor
+
+
+def make_fake_model(nRows: int = 5000, seed: int = 0, nEstimators: int = 100) -> USvisaModel:
+    """
+    USvisaModel with the production preprocessor and a random forest fitted on
+    synthetic labels, a local stand-in for the model stored in s3
+    """
+    frame = make_applications_frame(nRows, seed=seed)
+    target = ((frame["prevailing_wage"] > frame["prevailing_wage"].median())
+              ^ (frame["has_job_experience"] == "N")).astype(int)
+
+    preprocessor = make_fitted_preprocessor(nRows, seed=seed)
+    classifier = RandomForestClassifier(
+        n_estimators=nEstimators, max_depth=12, random_state=seed)
+    classifier.fit(preprocessor.transform(frame), target)
+
+    return USvisaModel(preprocessing_object=preprocessor, trained_model_object=classifier)
@@ -1,5 +1,6 @@
 from us_visa.pipline.training_pipeline import TrainPipeline
 
 
-pipeline = TrainPipeline()
-pipeline.run_pipeline()
+if __name__ == "__main__":
+    pipeline = TrainPipeline()
+    pipeline.run_pipeline()
@@ -0,0 +1,199 @@
+import asyncio
+import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, List, Optional, Set
+
+import numpy as np
+
+from server.executors import BoundedExecutor, ExecutorBusyError
+from us_visa.exception import USvisaException
+from us_visa.logger import logging, servingLogger
+
+
+@dataclass
+class _PendingPrediction:
+    payload: Any
+    future: asyncio.Future
+    enqueuedAt: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatchScheduler:
+    """
+    Collects concurrent single-record predictions into one batch, so that
+    the preprocessor and model run once per batch instead of once per request.
+
+    A batch is flushed when it reaches maxBatchSize or when its oldest record
+    has waited maxWaitMs. The wait window is only applied while the server is
+    under concurrent load, a lone request at low traffic is scored right away.
+    Batches are scored on the executor, at most one per executor worker, and
+    records keep queueing up for the next batch while the workers are busy.
+    """
+
+    def __init__(self,
+                 predictFn: Callable[[List[Any]], np.ndarray],
+                 executor: BoundedExecutor,
+                 maxBatchSize: int,
+                 maxWaitMs: float,
+                 statsWindow: int = 10000,
+                 stageObserver: Optional[Callable[[str, float], None]] = None,
+                 ):
+        """
+        :param stageObserver: Called with "queue_wait" and the seconds every record
+            waited in the queue before its batch was flushed
+        """
+        try:
+            self.predictFn = predictFn
+            self.executor = executor
+            self.maxBatchSize = maxBatchSize
+            self.maxWait = maxWaitMs / 1000
+            self.stageObserver = stageObserver
+            self._queue: Optional[asyncio.Queue] = None
+            self._worker: Optional[asyncio.Task] = None
+            self._slots: Optional[asyncio.Semaphore] = None
+            self._scoringTasks: Set[asyncio.Task] = set()
+            self._lastBatchSize = 0
+
+            # stats
+            self._batchCount = 0
+            self._requestCount = 0
+            self._maxBatchSize = 0
+            self._batchSizes: Deque[int] = deque(maxlen=statsWindow)
+            self._queueWaits: Deque[float] = deque(maxlen=statsWindow)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and not self._worker.done()
+
+    def start(self) -> None:
+        if not self.is_running:
+            logging.info("Starting micro-batch prediction scheduler")
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.executor.maxWorkers)
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.is_running:
+            logging.info("Stopping micro-batch prediction scheduler")
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+    async def submit(self, payload: Any) -> Any:
+        """
+        Queue a single payload and wait for its own prediction
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingPrediction(payload=payload, future=future))
+
+        return await future
+
+    async def _collect_batch(self) -> List[_PendingPrediction]:
+        batch = [await self._queue.get()]
+        while len(batch) < self.maxBatchSize and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+        # Only hold the batch open when requests are arriving concurrently
+        if len(batch) > 1 or self._lastBatchSize > 1:
+            deadline = batch[0].enqueuedAt + self.maxWait
+            while len(batch) < self.maxBatchSize:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            await self._slots.acquire()
+            try:
+                batch = await self._collect_batch()
+            except BaseException:
+                self._slots.release()
+                raise
+            flushedAt = time.perf_counter()
+
+            self._lastBatchSize = len(batch)
+            self._record_batch(batch, flushedAt)
+
+            task = asyncio.create_task(self._score_and_release(batch))
+            self._scoringTasks.add(task)
+            task.add_done_callback(self._scoringTasks.discard)
+
+    async def _score_and_release(self, batch: List[_PendingPrediction]) -> None:
+        try:
+            await self._score_batch(batch)
+        finally:
+            self._slots.release()
+
+    async def _score_batch(self, batch: List[_PendingPrediction]) -> None:
+        try:
+            result = await self.executor.run(
+                self.predictFn, [pending.payload for pending in batch]
+            )
+            for pending, value in zip(batch, result):
+                if not pending.future.done():
+                    pending.future.set_result(value)
+
+        except Exception as e:
+            if len(batch) == 1 or isinstance(e, ExecutorBusyError):
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                return
+
+            # Score records one by one, so that one bad record only fails its own caller
+            servingLogger.info(
+                "Batch of %d failed, scoring records individually: %s", len(batch), e)
+            for pending in batch:
+                await self._score_batch([pending])
+
+    def _record_batch(self, batch: List[_PendingPrediction], flushedAt: float) -> None:
+        self._batchCount += 1
+        self._requestCount += len(batch)
+        self._maxBatchSize = max(self._maxBatchSize, len(batch))
+        self._batchSizes.append(len(batch))
+        queueWaits = [flushedAt - pending.enqueuedAt for pending in batch]
+        self._queueWaits.extend(queueWaits)
+        if self.stageObserver is not None:
+            for queueWait in queueWaits:
+                self.stageObserver("queue_wait", queueWait)
+
+    def get_stats(self) -> dict:
+        batchSizes = np.array(self._batchSizes, dtype=float)
+        queueWaitsMs = np.array(self._queueWaits, dtype=float) * 1000
+
+        def percentile(values: np.ndarray, q: float) -> float:
+            return float(np.percentile(values, q)) if len(values) else 0.0
+
+        return {
+            "running": self.is_running,
+            "maxBatchSize": self.maxBatchSize,
+            "maxWaitMs": self.maxWait * 1000,
+            "queueDepth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self._batchCount,
+            "requests": self._requestCount,
+            "batchSize": {
+                "mean": self._requestCount / self._batchCount if self._batchCount else 0.0,
+                "p50": percentile(batchSizes, 50),
+                "p99": percentile(batchSizes, 99),
+                "max": self._maxBatchSize,
+            },
+            "queueWaitMs": {
+                "mean": float(queueWaitsMs.mean()) if len(queueWaitsMs) else 0.0,
+                "p50": percentile(queueWaitsMs, 50),
+                "p99": percentile(queueWaitsMs, 99),
+                "max": float(queueWaitsMs.max()) if len(queueWaitsMs) else 0.0,
+            },
+        }
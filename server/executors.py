@@ -0,0 +1,96 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from us_visa.constants import (INFERENCE_MAX_QUEUED,
+                               INFERENCE_MAX_WORKERS,
+                               TRAINING_MAX_WORKERS,
+                               UPLOAD_MAX_WORKERS,
+                               )
+
+
+class ExecutorBusyError(Exception):
+    """
+    Raised when a bounded executor has no free worker and its queue is full
+    """
+
+
+class ExecutorSlot:
+    """
+    One slot of a BoundedExecutor held across several calls, for work that
+    must not fail halfway once started, such as a streamed response
+    """
+
+    def __init__(self, executor: "BoundedExecutor"):
+        self.executor = executor
+        self.released = False
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        if self.released:
+            raise RuntimeError(f"{self.executor.name} executor slot already released")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor._executor, functools.partial(fn, *args, **kwargs)
+        )
+
+    def release(self) -> None:
+        # Safe to call more than once
+        if not self.released:
+            self.released = True
+            self.executor._pending -= 1
+
+
+class BoundedExecutor:
+    """
+    Runs blocking work on a dedicated thread pool so that the event loop keeps
+    serving requests, and caps how many jobs may be running or waiting at once
+    """
+
+    def __init__(self, name: str, maxWorkers: int, maxQueued: int = 0):
+        self.name = name
+        self.maxWorkers = maxWorkers
+        self.maxQueued = maxQueued
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix=name)
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def is_busy(self) -> bool:
+        return self._pending >= self.maxWorkers + self.maxQueued
+
+    def acquire(self) -> ExecutorSlot:
+        """
+        Take a slot until its release, raises ExecutorBusyError when there is none
+        """
+        if self.is_busy:
+            raise ExecutorBusyError(
+                f"{self.name} executor is busy: {self._pending} jobs pending")
+
+        # Only touched from the event loop thread, no lock required
+        self._pending += 1
+        return ExecutorSlot(self)
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        slot = self.acquire()
+        try:
+            return await slot.run(fn, *args, **kwargs)
+        finally:
+            slot.release()
+
+
+inferenceExecutor: BoundedExecutor = BoundedExecutor(
+    name="inference", maxWorkers=INFERENCE_MAX_WORKERS, maxQueued=INFERENCE_MAX_QUEUED,
+)
+
+trainingExecutor: BoundedExecutor = BoundedExecutor(
+    name="training", maxWorkers=TRAINING_MAX_WORKERS,
+)
+
+uploadExecutor: BoundedExecutor = BoundedExecutor(
+    name="upload", maxWorkers=UPLOAD_MAX_WORKERS,
+)
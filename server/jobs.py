@@ -0,0 +1,178 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from server.executors import BoundedExecutor
+from us_visa.entity.config_entity import TrainingPipelineConfig
+from us_visa.logger import logging
+from us_visa.pipline.training_pipeline import TRAINING_STAGES, TrainPipeline
+
+
+class TrainingCancelledError(Exception):
+    """
+    Raised inside the training thread at the next stage boundary once a
+    job has been cancelled
+    """
+
+
+@dataclass
+class TrainingJob:
+    jobId: str
+    status: str = "queued"
+    stage: Optional[str] = None
+    stages: Dict[str, str] = field(
+        default_factory=lambda: {stage: "pending" for stage in TRAINING_STAGES})
+    createdAt: float = field(default_factory=time.time)
+    startedAt: Optional[float] = None
+    finishedAt: Optional[float] = None
+    error: Optional[str] = None
+    cancelRequested: bool = False
+    # Workspace of the pipeline run, named after the job
+    artifactDir: Optional[str] = None
+
+    @property
+    def is_active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class TrainingJobManager:
+    """
+    Runs training pipelines as background jobs, one at a time. Triggering
+    training while a job is queued or running returns that job instead of
+    starting a duplicate run. A job triggered while a cancelled one is still
+    winding down waits for it to release its executor slot.
+
+    Training can be disabled for the whole process, e.g. in prefork workers
+    where every worker would hold its own jobs.
+    """
+
+    def __init__(self,
+                 executor: BoundedExecutor,
+                 onSuccess: Optional[Callable[[], None]] = None,
+                 maxHistory: int = 100,
+                 ):
+        self.executor = executor
+        self.onSuccess = onSuccess
+        self.maxHistory = maxHistory
+        self._jobs: "OrderedDict[str, TrainingJob]" = OrderedDict()
+        self._activeJob: Optional[TrainingJob] = None
+        # jobId -> task running the job, until it has released its executor slot
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Set once training is disabled, explains why to the callers
+        self.disabledReason: Optional[str] = None
+
+    def disable(self, reason: str) -> None:
+        self.disabledReason = reason
+        logging.info(f"Training jobs disabled: {reason}")
+
+    def submit(self) -> Tuple[TrainingJob, bool]:
+        """
+        Enqueue a training job, returns the job and whether it was merged
+        into the run already in progress
+        """
+        previousJob = self._activeJob
+        if previousJob is not None and previousJob.is_active and not previousJob.cancelRequested:
+            logging.info(
+                f"Training job {previousJob.jobId} already in progress, merging trigger")
+            return previousJob, True
+
+        previousTasks = set(self._tasks.values())
+        job = TrainingJob(jobId=uuid.uuid4().hex)
+        self._jobs[job.jobId] = job
+        self._activeJob = job
+        self._prune_history()
+
+        task = asyncio.create_task(self._run(job, previousTasks))
+        self._tasks[job.jobId] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.jobId, None))
+
+        logging.info(f"Training job {job.jobId} queued")
+        return job, False
+
+    def get(self, jobId: str) -> Optional[TrainingJob]:
+        return self._jobs.get(jobId)
+
+    def cancel(self, jobId: str) -> Optional[TrainingJob]:
+        """
+        Cancel a job, a running job stops at the next stage boundary and a
+        queued one gives up its executor slot right away
+        """
+        job = self._jobs.get(jobId)
+        if job is not None and job.is_active:
+            logging.info(f"Cancelling training job {jobId}")
+            job.cancelRequested = True
+            if job.status == "queued":
+                task = self._tasks.get(jobId)
+                if task is not None:
+                    task.cancel()
+                self._finish(job, status="cancelled")
+
+        return job
+
+    async def _run(self, job: TrainingJob, previousTasks: Set[asyncio.Task]) -> None:
+        try:
+            if previousTasks:
+                # A cancelled job keeps its executor slot until its current stage ends
+                await asyncio.wait(previousTasks)
+            await self.executor.run(self._train, job)
+            self._finish(job, status="succeeded")
+
+        except asyncio.CancelledError:
+            self._finish(job, status="cancelled")
+
+        except Exception as e:
+            if job.cancelRequested:
+                self._finish(job, status="cancelled")
+            else:
+                logging.error(f"Training job {job.jobId} failed: {e}")
+                self._finish(job, status="failed", error=str(e))
+
+    def _train(self, job: TrainingJob) -> None:
+        # Runs on the training thread
+        if job.cancelRequested:
+            raise TrainingCancelledError(f"Training job {job.jobId} cancelled")
+
+        if job.status == "queued":
+            job.status = "running"
+        job.startedAt = time.time()
+
+        def stageCallback(stage: str, status: str) -> None:
+            if status == "running" and job.cancelRequested:
+                raise TrainingCancelledError(
+                    f"Training job {job.jobId} cancelled before {stage}")
+            job.stage = stage
+            job.stages[stage] = status
+
+        pipeline = TrainPipeline(
+            stageCallback=stageCallback,
+            trainingPipelineConfig=TrainingPipelineConfig(runId=job.jobId),
+        )
+        job.artifactDir = pipeline.trainingPipelineConfig.artifactDir
+        pipeline.run_pipeline()
+
+        if self.onSuccess is not None:
+            self.onSuccess()
+
+    def _finish(self, job: TrainingJob, status: str, error: Optional[str] = None) -> None:
+        if not job.is_active:
+            return
+        # Independent stages run at the same time, close all those still running
+        for stage, stageStatus in job.stages.items():
+            if stageStatus == "running":
+                job.stages[stage] = status
+        job.status = status
+        job.error = error
+        job.finishedAt = time.time()
+        logging.info(f"Training job {job.jobId} {status}")
+
+    def _prune_history(self) -> None:
+        finishedJobIds: List[str] = [
+            jobId for jobId, job in self._jobs.items() if not job.is_active]
+        for jobId in finishedJobIds[:max(0, len(self._jobs) - self.maxHistory)]:
+            del self._jobs[jobId]
@@ -1,13 +1,43 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from uvicorn import run as app_run
 
+from server.metrics import MetricsMiddleware, metricsRegistry
 from server.router import routerTrain, routerPred
+from server.services import predictionScheduler
 from us_visa.constants import APP_HOST, APP_PORT
+from us_visa.logger import logging
+from us_visa.pipline.prediction_pipeline import usVisaModelHolder
+
+
+def _warm_up_model() -> None:
+    # Workers forked by server.prefork inherit the model loaded by the master
+    if usVisaModelHolder.is_ready:
+        return
+    try:
+        usVisaModelHolder.load_model()
+    except Exception as e:
+        # Keep serving health checks, readiness stays false until a load succeeds
+        logging.error(f"Error warming up prediction model : {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the model off the event loop, so that the server accepts
+    # health checks while the model is being downloaded
+    loop = asyncio.get_running_loop()
+    app.state.modelWarmUp = loop.run_in_executor(None, _warm_up_model)
+    predictionScheduler.start()
+    yield
+    await predictionScheduler.stop()
 
 
 # Initialize fastapi client
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # declare default middlewares
 origins = ["*"]
@@ -19,6 +49,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 @app.get("/")
@@ -29,6 +60,24 @@ async def health_check():
     except Exception as e:
         raise Exception(f"Error starting http server : {e}")
 
+
+@app.get("/ready")
+async def readiness_check():
+    if usVisaModelHolder.is_ready:
+        return {"Ready": True, "Model_Version": usVisaModelHolder.version}
+
+    return JSONResponse(
+        content={"Ready": False, "Model_Version": None},
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+@app.get("/metrics")
+async def metrics():
+    return Response(
+        content=metricsRegistry.render(),
+        media_type=metricsRegistry.contentType,
+    )
+
 # routers
 app.include_router(routerTrain)
 app.include_router(routerPred)
@@ -0,0 +1,301 @@
+import bisect
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+BATCH_SIZE_BUCKETS: Tuple[float, ...] = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384)
+
+
+def _format_labels(labelNames: Sequence[str], labelValues: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(labelNames, labelValues)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    metricType: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelNames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelNames = tuple(labelNames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelNames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metricType}",
+            *self._samples(),
+        ]
+
+
+class _ValueMetric(_Metric):
+    """
+    Single value per label set, either updated by the application or computed
+    at scrape time when a collect callable returning {label values: value} is given
+    """
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelNames: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple, float]]] = None,
+                 ):
+        super().__init__(name, documentation, labelNames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._collect = collect
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        if self._collect is not None:
+            values = self._collect()
+        else:
+            with self._lock:
+                values = dict(self._values)
+        return [f"{self.name}{_format_labels(self.labelNames, key)} {_format_value(value)}"
+                for key, value in values.items()]
+
+
+class Counter(_ValueMetric):
+    metricType = "counter"
+
+
+class Gauge(_ValueMetric):
+    metricType = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    metricType = "histogram"
+
+    def __init__(self,
+                 name: str,
+                 documentation: str,
+                 labelNames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS,
+                 ):
+        super().__init__(name, documentation, labelNames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> (per bucket counts, sum, count)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value, count + 1)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = {key: (list(counts), total, count)
+                      for key, (counts, total, count) in self._values.items()}
+
+        samples = []
+        for key, (counts, total, count) in values.items():
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                labels = _format_labels(self.labelNames, key, f'le="{_format_value(bound)}"')
+                samples.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelNames, key)
+            samples.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            samples.append(f"{self.name}_count{labels} {count}")
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Minimal registry rendering metrics in the Prometheus text exposition format
+    """
+    contentType: str = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+# Master pid of a prefork server, set before forking so that every worker
+# reports the memory of the whole process group, whichever one is scraped
+_processGroupLeader: Optional[int] = None
+
+
+def track_process_group(leaderPid: int) -> None:
+    global _processGroupLeader
+    _processGroupLeader = leaderPid
+
+
+def _process_group_pids() -> List[int]:
+    if _processGroupLeader is None:
+        return [os.getpid()]
+
+    pids = [_processGroupLeader]
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as stat:
+                # The command name in parentheses may contain spaces, the parent pid follows its state
+                parentPid = int(stat.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parentPid == _processGroupLeader:
+            pids.append(int(entry))
+    return pids
+
+
+def _read_process_memory() -> Dict[Tuple[str, ...], float]:
+    """
+    Resident set size of the serving processes from /proc/<pid>/statm, plus
+    their proportional and private sizes from /proc/<pid>/smaps_rollup when
+    available. Under prefork these are the master and all of its workers.
+    Pages shared copy-on-write with the master count in resident but only
+    partly in proportional, and not at all in private, so the proportional
+    sizes add up to the memory of the whole group.
+    """
+    memory = {}
+    for pid in _process_group_pids():
+        try:
+            with open(f"/proc/{pid}/statm") as statm:
+                resident = int(statm.read().split()[1])
+            memory[(str(pid), "resident")] = resident * os.sysconf("SC_PAGE_SIZE")
+
+            with open(f"/proc/{pid}/smaps_rollup") as smaps:
+                fields = dict(line.split(":", 1) for line in smaps if line.endswith("kB\n"))
+            kilobytes = {name: int(value.split()[0]) for name, value in fields.items()}
+            memory[(str(pid), "proportional")] = kilobytes["Pss"] * 1024
+            memory[(str(pid), "private")] = (
+                kilobytes["Private_Clean"] + kilobytes["Private_Dirty"]) * 1024
+        except (OSError, KeyError, ValueError):
+            continue
+
+    return memory
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by route and status, tracking in-flight
+    requests and stamping the arrival time used to time request validation
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        scope.setdefault("state", {})["requestStart"] = start
+        statusCode = 500
+
+        async def send_wrapper(message):
+            nonlocal statusCode
+            if message["type"] == "http.response.start":
+                statusCode = message["status"]
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS_TOTAL.inc(method=scope["method"], path=path, status=statusCode)
+            HTTP_REQUEST_DURATION.observe(
+                time.perf_counter() - start, method=scope["method"], path=path)
+
+
+class observe_stage:
+    """
+    Context manager timing one step of the prediction path
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        PREDICT_STAGE_DURATION.observe(time.perf_counter() - self.start, stage=self.stage)
+        return False
+
+
+def observe_stage_duration(stage: str, seconds: float) -> None:
+    PREDICT_STAGE_DURATION.observe(seconds, stage=stage)
+
+
+metricsRegistry: MetricsRegistry = MetricsRegistry()
+
+HTTP_REQUESTS_TOTAL: Counter = metricsRegistry.register(Counter(
+    "usvisa_http_requests_total", "HTTP requests by route and status code",
+    labelNames=("method", "path", "status"),
+))
+HTTP_REQUESTS_IN_FLIGHT: Gauge = metricsRegistry.register(Gauge(
+    "usvisa_http_requests_in_flight", "HTTP requests currently being served",
+))
+HTTP_REQUEST_DURATION: Histogram = metricsRegistry.register(Histogram(
+    "usvisa_http_request_duration_seconds", "HTTP request latency by route",
+    labelNames=("method", "path"),
+))
+PREDICT_STAGE_DURATION: Histogram = metricsRegistry.register(Histogram(
+    "usvisa_predict_stage_duration_seconds",
+    "Latency of each step of the prediction path: validation, cache_lookup, queue_wait, "
+    "frame_build, transform, model_predict and serialization",
+    labelNames=("stage",),
+))
+PREDICT_BATCH_SIZE: Histogram = metricsRegistry.register(Histogram(
+    "usvisa_predict_batch_size", "Number of records scored per model call",
+    buckets=BATCH_SIZE_BUCKETS,
+))
+PROCESS_MEMORY: Gauge = metricsRegistry.register(Gauge(
+    "usvisa_process_memory_bytes",
+    "Resident, proportional and private memory of the serving processes by pid",
+    labelNames=("pid", "kind"),
+    collect=_read_process_memory,
+))
@@ -1,7 +1,9 @@
-from typing import Literal, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
+from us_visa.constants import PREDICT_BATCH_MAX_RECORDS
+
 
 class PredictDataRequestForm(BaseModel):
     continent: Optional[Literal["Asia", "Africa", "North America",
@@ -25,3 +27,14 @@ class PredictDataRequestForm(BaseModel):
 class PredictDataResponseForm(BaseModel):
     message: str = "Success"
     visaStatus: str = None
+
+
+class PredictBatchDataRequestForm(BaseModel):
+    records: List[PredictDataRequestForm] = Field(
+        ..., min_items=1, max_items=PREDICT_BATCH_MAX_RECORDS,
+        description="Applications to be scored in a single call")
+
+
+class PredictBatchDataResponseForm(BaseModel):
+    message: str = "Success"
+    visaStatus: List[str] = []
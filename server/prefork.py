@@ -0,0 +1,150 @@
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Set
+
+import uvicorn
+
+from server.main import app
+from server.metrics import track_process_group
+from server.services import trainingJobManager
+from us_visa.constants import APP_HOST, APP_PORT, SERVING_WORKERS
+from us_visa.logger import logging
+from us_visa.pipline.prediction_pipeline import usVisaModelHolder
+
+
+class PreforkServer:
+    """
+    Multi-process serving mode. The master process loads the model once, then
+    forks the workers, so that every worker shares the model pages with the
+    master copy-on-write instead of holding its own copy. All workers accept
+    connections on the same listening socket.
+
+    Training is disabled in the workers, since each one would run and track
+    its own jobs. Train out of process, then send SIGHUP to the master: it
+    loads the new model and replaces the workers with ones forked from it,
+    so that all of them serve the new model and still share its pages.
+    """
+
+    def __init__(self, host: str = APP_HOST, port: int = APP_PORT, workers: int = SERVING_WORKERS):
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self._children: Dict[int, int] = {}
+        # Workers replaced on reload, not restarted when they exit
+        self._retiring: Set[int] = set()
+        self._stopping = False
+        self._reloading = False
+        self._sock = None
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _load_shared_model(self) -> None:
+        try:
+            usVisaModelHolder.load_model()
+        except Exception as e:
+            # Workers retry the download in their own warm-up
+            logging.error(f"Master could not load the model, workers will load it: {e}")
+
+        # Move everything allocated so far out of the collector's reach, so that
+        # collections in the workers do not write to, and thereby copy, shared pages
+        gc.collect()
+        gc.freeze()
+
+    def _spawn(self, sock: socket.socket, index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            config = uvicorn.Config(app=app, host=self.host, port=self.port)
+            uvicorn.Server(config).run(sockets=[sock])
+            os._exit(0)
+
+        self._children[pid] = index
+        logging.info(f"Forked serving worker {index} with pid {pid}")
+
+    def _reload(self, signum, frame) -> None:
+        if self._reloading or self._stopping:
+            return
+        logging.info("Reloading the model and replacing the serving workers")
+        self._reloading = True
+        try:
+            usVisaModelHolder.load_model()
+        except Exception as e:
+            logging.error(f"Master could not reload the model, keeping the current workers: {e}")
+            return
+        finally:
+            self._reloading = False
+
+        gc.collect()
+        gc.freeze()
+
+        # Fork the replacements first, so that the socket is never left without workers
+        for pid, index in list(self._children.items()):
+            self._spawn(self._sock, index)
+            self._retiring.add(pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, signum, frame) -> None:
+        self._stopping = True
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        trainingJobManager.disable(
+            "each prefork worker would run its own jobs, train out of process "
+            "and send SIGHUP to the master to serve the new model")
+        track_process_group(os.getpid())
+        self._load_shared_model()
+        sock = self._sock = self._bind()
+        logging.info(
+            f"Prefork master {os.getpid()} serving {self.host}:{self.port} with {self.workers} workers")
+
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+
+        for index in range(self.workers):
+            self._spawn(sock, index)
+
+        while self._children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+
+            index = self._children.pop(pid, None)
+            if pid in self._retiring:
+                self._retiring.discard(pid)
+                continue
+            if index is None or self._stopping:
+                continue
+
+            logging.error(f"Serving worker {index} ({pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            self._spawn(sock, index)
+
+        sock.close()
+        logging.info("Prefork master stopped")
+
+
+if __name__ == "__main__":
+    PreforkServer(workers=int(sys.argv[1]) if len(sys.argv) > 1 else SERVING_WORKERS).run()
@@ -1,6 +1,8 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
-from server.services import train, predict
+from server.services import (train, train_status, cancel_train,
+                             predict, predict_batch, predict_upload, predict_stats)
 
 routerTrain = APIRouter(prefix="/v1", tags=["Training Pipeline"])
 routerPred = APIRouter(prefix="/v1", tags=["Prediction Pipeline"])
@@ -8,10 +10,35 @@ routerPred = APIRouter(prefix="/v1", tags=["Prediction Pipeline"])
 routerTrain.add_api_route(
     path="/train",
     endpoint=train,
+    methods=["POST"],
+    status_code=202,
+    responses={
+        202: {"description": "Training job queued or merged into the run in progress"},
+        500: {"description": "Server error while queueing training"},
+        503: {"description": "Training disabled on this server"},
+    },
+)
+
+routerTrain.add_api_route(
+    path="/train/{jobId}",
+    endpoint=train_status,
     methods=["GET"],
     responses={
-        200: {"description": "Training process completed"},
-        500: {"description": "Server error while training"},
+        200: {"description": "Training job status and stage progress"},
+        404: {"description": "Training job not found"},
+        503: {"description": "Training disabled on this server"},
+    },
+)
+
+routerTrain.add_api_route(
+    path="/train/{jobId}/cancel",
+    endpoint=cancel_train,
+    methods=["POST"],
+    status_code=202,
+    responses={
+        202: {"description": "Training job cancellation requested"},
+        404: {"description": "Training job not found"},
+        503: {"description": "Training disabled on this server"},
     },
 )
 
@@ -21,6 +48,41 @@ routerPred.add_api_route(
     methods=["POST"],
     responses={
         200: {"description": "Prediction process completed"},
+        503: {"description": "Server is busy, retry later"},
         500: {"description": "Server error while making prediction"},
     },
 )
+
+routerPred.add_api_route(
+    path="/predict/batch",
+    endpoint=predict_batch,
+    methods=["POST"],
+    responses={
+        200: {"description": "Batch prediction process completed"},
+        503: {"description": "Server is busy, retry later"},
+        500: {"description": "Server error while making batch prediction"},
+    },
+)
+
+routerPred.add_api_route(
+    path="/predict/upload",
+    endpoint=predict_upload,
+    methods=["POST"],
+    response_class=StreamingResponse,
+    responses={
+        200: {"description": "Predictions streamed back as CSV or NDJSON, in the upload format"},
+        400: {"description": "Unreadable file or missing input columns"},
+        415: {"description": "File is neither CSV nor NDJSON"},
+        500: {"description": "Server error while scoring the file"},
+        503: {"description": "Server is busy, retry later"},
+    },
+)
+
+routerPred.add_api_route(
+    path="/predict/stats",
+    endpoint=predict_stats,
+    methods=["GET"],
+    responses={
+        200: {"description": "Micro-batching statistics of the prediction scheduler"},
+    },
+)
@@ -1,54 +1,341 @@
-from fastapi import Request, status, HTTPException
-from fastapi.responses import JSONResponse
+import time
+import weakref
+from typing import AsyncIterator, List
 
-from server.models import PredictDataRequestForm, PredictDataResponseForm
-from us_visa.entity.config_entity import PredictConfig
-from us_visa.pipline.prediction_pipeline import USVisaClassifier
-from us_visa.pipline.training_pipeline import TrainPipeline
-from us_visa.utils.main_utils import result_mapping
+import numpy as np
+import pandas as pd
+from fastapi import Request, UploadFile, status, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from server.batcher import MicroBatchScheduler
+from server.executors import (ExecutorBusyError,
+                              ExecutorSlot,
+                              inferenceExecutor,
+                              trainingExecutor,
+                              uploadExecutor,
+                              )
+from server.jobs import TrainingJobManager
+from server.metrics import (PREDICT_BATCH_SIZE,
+                            Counter,
+                            Gauge,
+                            metricsRegistry,
+                            observe_stage,
+                            observe_stage_duration,
+                            )
+from server.models import (PredictBatchDataRequestForm,
+                           PredictBatchDataResponseForm,
+                           PredictDataRequestForm,
+                           PredictDataResponseForm,
+                           )
+from server.upload import UPLOAD_FORMATS, UploadChunkScorer, UploadFormatError, detect_upload_format
+from us_visa.constants import (PREDICT_MICRO_BATCH_MAX_SIZE,
+                               PREDICT_MICRO_BATCH_MAX_WAIT_MS,
+                               PREDICT_MICRO_BATCHING,
+                               PREDICT_UPLOAD_CHUNK_ROWS,
+                               PREDICTION_CACHE_SIZE,
+                               PREDICTION_CACHE_TTL_SECONDS,
+                               )
+from us_visa.entity.prediction_cache import PredictionCache
+from us_visa.logger import logging
+from us_visa.pipline.prediction_pipeline import USVisaClassifier, usVisaModelHolder
+from us_visa.utils.main_utils import batch_result_mapping, result_mapping
+
+
+predictionCache = PredictionCache(
+    maxSize=PREDICTION_CACHE_SIZE,
+    ttlSeconds=PREDICTION_CACHE_TTL_SECONDS,
+) if PREDICTION_CACHE_SIZE > 0 else None
+
+classifier = USVisaClassifier(
+    predictionCache=predictionCache,
+    stageObserver=observe_stage_duration,
+)
+
+
+def _predict_records(records: List[PredictDataRequestForm], lookupCache: bool = True) -> np.ndarray:
+    PREDICT_BATCH_SIZE.observe(len(records))
+    return classifier.predict_records(records=records, lookupCache=lookupCache).astype(int)
+
+
+def _predict_frame(dataFrame: pd.DataFrame) -> np.ndarray:
+    PREDICT_BATCH_SIZE.observe(len(dataFrame))
+    return classifier.predict_frame(dataFrame=dataFrame).astype(int)
+
+
+def _predict_uncached_records(records: List[PredictDataRequestForm]) -> np.ndarray:
+    # Single-record route, the cache was already looked up before queueing
+    return _predict_records(records=records, lookupCache=False)
+
+
+predictionScheduler = MicroBatchScheduler(
+    predictFn=_predict_uncached_records,
+    executor=inferenceExecutor,
+    maxBatchSize=PREDICT_MICRO_BATCH_MAX_SIZE,
+    maxWaitMs=PREDICT_MICRO_BATCH_MAX_WAIT_MS,
+    stageObserver=observe_stage_duration,
+)
+
+# Serve the newly pushed model from memory once a training job succeeds
+trainingJobManager = TrainingJobManager(
+    executor=trainingExecutor,
+    onSuccess=usVisaModelHolder.load_model,
+)
+
+# Metrics read from the serving components when /metrics is scraped
+metricsRegistry.register(Gauge(
+    "usvisa_model_ready", "1 once a model is loaded and serving",
+    collect=lambda: {(): float(usVisaModelHolder.is_ready)},
+))
+metricsRegistry.register(Gauge(
+    "usvisa_model_version", "In-memory version of the model being served",
+    collect=lambda: {(): usVisaModelHolder.version},
+))
+metricsRegistry.register(Counter(
+    "usvisa_model_loads_total", "Model loads from s3 by result",
+    labelNames=("result",),
+    collect=lambda: {
+        ("success",): usVisaModelHolder.loadCount,
+        ("failure",): usVisaModelHolder.loadFailures,
+    },
+))
+metricsRegistry.register(Counter(
+    "usvisa_model_load_seconds_total", "Time spent loading models from s3",
+    collect=lambda: {(): usVisaModelHolder.loadSecondsTotal},
+))
+metricsRegistry.register(Gauge(
+    "usvisa_model_last_load_seconds", "Duration of each step of the last model load",
+    labelNames=("step",),
+    collect=lambda: {
+        (step,): seconds for step, seconds in usVisaModelHolder.lastLoadSeconds.items()
+    },
+))
+metricsRegistry.register(Gauge(
+    "usvisa_executor_pending_jobs", "Jobs running or queued on each executor",
+    labelNames=("executor",),
+    collect=lambda: {
+        (executor.name,): executor.pending
+        for executor in (inferenceExecutor, uploadExecutor, trainingExecutor)
+    },
+))
+metricsRegistry.register(Gauge(
+    "usvisa_predict_queue_depth", "Records waiting for the next micro-batch",
+    collect=lambda: {(): predictionScheduler.get_stats()["queueDepth"]},
+))
+if predictionCache is not None:
+    metricsRegistry.register(Counter(
+        "usvisa_prediction_cache_events_total", "Prediction cache lookups and removals by event",
+        labelNames=("event",),
+        collect=lambda: {
+            (event,): predictionCache.get_stats()[event]
+            for event in ("hits", "misses", "evictions", "expirations", "invalidations")
+        },
+    ))
+    metricsRegistry.register(Gauge(
+        "usvisa_prediction_cache_size", "Predictions held in the cache",
+        collect=lambda: {(): predictionCache.get_stats()["size"]},
+    ))
+
+
+def _observe_validation(request: Request) -> None:
+    # Time from arrival until the endpoint runs: body read, routing and form validation
+    requestStart = getattr(request.state, "requestStart", None)
+    if requestStart is not None:
+        observe_stage_duration("validation", time.perf_counter() - requestStart)
+
+
+def _serialize(response) -> JSONResponse:
+    with observe_stage("serialization"):
+        return JSONResponse(content=response.dict(), status_code=status.HTTP_200_OK)
+
+
+def _ensure_training_enabled() -> None:
+    if trainingJobManager.disabledReason is not None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Training is disabled: {trainingJobManager.disabledReason}",
+        )
 
 
 async def train() -> JSONResponse:
+    _ensure_training_enabled()
     try:
-        pipeline = TrainPipeline()
-        pipeline.run_pipeline()
+        job, merged = trainingJobManager.submit()
 
         return JSONResponse(
-            content={"message": "Training process completed"},
-            status_code=status.HTTP_200_OK,
+            content={
+                "message": "Training already in progress" if merged else "Training job queued",
+                "jobId": job.jobId,
+                "status": job.status,
+                "merged": merged,
+            },
+            status_code=status.HTTP_202_ACCEPTED,
         )
 
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error occurred while training: {str(e)}",
+            detail=f"Error occurred while queueing training: {str(e)}",
         )
 
 
-async def predict(form: PredictDataRequestForm, request: Request) -> JSONResponse:
-    try:
-        payload = form.dict()
+async def train_status(jobId: str) -> JSONResponse:
+    _ensure_training_enabled()
+    job = trainingJobManager.get(jobId)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Training job not found: {jobId}",
+        )
 
-        # Convert dictionary to PredictConfig object
-        payload = PredictConfig(**payload)
+    return JSONResponse(
+        content=job.to_dict(),
+        status_code=status.HTTP_200_OK,
+    )
 
-        pipeline = USVisaClassifier()
-        df = pipeline.get_payload_data_as_df(payload=payload)
 
-        result = pipeline.predict(dataFrame=df)[0].astype(int)
+async def cancel_train(jobId: str) -> JSONResponse:
+    _ensure_training_enabled()
+    job = trainingJobManager.cancel(jobId)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Training job not found: {jobId}",
+        )
+
+    return JSONResponse(
+        content=job.to_dict(),
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+async def predict(form: PredictDataRequestForm, request: Request) -> JSONResponse:
+    _observe_validation(request)
+    try:
+        with observe_stage("cache_lookup"):
+            result = classifier.get_cached_prediction(form)
+        if result is not None:
+            result = int(result)
+        elif PREDICT_MICRO_BATCHING:
+            result = await predictionScheduler.submit(form)
+        else:
+            result = (await inferenceExecutor.run(_predict_uncached_records, [form]))[0]
         visaStatus = result_mapping(value=result)
 
         response = PredictDataResponseForm(
             visaStatus=visaStatus,
         )
 
-        return response
+        return _serialize(response)
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server is busy, retry later: {str(e)}",
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error occurred while making prediction: {str(e)}",
         )
 
+
+async def predict_batch(form: PredictBatchDataRequestForm, request: Request) -> JSONResponse:
+    _observe_validation(request)
+    try:
+        result = await inferenceExecutor.run(_predict_records, form.records)
+        visaStatus = batch_result_mapping(values=result)
+
+        response = PredictBatchDataResponseForm(
+            visaStatus=visaStatus,
+        )
+
+        return _serialize(response)
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server is busy, retry later: {str(e)}",
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error occurred while making batch prediction: {str(e)}",
+        )
+
+
+async def _stream_upload(scorer: UploadChunkScorer,
+                         slot: ExecutorSlot,
+                         firstChunk: bytes,
+                         ) -> AsyncIterator[bytes]:
+    # The stream scores its chunks in the upload slot taken for the first
+    # one, so that a busy executor never fails it halfway
+    chunk = firstChunk
+    try:
+        while chunk is not None:
+            yield chunk
+            chunk = await slot.run(scorer.next_chunk)
+        logging.info(f"Scored {scorer.rowCount} uploaded rows")
+    except Exception as e:
+        # Headers are already sent, aborting leaves the client with a truncated body
+        logging.error(f"Upload scoring failed after {scorer.rowCount} rows: {e}")
+        raise
+    finally:
+        slot.release()
+
+
+async def predict_upload(file: UploadFile) -> StreamingResponse:
+    fileFormat = detect_upload_format(file.filename, file.content_type)
+    if fileFormat is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Upload a CSV or NDJSON file, one of: {', '.join(UPLOAD_FORMATS)}",
+        )
+
+    scorer = UploadChunkScorer(
+        file=file.file,
+        fileFormat=fileFormat,
+        predictFn=_predict_frame,
+        chunkRows=PREDICT_UPLOAD_CHUNK_ROWS,
+        requiredColumns=classifier.requestBuilder.columns,
+    )
+    try:
+        # Held until the client has read the whole response, hence not an inference slot
+        slot = uploadExecutor.acquire()
+    except ExecutorBusyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Server is busy, retry later: {str(e)}",
+        )
+    try:
+        # Score the first chunk before answering, so that unreadable files and
+        # missing columns are reported with a proper status code
+        firstChunk = await slot.run(scorer.next_chunk)
+    except UploadFormatError as e:
+        slot.release()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Error occurred while reading uploaded file: {str(e)}",
+        )
+    except Exception as e:
+        slot.release()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error occurred while scoring uploaded file: {str(e)}",
+        )
+
+    stream = _stream_upload(scorer, slot, firstChunk or b"")
+    # A stream dropped before its first chunk was sent never runs its finally
+    weakref.finalize(stream, slot.release)
+    return StreamingResponse(stream, media_type=scorer.mediaType)
+
+
+async def predict_stats() -> JSONResponse:
+    return JSONResponse(
+        content={
+            **predictionScheduler.get_stats(),
+            "cache": predictionCache.get_stats() if predictionCache is not None else None,
+        },
+        status_code=status.HTTP_200_OK,
+    )
+
 # {
 #     "continent": "Asia",
 #     "education_of_employee": "Bachelor's",
@@ -0,0 +1,139 @@
+import csv
+import io
+import json
+import sys
+from typing import BinaryIO, Callable, Iterator, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from us_visa.exception import USvisaException
+from us_visa.utils.main_utils import batch_result_mapping
+
+UPLOAD_FORMATS = {
+    "csv": ("text/csv", (".csv",), ("text/csv", "application/csv")),
+    "ndjson": ("application/x-ndjson", (".ndjson", ".jsonl"),
+               ("application/x-ndjson", "application/jsonl", "application/json-lines")),
+}
+
+# Echoed back next to each prediction when the uploaded rows carry it
+ID_COLUMN: str = "case_id"
+
+
+class UploadFormatError(Exception):
+    """
+    Raised when the uploaded file cannot be parsed or lacks input columns
+    """
+
+
+def detect_upload_format(filename: Optional[str], contentType: Optional[str]) -> Optional[str]:
+    """
+    Guess the upload format from the file extension, then from the content type
+    """
+    filename = (filename or "").lower()
+    contentType = (contentType or "").split(";")[0].strip().lower()
+
+    for fileFormat, (_, extensions, _) in UPLOAD_FORMATS.items():
+        if filename.endswith(extensions):
+            return fileFormat
+    for fileFormat, (_, _, contentTypes) in UPLOAD_FORMATS.items():
+        if contentType in contentTypes:
+            return fileFormat
+    return None
+
+
+class UploadChunkScorer:
+    """
+    Parses an uploaded CSV or NDJSON file a fixed number of rows at a time and
+    scores each chunk, so that neither the file nor the predictions are ever
+    held in memory as a whole. Every call of next_chunk is blocking and meant to
+    run on an executor, one call at a time.
+    """
+
+    def __init__(self,
+                 file: BinaryIO,
+                 fileFormat: str,
+                 predictFn: Callable[[pd.DataFrame], np.ndarray],
+                 chunkRows: int,
+                 requiredColumns: Sequence[str] = (),
+                 ):
+        """
+        :param file: Uploaded file, read sequentially
+        :param fileFormat: "csv" or "ndjson"
+        :param predictFn: Scores a chunk of rows, returning the encoded predictions
+        :param chunkRows: Rows parsed and scored at a time
+        :param requiredColumns: Input columns every chunk must hold
+        """
+        self.fileFormat = fileFormat
+        self.mediaType = UPLOAD_FORMATS[fileFormat][0]
+        self.predictFn = predictFn
+        self._file = file
+        self._chunkRows = chunkRows
+        self._requiredColumns = list(requiredColumns)
+        self._reader: Optional[Iterator[pd.DataFrame]] = None
+        self.rowCount = 0
+
+    def _open_reader(self) -> Iterator[pd.DataFrame]:
+        if self.fileFormat == "csv":
+            return iter(pd.read_csv(self._file, chunksize=self._chunkRows))
+
+        # Keep values as sent, numbers are converted by the request builder
+        return iter(pd.read_json(self._file, lines=True, chunksize=self._chunkRows,
+                                 dtype=False, convert_dates=False))
+
+    def next_chunk(self) -> Optional[bytes]:
+        """
+        Score the next chunk of rows, returns the encoded results or None once
+        the whole file has been scored. Raises UploadFormatError when the file
+        cannot be parsed or lacks input columns.
+        """
+        try:
+            chunk = self._read_chunk()
+            if chunk is None:
+                return None
+
+            visaStatus = batch_result_mapping(values=self.predictFn(chunk))
+            rows = range(self.rowCount, self.rowCount + len(chunk))
+            ids = chunk[ID_COLUMN].tolist() if ID_COLUMN in chunk else None
+
+            encoded = self._encode(rows, ids, visaStatus, withHeader=self.rowCount == 0)
+            self.rowCount += len(chunk)
+            return encoded
+        except UploadFormatError:
+            raise
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def _read_chunk(self) -> Optional[pd.DataFrame]:
+        try:
+            if self._reader is None:
+                self._reader = self._open_reader()
+            chunk = next(self._reader, None)
+        except Exception as e:
+            raise UploadFormatError(f"Unreadable {self.fileFormat} file: {e}") from e
+
+        if chunk is not None:
+            missingColumns = [column for column in self._requiredColumns if column not in chunk]
+            if missingColumns:
+                raise UploadFormatError(f"Missing input columns: {missingColumns}")
+        return chunk
+
+    def _encode(self, rows: range, ids: Optional[list], visaStatus: list, withHeader: bool) -> bytes:
+        if self.fileFormat == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            if withHeader:
+                writer.writerow(["row"] + ([ID_COLUMN] if ids is not None else []) + ["visaStatus"])
+            if ids is None:
+                writer.writerows(zip(rows, visaStatus))
+            else:
+                writer.writerows(zip(rows, ids, visaStatus))
+            return buffer.getvalue().encode()
+
+        if ids is None:
+            lines = (json.dumps({"row": row, "visaStatus": value})
+                     for row, value in zip(rows, visaStatus))
+        else:
+            lines = (json.dumps({"row": row, ID_COLUMN: caseId, "visaStatus": value}, default=str)
+                     for row, caseId, value in zip(rows, ids, visaStatus))
+        return ("\n".join(lines) + "\n").encode()
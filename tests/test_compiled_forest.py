@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from us_visa.entity.compiled_forest import CompiledForest
+
+
+@pytest.fixture(scope="module")
+def forest():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 8))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] > 0).astype(int) + (X[:, 3] > 1)
+    return RandomForestClassifier(n_estimators=25, max_depth=10, random_state=0).fit(X, y)
+
+
+@pytest.fixture(scope="module")
+def compiled(forest):
+    return CompiledForest.from_forest(forest)
+
+
+def test_probabilities_are_identical(forest, compiled):
+    X = np.random.default_rng(1).normal(size=(500, 8))
+
+    np.testing.assert_array_equal(compiled.predict_proba(X), forest.predict_proba(X))
+    np.testing.assert_array_equal(compiled.predict(X), forest.predict(X))
+
+
+def test_identical_on_split_thresholds(forest, compiled):
+    X = compiled.sample_features(nRows=512)
+
+    np.testing.assert_array_equal(compiled.predict_proba(X), forest.predict_proba(X))
+    assert compiled.matches(forest, X)
+
+
+def test_single_row(forest, compiled):
+    X = np.random.default_rng(2).normal(size=(1, 8))
+
+    np.testing.assert_array_equal(compiled.predict_proba(X), forest.predict_proba(X))
+
+
+def test_wrong_feature_count_raises(compiled):
+    with pytest.raises(Exception, match="features"):
+        compiled.predict(np.zeros((3, 5)))
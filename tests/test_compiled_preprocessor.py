@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import make_applications_frame, make_fitted_preprocessor
+from us_visa.entity.compiled_preprocessor import CompiledPreprocessor
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    return make_fitted_preprocessor(nRows=2000)
+
+
+@pytest.fixture(scope="module")
+def compiled(preprocessor):
+    return CompiledPreprocessor.from_column_transformer(preprocessor)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_batch_transform_is_identical(preprocessor, compiled, seed):
+    frame = make_applications_frame(500, seed=seed)
+
+    expected = np.asarray(preprocessor.transform(frame), dtype=np.float64)
+
+    np.testing.assert_array_equal(compiled.transform(frame), expected)
+
+
+def test_row_transform_is_identical(preprocessor, compiled):
+    frame = compiled.sample_frame()
+    expected = np.asarray(preprocessor.transform(frame), dtype=np.float64)
+
+    for record, row in zip(frame.to_dict(orient="records"), expected):
+        np.testing.assert_array_equal(compiled.transform_row(record)[0], row)
+
+
+def test_sample_frame_matches(preprocessor, compiled):
+    assert compiled.matches(preprocessor, compiled.sample_frame())
+
+
+def test_unknown_category_raises(compiled):
+    record = compiled.sample_frame(nRows=2).to_dict(orient="records")[0]
+    record["continent"] = "Atlantis"
+
+    with pytest.raises(Exception, match="unknown categories"):
+        compiled.transform_row(record)
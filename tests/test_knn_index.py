@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+from sklearn.neighbors import KNeighborsClassifier
+
+from benchmarks.synthetic import make_applications_frame, make_fitted_preprocessor
+from us_visa.entity.knn_index import KNNIndex
+
+
+@pytest.fixture(scope="module")
+def features():
+    preprocessor = make_fitted_preprocessor(nRows=2000)
+    frame = make_applications_frame(8000, seed=1)
+    y = ((frame["prevailing_wage"] > frame["prevailing_wage"].median())
+         ^ (frame["has_job_experience"] == "N")).astype(int).to_numpy()
+    queries = preprocessor.transform(make_applications_frame(400, seed=2))
+    return preprocessor.transform(frame), y, queries
+
+
+@pytest.fixture(params=["uniform", "distance"])
+def classifier(request, features):
+    X, y, _ = features
+    return KNeighborsClassifier(n_neighbors=5, weights=request.param, algorithm="brute").fit(X, y)
+
+
+def test_refit_keeps_predictions_and_shares_training_matrix(features, classifier):
+    X, y, queries = features
+    expected = classifier.predict(queries)
+
+    index = KNNIndex.from_classifier(classifier)
+
+    assert np.shares_memory(index.data, classifier._fit_X)
+    assert np.mean(classifier.predict(queries) == expected) > 0.99
+
+
+def test_exact_search_matches_classifier(features, classifier):
+    _, _, queries = features
+    index = KNNIndex.from_classifier(classifier)
+
+    distance, position = index.kneighbors(queries, exact=True)
+    expectedDistance, _ = classifier.kneighbors(queries)
+
+    np.testing.assert_allclose(distance, expectedDistance, rtol=1e-9, atol=1e-9)
+    assert index.agreement(classifier, queries, exact=True) > 0.99
+
+
+def test_tuned_approximate_search_reaches_min_recall(features, classifier):
+    _, _, queries = features
+    index = KNNIndex.from_classifier(classifier, nProbe=2)
+
+    recall = index.tune_n_probe(queries, minRecall=0.95, maxProbe=index.nLists)
+
+    assert recall >= 0.95
+    assert index.nProbe < index.nLists
+    assert index.agreement(classifier, queries, exact=False) > 0.95
+
+
+@pytest.mark.parametrize("batchSize", [1, 16, 17, 64])
+def test_batch_size_does_not_change_neighbors(features, classifier, batchSize):
+    _, _, queries = features
+    index = KNNIndex.from_classifier(classifier, nProbe=4)
+    expectedDistance, expectedPosition = index.kneighbors(queries, exact=False)
+
+    for start in range(0, 64, batchSize):
+        distance, position = index.kneighbors(queries[start:start + batchSize], exact=False)
+        np.testing.assert_allclose(distance, expectedDistance[start:start + batchSize])
+        np.testing.assert_array_equal(position, expectedPosition[start:start + batchSize])
+
+
+def test_probing_every_cluster_is_exact(features, classifier):
+    _, _, queries = features
+    index = KNNIndex.from_classifier(classifier)
+    index.nProbe = index.nLists
+
+    assert index.measure_recall(queries) == 1.0
+
+
+def test_probed_clusters_smaller_than_k_pad_without_voting():
+    rng = np.random.default_rng(0)
+    X = np.concatenate([rng.normal(0, 0.01, (2, 2)),
+                        rng.normal(10, 0.01, (6, 2)),
+                        rng.normal(20, 0.01, (6, 2))])
+    y = np.array([0] * 2 + [1] * 12)
+    for weights in ("uniform", "distance"):
+        classifier = KNeighborsClassifier(n_neighbors=5, weights=weights).fit(X, y)
+        index = KNNIndex.from_classifier(classifier, nLists=3, nProbe=1)
+
+        distance, position = index.kneighbors(np.zeros((1, 2)), exact=False)
+
+        assert np.isfinite(distance[0, :2]).all() and (position[0, :2] >= 0).all()
+        assert np.isinf(distance[0, 2:]).all() and (position[0, 2:] == -1).all()
+        np.testing.assert_array_equal(index.predict_proba(np.zeros((1, 2)), exact=False), [[1.0, 0.0]])
+
+
+def test_exact_search_is_served_unless_approximate_is_opted_in(monkeypatch, features):
+    import us_visa.entity.estimator as estimator
+
+    X, y, queries = features
+    classifier = KNeighborsClassifier(n_neighbors=5).fit(X, y)
+    model = estimator.USvisaModel(preprocessing_object=None, trained_model_object=classifier)
+    model.build_knn_index(sampleFeatures=queries)
+
+    assert not model.compile_knn()
+    np.testing.assert_array_equal(model.predict_features(queries), classifier.predict(queries))
+
+    monkeypatch.setattr(estimator, "KNN_INDEX_MODE", "approximate")
+    assert model.compile_knn()
+    np.testing.assert_array_equal(model.predict_features(queries),
+                                  model.knn_index.predict(queries, exact=False))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import make_applications_frame, make_fake_model
+from us_visa.utils.main_utils import load_object, load_object_from_bytes
+from us_visa.utils.model_artifact import (is_model_artifact,
+                                          load_model_artifact,
+                                          loads_model_artifact,
+                                          save_model_artifact,
+                                          )
+
+
+@pytest.fixture(scope="module")
+def model():
+    return make_fake_model(nRows=2000, nEstimators=20)
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return make_applications_frame(300, seed=7)
+
+
+@pytest.mark.parametrize("compression", [None, "zlib", "lzma"])
+@pytest.mark.parametrize("useMmap", [True, False])
+def test_round_trip_predicts_identically(tmp_path, model, frame, compression, useMmap):
+    filePath = str(tmp_path / "model.pkl")
+    save_model_artifact(filePath, model, compression=compression)
+
+    loaded = load_model_artifact(filePath, use_mmap=useMmap)
+
+    np.testing.assert_array_equal(loaded.predict(frame), model.predict(frame))
+    forest, loadedForest = model.trained_model_object, loaded.trained_model_object
+    for tree, loadedTree in zip(forest.estimators_, loadedForest.estimators_):
+        np.testing.assert_array_equal(loadedTree.tree_.threshold, tree.tree_.threshold)
+        np.testing.assert_array_equal(loadedTree.tree_.value, tree.tree_.value)
+
+
+def test_round_trip_from_bytes(tmp_path, model, frame):
+    filePath = tmp_path / "model.pkl"
+    save_model_artifact(str(filePath), model)
+    content = filePath.read_bytes()
+
+    assert is_model_artifact(content)
+    np.testing.assert_array_equal(loads_model_artifact(content).predict(frame), model.predict(frame))
+    np.testing.assert_array_equal(load_object_from_bytes(content).predict(frame), model.predict(frame))
+
+
+def test_load_object_reads_artifacts(tmp_path, model, frame):
+    filePath = str(tmp_path / "model.pkl")
+    save_model_artifact(filePath, model)
+
+    np.testing.assert_array_equal(load_object(filePath).predict(frame), model.predict(frame))
+
+
+def test_mapped_arrays_are_copied_on_write(tmp_path):
+    filePath = str(tmp_path / "arrays.pkl")
+    save_model_artifact(filePath, {"weights": np.arange(100000, dtype=np.float64)})
+    before = (tmp_path / "arrays.pkl").read_bytes()
+
+    loaded = load_model_artifact(filePath, use_mmap=True)
+    loaded["weights"][:] = 0
+
+    assert (tmp_path / "arrays.pkl").read_bytes() == before
+    np.testing.assert_array_equal(
+        load_model_artifact(filePath)["weights"], np.arange(100000, dtype=np.float64))
@@ -0,0 +1,91 @@
+import hashlib
+import io
+import pickle
+
+import pytest
+from botocore.exceptions import ClientError
+
+from us_visa.store.aws_s3_storage import SimpleStorageService
+from us_visa.store.model_cache import ModelCache
+
+BUCKET = "models"
+
+
+class StubS3Client:
+    """
+    In-memory stand-in for the boto3 client calls the model cache makes
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self.downloads = 0
+
+    def put(self, key: str, obj) -> None:
+        content = pickle.dumps(obj)
+        self.objects[key] = (content, f'"{hashlib.md5(content).hexdigest()}"')
+
+    def head_object(self, Bucket: str, Key: str) -> dict:
+        if Key not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ETag": self.objects[Key][1]}
+
+    def get_object(self, Bucket: str, Key: str, IfMatch: str) -> dict:
+        content, etag = self.objects[Key]
+        if IfMatch != etag:
+            raise ClientError({"Error": {"Code": "PreconditionFailed"}}, "GetObject")
+        self.downloads += 1
+        return {"Body": io.BytesIO(content)}
+
+
+def make_storage(tmp_path, maxBytes: int = 1 << 30, diskEnabled: bool = True):
+    cache = ModelCache(cacheDir=str(tmp_path), maxBytes=maxBytes, diskEnabled=diskEnabled)
+    storage = SimpleStorageService(cache=cache)
+    storage.s3_client = StubS3Client()
+    return storage, cache
+
+
+@pytest.mark.parametrize("diskEnabled", [True, False])
+def test_hit_returns_a_new_object(tmp_path, diskEnabled):
+    storage, cache = make_storage(tmp_path, diskEnabled=diskEnabled)
+    storage.s3_client.put("model.pkl", {"weights": [1, 2, 3]})
+
+    first = storage.load_model("model.pkl", BUCKET)
+    first["weights"].append(4)
+    second = storage.load_model("model.pkl", BUCKET)
+
+    assert storage.s3_client.downloads == 1
+    assert second == {"weights": [1, 2, 3]}
+    assert cache.get_stats()["diskHits" if diskEnabled else "memoryHits"] == 1
+
+
+def test_stale_etag_downloads_the_new_object(tmp_path):
+    storage, _ = make_storage(tmp_path)
+    storage.s3_client.put("model.pkl", {"version": 1})
+    assert storage.load_model("model.pkl", BUCKET) == {"version": 1}
+
+    storage.s3_client.put("model.pkl", {"version": 2})
+
+    assert storage.load_model("model.pkl", BUCKET) == {"version": 2}
+    assert storage.s3_client.downloads == 2
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    entrySize = len(pickle.dumps({"name": "a" * 1000}))
+    storage, cache = make_storage(tmp_path, maxBytes=2 * entrySize)
+
+    def read(key: str):
+        return storage.read_cached_object(key, BUCKET, pickle.loads, keep_in_memory=False)
+
+    for key in ("a", "b", "c"):
+        storage.s3_client.put(key, {"name": key * 1000})
+    read("a")
+    read("b")
+    read("a")
+    read("c")
+    assert storage.s3_client.downloads == 3
+
+    assert read("a") == {"name": "a" * 1000}
+    assert storage.s3_client.downloads == 3
+    assert read("b") == {"name": "b" * 1000}
+    assert storage.s3_client.downloads == 4
+    assert cache.get_stats()["diskHits"] == 2
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import GridSearchCV, ParameterGrid
+from sklearn.neighbors import KNeighborsClassifier
+
+from us_visa.components.model_search import ParallelModelSearch
+from us_visa.entity.config_entity import ModelSearchConfig
+from us_visa.store.fit_cache import FitCache
+
+MODEL_CONFIG = {
+    "grid_search": {"class": "GridSearchCV", "module": "sklearn.model_selection", "params": {"cv": 3}},
+    "model_selection": {
+        "module_0": {
+            "class": "KNeighborsClassifier",
+            "module": "sklearn.neighbors",
+            "params": {"algorithm": "kd_tree"},
+            "search_param_grid": {"weights": ["uniform", "distance"], "n_neighbors": [3, 5, 9]},
+        },
+        "module_1": {
+            "class": "RandomForestClassifier",
+            "module": "sklearn.ensemble",
+            "params": {"random_state": 0},
+            "search_param_grid": {"max_depth": [3, 8], "n_estimators": [5, 10]},
+        },
+    },
+}
+ESTIMATORS = {
+    "module_0": KNeighborsClassifier(algorithm="kd_tree"),
+    "module_1": RandomForestClassifier(random_state=0),
+}
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, 6))
+    y = (X[:, 0] + 0.5 * X[:, 1] ** 2 + rng.normal(scale=0.5, size=600) > 0.5).astype(int)
+    return X, y
+
+
+def test_grid_strategy_matches_grid_search_cv(data):
+    X, y = data
+    search = ParallelModelSearch(MODEL_CONFIG, ModelSearchConfig(workers=1), fitCache=None)
+
+    bestModels = {best.model_serial_number: best for best in search.search(X, y)}
+
+    for serialNumber, estimator in ESTIMATORS.items():
+        grid = MODEL_CONFIG["model_selection"][serialNumber]["search_param_grid"]
+        expected = GridSearchCV(estimator, grid, cv=3).fit(X, y)
+        best = bestModels[serialNumber]
+        assert best.best_parameters == expected.best_params_
+        assert best.best_score == pytest.approx(expected.best_score_, abs=1e-12)
+        np.testing.assert_array_equal(best.best_model.predict(X), expected.best_estimator_.predict(X))
+
+def test_halving_strategy_keeps_a_grid_point(data):
+    X, y = data
+    search = ParallelModelSearch(
+        MODEL_CONFIG, ModelSearchConfig(workers=1, strategy="halving", factor=2), fitCache=None)
+
+    bestModels = search.search(X, y)
+
+    assert len(bestModels) == len(ESTIMATORS)
+    for best in bestModels:
+        grid = MODEL_CONFIG["model_selection"][best.model_serial_number]["search_param_grid"]
+        assert all(best.best_parameters[name] in values for name, values in grid.items())
+    assert 0 < search.stats["savedShare"] < 1
+
+def test_fit_cache_skips_unseeded_estimators(tmp_path, data):
+    X, y = data
+    modelConfig = {**MODEL_CONFIG, "model_selection": {
+        "module_0": MODEL_CONFIG["model_selection"]["module_0"],
+        "module_1": {**MODEL_CONFIG["model_selection"]["module_1"], "params": {}},
+    }}
+    fitCache = FitCache(cacheDir=str(tmp_path), maxBytes=1 << 30)
+    gridFits = {serialNumber: len(list(ParameterGrid(candidate["search_param_grid"]))) * 3
+                for serialNumber, candidate in modelConfig["model_selection"].items()}
+
+    ParallelModelSearch(modelConfig, ModelSearchConfig(workers=1), fitCache).search(X, y)
+    search = ParallelModelSearch(modelConfig, ModelSearchConfig(workers=1), fitCache)
+    search.search(X, y)
+
+    assert search.stats["cachedFits"] == gridFits["module_0"]
+    assert search.stats["fits"] == gridFits["module_1"]
+
+
+def test_scores_are_written_once_per_search(tmp_path, data, monkeypatch):
+    X, y = data
+    fitCache = FitCache(cacheDir=str(tmp_path), maxBytes=1 << 30)
+    flushes = []
+    flush = fitCache.flush
+    monkeypatch.setattr(fitCache, "flush", lambda: flushes.append(1) or flush())
+
+    ParallelModelSearch(MODEL_CONFIG, ModelSearchConfig(workers=1), fitCache).search(X, y)
+
+    assert flushes == [1]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".bin")]
+    reloaded = FitCache(cacheDir=str(tmp_path), maxBytes=1 << 30)
+    search = ParallelModelSearch(MODEL_CONFIG, ModelSearchConfig(workers=1), reloaded)
+    search.search(X, y)
+    assert search.stats["fits"] == 0
+
+
+def test_score_index_drops_the_oldest_scores(tmp_path):
+    fitCache = FitCache(cacheDir=str(tmp_path), maxBytes=1 << 30, maxScores=2)
+    for key, score in (("a", 0.1), ("b", 0.2), ("c", 0.3)):
+        fitCache.put_score(key, score)
+    fitCache.flush()
+
+    reloaded = FitCache(cacheDir=str(tmp_path), maxBytes=1 << 30)
+    assert reloaded.get_score("a") is None
+    assert (reloaded.get_score("b"), reloaded.get_score("c")) == (0.2, 0.3)
@@ -1,5 +1,6 @@
 import sys
 import os
+from typing import Optional
 
 from pandas import DataFrame
 from us_visa.entity.artifact_entity import DataIngestionArtifact
@@ -17,7 +18,7 @@ class DataIngestion:
         except Exception as e:
             raise USvisaException(e, sys)
 
-    def _export_data_into_feature_store(self) -> DataFrame:
+    def export_data_into_feature_store(self) -> DataFrame:
         """
         Exports data from a MongoDB collection to a CSV file in the feature store.
 
@@ -88,7 +89,7 @@ class DataIngestion:
         except Exception as e:
             raise USvisaException(e, sys)
 
-    def initiate_data_ingestion(self) -> DataIngestionArtifact:
+    def initiate_data_ingestion(self, dataFrame: Optional[DataFrame] = None) -> DataIngestionArtifact:
         """
         Handles the data ingestion process for the US Visa application, including
         exporting data from MongoDB to a feature store and performing a train-test
@@ -101,8 +102,9 @@ class DataIngestion:
             ingestion, including paths and split ratio.
 
         Methods:
-            _export_data_into_feature_store() -> DataFrame:
-                Exports data from MongoDB to a CSV file in the feature store.
+            export_data_into_feature_store() -> DataFrame:
+                Exports data from MongoDB to a CSV file in the feature store,
+                skipped when the caller already exported it as dataFrame.
             _train_test_split(dataFrame: DataFrame) -> None:
                 Splits the data into train and test sets and saves them to CSV files.
             initiate_data_ingestion() -> DataIngestionArtifact:
@@ -113,7 +115,8 @@ class DataIngestion:
         logging.info("Initiating Data Ingestion Process")
         try:
             # Get data from db
-            dataFrame = self._export_data_into_feature_store()
+            if dataFrame is None:
+                dataFrame = self.export_data_into_feature_store()
 
             # Perform train-test-split
             self._train_test_split(dataFrame=dataFrame)
@@ -83,7 +83,53 @@ class DataValidation():
         except Exception as e:
             raise USvisaException(e, sys) from e
 
-    def initiate_data_validation(self) -> DataValidationArtifact:
+    def _drift_artifact(self,
+                        dataValidationArtifact: DataValidationArtifact,
+                        trainDf: pd.DataFrame,
+                        testDf: pd.DataFrame,
+                        ) -> DataValidationArtifact:
+        driftStatus = self._detect_dataset_drift(
+            referenceDf=trainDf, currentDf=testDf
+        )
+        if driftStatus:
+            logging.info("Drift detected")
+            message = "Drift Detected"
+        else:
+            message = "Drift not detected"
+
+        return DataValidationArtifact(
+            validationStatus=dataValidationArtifact.validationStatus,
+            message=message,
+            # Where _detect_dataset_drift wrote it, the artifact passed in may
+            # come from the stage cache and point into an earlier run
+            driftReportFilePath=self.dataValidationConfig.driftReportFilePath,
+        )
+
+    def detect_drift(self, dataValidationArtifact: DataValidationArtifact) -> DataValidationArtifact:
+        """
+        Write the drift report of the test set against the train set and
+        return the validation artifact with the drift outcome as message,
+        unchanged when the schema checks failed
+        """
+        try:
+            if not dataValidationArtifact.validationStatus:
+                return dataValidationArtifact
+
+            trainDf, testDf = (
+                DataValidation.read_data(
+                    filePath=self.dataIngestionArtifact.trainFilePath),
+                DataValidation.read_data(
+                    filePath=self.dataIngestionArtifact.testFilePath),
+            )
+            return self._drift_artifact(dataValidationArtifact, trainDf, testDf)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def initiate_data_validation(self, detectDrift: bool = True) -> DataValidationArtifact:
+        """
+        :param detectDrift: False only runs the schema checks, the caller then
+            runs detect_drift on the artifact
+        """
         logging.info("Initiating Data Validation Process")
         try:
             # load the df
@@ -115,25 +161,17 @@ class DataValidation():
 
             validationStatus = len(validationErrorMessage) == 0
 
-            if validationStatus:
-                # Check data drift
-                driftStatus = self._detect_dataset_drift(
-                    referenceDf=trainDf, currentDf=testDf
-                )
-                if driftStatus:
-                    logging.info("Drift detected")
-                    validationErrorMessage = "Drift Detected"
-                else:
-                    validationErrorMessage = "Drift not detected"
-
-            else:
+            if not validationStatus:
                 logging.info(f"Validation error: {validationErrorMessage}")
 
             dataValidationArtifact = DataValidationArtifact(
                 validationStatus=validationStatus,
                 message=validationErrorMessage,
-                driftReportFilePath=self.dataValidationConfig.driftReportFilePath
             )
+            if validationStatus and detectDrift:
+                # Check data drift
+                dataValidationArtifact = self._drift_artifact(
+                    dataValidationArtifact, trainDf, testDf)
 
             logging.info(
                 f"Data validation artifact: {dataValidationArtifact}")
@@ -8,7 +8,11 @@ import numpy as np
 from sklearn.metrics import f1_score
 
 from us_visa.constants import SCHEMA_FILE_PATH
-from us_visa.entity.artifact_entity import DataIngestionArtifact, ModelEvaluationArtifact, ModelTrainerArtifact
+from us_visa.entity.artifact_entity import (DataIngestionArtifact,
+                                            ModelEvaluationArtifact,
+                                            ModelTrainerArtifact,
+                                            ProductionModelScoreArtifact,
+                                            )
 from us_visa.entity.config_entity import ModelEvaluationConfig
 from us_visa.entity.estimator import TargetValueMapping
 from us_visa.entity.s3_estimator import USVisaEstimator
@@ -28,9 +32,12 @@ class EvaluateModelResponse:
 class ModelEvaluator:
     def __init__(self,
                  dataIngestionArtifact: DataIngestionArtifact,
-                 modelTrainerArtifact: ModelTrainerArtifact,
+                 modelTrainerArtifact: Optional[ModelTrainerArtifact],
                  modelEvaluationConfig: ModelEvaluationConfig,
                  ):
+        """
+        :param modelTrainerArtifact: None when only scoring the production model
+        """
         try:
             self.modelEvaluationConfig = modelEvaluationConfig
             self.modelTrainerArtifact = modelTrainerArtifact
@@ -55,34 +62,49 @@ class ModelEvaluator:
         except Exception as e:
             raise USvisaException(e, sys)
 
-    def _evaluate_model(self) -> EvaluateModelResponse:
+    def score_production_model(self) -> ProductionModelScoreArtifact:
+        """
+        Score the model in s3 on the test set, independent of the trained
+        model so that it can run while training does
+        """
         try:
-            logging.info("Evaluating trained model and previous model")
-
-            currentYear = date.today().year
-            testDf = pd.read_csv(self.dataIngestionArtifact.testFilePath)
-            testDf["company_age"] = currentYear - testDf["yr_of_estab"]
-
-            # Note that this is a list, not string
-            targetColumn = self._schemaConfig["target_columns"]
-
-            X = testDf.drop(columns=targetColumn, axis=1)
-            y = testDf[targetColumn[0]]
-
-            y = y.replace(
-                TargetValueMapping()._asdict()
-            )
-
-            trainedModelF1Score = self.modelTrainerArtifact.metricArtifact.f1_score
+            logging.info("Scoring production model")
 
             bestModelF1Score = None
             bestModel = self._get_best_model()
             if bestModel is not None:
+                currentYear = date.today().year
+                testDf = pd.read_csv(self.dataIngestionArtifact.testFilePath)
+                testDf["company_age"] = currentYear - testDf["yr_of_estab"]
+
+                # Note that this is a list, not string
+                targetColumn = self._schemaConfig["target_columns"]
+
+                X = testDf.drop(columns=targetColumn, axis=1)
+                y = testDf[targetColumn[0]]
+
+                y = y.replace(
+                    TargetValueMapping()._asdict()
+                )
                 y = np.array(y).ravel().astype(int)
                 yHatBestModel = bestModel.predict(X).astype(int)
 
                 bestModelF1Score = f1_score(y, yHatBestModel)
 
+            return ProductionModelScoreArtifact(
+                s3ModelPath=self.modelEvaluationConfig.s3ModelKeyPath,
+                f1Score=bestModelF1Score,
+            )
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def _evaluate_model(self, productionModelScore: ProductionModelScoreArtifact) -> EvaluateModelResponse:
+        try:
+            logging.info("Evaluating trained model and previous model")
+
+            trainedModelF1Score = self.modelTrainerArtifact.metricArtifact.f1_score
+            bestModelF1Score = productionModelScore.f1Score
+
             tmpBestModelScore = 0 if bestModelF1Score is None else bestModelF1Score
             result = EvaluateModelResponse(trainedModelF1Score=trainedModelF1Score,
                                            bestModelF1Score=bestModelF1Score,
@@ -95,10 +117,18 @@ class ModelEvaluator:
         except Exception as e:
             raise USvisaException(e, sys) from e
 
-    def initiate_model_evaluation(self) -> ModelEvaluationArtifact:
+    def initiate_model_evaluation(self,
+                                  productionModelScore: Optional[ProductionModelScoreArtifact] = None,
+                                  ) -> ModelEvaluationArtifact:
+        """
+        :param productionModelScore: Score of the production model computed
+            beforehand by score_production_model, scored here when None
+        """
         try:
             logging.info("Initiating Model Evaluation Process")
-            response = self._evaluate_model()
+            if productionModelScore is None:
+                productionModelScore = self.score_production_model()
+            response = self._evaluate_model(productionModelScore)
 
             modelEvaluationArtifact = ModelEvaluationArtifact(
                 isModelAccepted=response.isModelAccepted,
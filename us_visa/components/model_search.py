@@ -0,0 +1,408 @@
+import importlib
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from neuro_mf import GridSearchedBestModel
+from sklearn.model_selection import ParameterGrid, StratifiedKFold
+
+from us_visa.constants import TRAINING_PROCESS_START_METHOD
+from us_visa.entity.config_entity import ModelSearchConfig
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+from us_visa.store.fit_cache import FitCache
+
+# Set once per worker process by _init_worker
+_workerX: Optional[np.ndarray] = None
+_workerY: Optional[np.ndarray] = None
+_workerFolds: List[Tuple[np.ndarray, np.ndarray]] = []
+_workerOrder: Optional[np.ndarray] = None
+
+SAMPLES_RESOURCE: str = "n_samples"
+
+
+@dataclass
+class SearchCandidate:
+    serialNumber: str
+    module: str
+    className: str
+    fixedParams: dict
+    grid: List[dict]
+
+    @property
+    def estimatorName(self) -> str:
+        return f"{self.module}.{self.className}"
+
+    def build(self, params: dict) -> Any:
+        estimatorClass = getattr(importlib.import_module(self.module), self.className)
+        return estimatorClass(**{**self.fixedParams, **params})
+
+    def is_seeded(self, params: dict) -> bool:
+        """
+        False when the estimator, or one it wraps, draws from the global random
+        state, so that two fits with these parameters differ
+        """
+        return all(value is not None for name, value in self.build(params).get_params().items()
+                   if name == "random_state" or name.endswith("__random_state"))
+
+
+def _init_worker(xPath: str, yPath: str, nFolds: int) -> None:
+    """
+    Map the training matrix shared by all workers and derive the folds, so
+    that tasks only carry a candidate, parameters and a fold number
+    """
+    global _workerX, _workerY, _workerFolds, _workerOrder
+    _workerX = np.load(xPath, mmap_mode="r")
+    _workerY = np.load(yPath, mmap_mode="r")
+    _workerFolds = list(StratifiedKFold(n_splits=nFolds).split(_workerX, _workerY))
+    # Same order in every worker, subsamples of successive halving are its prefixes
+    _workerOrder = np.random.RandomState(0).permutation(len(_workerY))
+
+
+def _get_fold(fold: int, nSamples: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    if nSamples is None or nSamples >= len(_workerY):
+        return _workerFolds[fold]
+
+    subsample = np.sort(_workerOrder[:nSamples])
+    folds = StratifiedKFold(n_splits=len(_workerFolds)).split(subsample, _workerY[subsample])
+    trainIndex, testIndex = list(folds)[fold]
+    return subsample[trainIndex], subsample[testIndex]
+
+
+def _fit_task(candidate: SearchCandidate,
+              params: dict,
+              fold: int,
+              nSamples: Optional[int] = None,
+              ) -> Tuple[Optional[float], float, Any]:
+    """
+    Runs in a worker process. Fits one fold, on the first nSamples rows of the
+    shared order when given, and returns its accuracy, or refits on all rows
+    when fold is -1 and returns the fitted estimator
+    """
+    start = time.perf_counter()
+    estimator = candidate.build(params)
+    if fold < 0:
+        estimator.fit(np.asarray(_workerX), np.asarray(_workerY))
+        return None, time.perf_counter() - start, estimator
+
+    trainIndex, testIndex = _get_fold(fold, nSamples)
+    estimator.fit(_workerX[trainIndex], _workerY[trainIndex])
+    score = estimator.score(_workerX[testIndex], _workerY[testIndex])
+    return float(score), time.perf_counter() - start, None
+
+
+@dataclass
+class SearchTask:
+    key: Tuple[str, int]
+    candidate: SearchCandidate
+    params: dict
+    nSamples: Optional[int] = None
+    # Share of a fit on all rows with the full resource, for the savings report
+    cost: float = 1.0
+
+
+class ParallelModelSearch:
+    """
+    Replacement of the neuro_mf ModelFactory search: every (candidate,
+    parameters, fold) fit of the model_selection grids runs as one task of a
+    process pool, instead of one GridSearchCV per candidate fitting serially.
+    Workers memory-map the training matrix from a .npy file rather than
+    receiving a pickled copy with every task.
+
+    The grid strategy scores like GridSearchCV with an integer cv:
+    StratifiedKFold without shuffling, mean accuracy over the folds, first best
+    parameters in grid order, refit on all rows.
+
+    The halving strategy is successive halving: every grid point is scored with
+    a small resource, a subsample of the rows or a small value of an estimator
+    parameter such as n_estimators, and only the best 1/factor of them move on
+    to the next round, with factor times the resource. The last round uses the
+    full resource. max_fits and max_seconds stop the search after the current
+    round, keeping the best parameters of each candidate's last round.
+    """
+
+    def __init__(self,
+                 modelConfig: dict,
+                 searchConfig: ModelSearchConfig,
+                 fitCache: Optional[FitCache] = None,
+                 ):
+        """
+        :param modelConfig: Content of config/model.yaml
+        :param searchConfig: Its search section
+        :param fitCache: Scores and estimators of previous searches, None to fit everything
+        """
+        self.modelConfig = modelConfig
+        self.searchConfig = searchConfig
+        self.fitCache = fitCache
+        self._dataFingerprint: Optional[str] = None
+        self.nFolds = int((modelConfig["grid_search"].get("params") or {}).get("cv", 5))
+        self.stats: Dict[str, float] = {}
+
+    @property
+    def workers(self) -> int:
+        if self.searchConfig.workers:
+            return self.searchConfig.workers
+        # Cores this process may run on, which containers often restrict
+        if hasattr(os, "sched_getaffinity"):
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
+    def get_candidates(self) -> List[SearchCandidate]:
+        return [
+            SearchCandidate(
+                serialNumber=serialNumber,
+                module=candidate["module"],
+                className=candidate["class"],
+                fixedParams=dict(candidate.get("params") or {}),
+                grid=list(ParameterGrid(dict(candidate["search_param_grid"]))),
+            )
+            for serialNumber, candidate in self.modelConfig["model_selection"].items()
+        ]
+
+    def search(self, X: np.ndarray, y: np.ndarray) -> List[GridSearchedBestModel]:
+        """
+        Score the grid points of every candidate with the configured strategy,
+        then refit the best parameters of each candidate, all in the process pool
+        """
+        workDir = tempfile.mkdtemp(prefix="usvisa-search-")
+        try:
+            xPath, yPath = os.path.join(workDir, "X.npy"), os.path.join(workDir, "y.npy")
+            np.save(xPath, np.ascontiguousarray(X))
+            np.save(yPath, np.ascontiguousarray(y))
+
+            candidates = self.get_candidates()
+            fullGridFits = sum(len(candidate.grid) for candidate in candidates) * self.nFolds
+            self.stats = {"fits": 0, "cachedFits": 0, "cost": 0.0, "fitSeconds": 0.0}
+            if self.fitCache is not None:
+                self._dataFingerprint = FitCache.data_fingerprint(X, y)
+
+            start = time.perf_counter()
+            with ProcessPoolExecutor(max_workers=self.workers,
+                                     mp_context=multiprocessing.get_context(
+                                         TRAINING_PROCESS_START_METHOD),
+                                     initializer=_init_worker,
+                                     initargs=(xPath, yPath, self.nFolds),
+                                     ) as executor:
+                if self.searchConfig.strategy == "halving":
+                    best = self._successive_halving(executor, candidates, len(y), start)
+                else:
+                    best = self._grid(executor, candidates)
+                bestModels = self._refit_best(executor, candidates, best)
+
+            elapsed = time.perf_counter() - start
+            self.stats.update({
+                "strategy": self.searchConfig.strategy,
+                "workers": self.workers,
+                "seconds": elapsed,
+                "fullGridFits": fullGridFits,
+                # Compute left out compared with the full grid, fits weighted by resource
+                "savedShare": 1.0 - self.stats["cost"] / fullGridFits,
+            })
+            logging.info(
+                f"Parallel model search ({self.searchConfig.strategy}): "
+                f"{self.stats['fits']} cross-validation fits out of {fullGridFits} in the full grid, "
+                f"{self.stats['cachedFits']} more read from the fit cache, "
+                f"{self.stats['savedShare']:.0%} of the grid compute saved, {elapsed:.1f}s on "
+                f"{self.workers} workers, {self.stats['fitSeconds']:.1f}s of fitting")
+
+            return bestModels
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+        finally:
+            if self.fitCache is not None:
+                # Scores of the fits done so far, even when the search failed
+                self.fitCache.flush()
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    def _fit_key(self, candidate: SearchCandidate, params: dict, fold: int,
+                 nSamples: Optional[int] = None) -> Optional[str]:
+        if self.fitCache is None:
+            return None
+        # Caching an unseeded fit would replay its score and model on every run
+        if not candidate.is_seeded(params):
+            return None
+        return FitCache.fit_key(self._dataFingerprint, candidate.estimatorName,
+                                {**candidate.fixedParams, **params}, fold, self.nFolds, nSamples)
+
+    def _evaluate(self, executor: ProcessPoolExecutor, tasks: List[SearchTask]) -> Dict[Tuple[str, int], float]:
+        """
+        :return: Mean fold accuracy of every task, folds found in the fit cache
+            are not fitted again
+        """
+        folds: Dict[Tuple[str, int], List[Tuple[Optional[str], Any]]] = {}
+        for task in tasks:
+            folds[task.key] = []
+            for fold in range(self.nFolds):
+                key = self._fit_key(task.candidate, task.params, fold, task.nSamples)
+                score = self.fitCache.get_score(key) if key is not None else None
+                if score is None:
+                    score = executor.submit(_fit_task, task.candidate, task.params, fold, task.nSamples)
+                folds[task.key].append((key, score))
+
+        scores = {}
+        for task in tasks:
+            foldScores = []
+            for key, result in folds[task.key]:
+                if not isinstance(result, Future):
+                    foldScores.append(result)
+                    self.stats["cachedFits"] += 1
+                    continue
+
+                score, seconds, _ = result.result()
+                foldScores.append(score)
+                self.stats["fits"] += 1
+                self.stats["cost"] += task.cost
+                self.stats["fitSeconds"] += seconds
+                if key is not None:
+                    self.fitCache.put_score(key, score)
+            scores[task.key] = float(np.mean(foldScores))
+        return scores
+
+    def _grid(self, executor: ProcessPoolExecutor, candidates: List[SearchCandidate]
+              ) -> Dict[str, Tuple[dict, float]]:
+        """
+        :return: Best parameters and score of every candidate
+        """
+        scores = self._evaluate(executor, [
+            SearchTask(key=(candidate.serialNumber, paramsIndex), candidate=candidate, params=params)
+            for candidate in candidates
+            for paramsIndex, params in enumerate(candidate.grid)
+        ])
+
+        best = {}
+        for candidate in candidates:
+            candidateScores = [scores[(candidate.serialNumber, index)]
+                               for index in range(len(candidate.grid))]
+            bestIndex = int(np.argmax(candidateScores))
+            best[candidate.serialNumber] = (candidate.grid[bestIndex], candidateScores[bestIndex])
+        return best
+
+    def _get_resource(self, candidate: SearchCandidate, nRows: int) -> Tuple[str, List[dict], int]:
+        """
+        :return: Resource of the candidate, its grid without the resource
+            parameter, and the full resource
+        """
+        resource = self.searchConfig.resource
+        if resource == SAMPLES_RESOURCE or resource not in candidate.build({}).get_params():
+            return SAMPLES_RESOURCE, candidate.grid, nRows
+
+        # A resource parameter in the grid is searched through halving instead
+        gridValues = [params[resource] for params in candidate.grid if resource in params]
+        maxResource = self.searchConfig.max_resources or max(
+            gridValues or [candidate.build({}).get_params()[resource]])
+        grid = [{key: value for key, value in params.items() if key != resource}
+                for params in candidate.grid]
+        uniqueGrid = [dict(items) for items in dict.fromkeys(
+            tuple(sorted(params.items())) for params in grid)]
+        return resource, uniqueGrid, int(maxResource)
+
+    def _successive_halving(self,
+                            executor: ProcessPoolExecutor,
+                            candidates: List[SearchCandidate],
+                            nRows: int,
+                            start: float,
+                            ) -> Dict[str, Tuple[dict, float]]:
+        """
+        :return: Best parameters and score of every candidate, scores coming
+            from the last round a candidate reached
+        """
+        config = self.searchConfig
+        factor = config.factor
+        rounds = {}
+        for candidate in candidates:
+            resource, grid, maxResource = self._get_resource(candidate, nRows)
+            nRounds = 1 + int(np.ceil(np.log(len(grid)) / np.log(factor))) if len(grid) > 1 else 1
+            minResource = config.min_resources if resource == config.resource else 0
+            schedule = [max(minResource, maxResource // factor ** (nRounds - 1 - step), 1)
+                        for step in range(nRounds)]
+            if resource == SAMPLES_RESOURCE:
+                # Every fold needs rows of both classes to train on
+                schedule = [max(value, 20 * self.nFolds) for value in schedule]
+            rounds[candidate.serialNumber] = (resource, grid, maxResource, schedule)
+
+        survivors = {candidate.serialNumber: list(range(len(rounds[candidate.serialNumber][1])))
+                     for candidate in candidates}
+        best: Dict[str, Tuple[dict, float]] = {}
+        for step in range(max(len(schedule) for *_, schedule in rounds.values())):
+            tasks = []
+            for candidate in candidates:
+                resource, grid, maxResource, schedule = rounds[candidate.serialNumber]
+                if step >= len(schedule):
+                    continue
+                value = schedule[step]
+                for index in survivors[candidate.serialNumber]:
+                    if resource == SAMPLES_RESOURCE:
+                        params, nSamples = grid[index], value
+                    else:
+                        params, nSamples = {**grid[index], resource: value}, None
+                    tasks.append(SearchTask(key=(candidate.serialNumber, index), candidate=candidate,
+                                            params=params, nSamples=nSamples, cost=value / maxResource))
+
+            if not tasks:
+                break
+            if best and self._budget_exhausted(len(tasks) * self.nFolds, start):
+                logging.info(f"Model search budget reached before halving round {step}")
+                break
+
+            scores = self._evaluate(executor, tasks)
+            for candidate in candidates:
+                resource, grid, maxResource, schedule = rounds[candidate.serialNumber]
+                if step >= len(schedule):
+                    continue
+                ranked = sorted(survivors[candidate.serialNumber],
+                                key=lambda index: (-scores[(candidate.serialNumber, index)], index))
+                params = dict(grid[ranked[0]])
+                if resource != SAMPLES_RESOURCE:
+                    params[resource] = maxResource
+                best[candidate.serialNumber] = (params, scores[(candidate.serialNumber, ranked[0])])
+                survivors[candidate.serialNumber] = ranked[:max(1, int(np.ceil(len(ranked) / factor)))]
+
+                logging.info(
+                    f"Halving round {step} of {candidate.className}: {len(ranked)} parameter sets "
+                    f"at {resource}={schedule[step]}, best score {best[candidate.serialNumber][1]:.4f}")
+
+        return best
+
+    def _budget_exhausted(self, nextFits: int, start: float) -> bool:
+        config = self.searchConfig
+        if config.max_fits and self.stats["fits"] + nextFits > config.max_fits:
+            return True
+        return bool(config.max_seconds) and time.perf_counter() - start > config.max_seconds
+
+    def _refit_best(self,
+                    executor: ProcessPoolExecutor,
+                    candidates: List[SearchCandidate],
+                    best: Dict[str, Tuple[dict, float]],
+                    ) -> List[GridSearchedBestModel]:
+        refits = []
+        for candidate in candidates:
+            key = self._fit_key(candidate, best[candidate.serialNumber][0], -1)
+            estimator = self.fitCache.get_estimator(key) if key is not None else None
+            if estimator is None:
+                estimator = executor.submit(_fit_task, candidate, best[candidate.serialNumber][0], -1)
+            refits.append((candidate, key, estimator))
+
+        bestModels = []
+        for candidate, key, estimator in refits:
+            if isinstance(estimator, Future):
+                _, seconds, estimator = estimator.result()
+                self.stats["fitSeconds"] += seconds
+                if key is not None:
+                    self.fitCache.put_estimator(key, estimator)
+
+            bestParameters, bestScore = best[candidate.serialNumber]
+            bestModels.append(GridSearchedBestModel(
+                model_serial_number=candidate.serialNumber,
+                model=candidate.build({}),
+                best_model=estimator,
+                best_parameters=bestParameters,
+                best_score=bestScore,
+            ))
+        return bestModels
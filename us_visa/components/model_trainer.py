@@ -1,15 +1,28 @@
+import os
 import sys
+import tempfile
+import time
 import numpy as np
-from typing import Tuple
-from neuro_mf import ModelFactory
+from typing import List, Optional, Tuple
+from neuro_mf import GridSearchedBestModel, ModelFactory
 from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+from sklearn.neighbors import KNeighborsClassifier
 
 from us_visa.entity.artifact_entity import ClassificationMetricArtifact, DataTransformationArtifact, ModelTrainerArtifact
-from us_visa.entity.config_entity import ModelTrainerConfig
+from us_visa.components.model_search import ParallelModelSearch
+from us_visa.constants import (FIT_CACHE_DIR,
+                               FIT_CACHE_ENABLED,
+                               FIT_CACHE_MAX_BYTES,
+                               FIT_CACHE_MAX_SCORES,
+                               FIT_CACHE_STORE_ESTIMATORS,
+                               )
+from us_visa.entity.config_entity import ModelSearchConfig, ModelTrainerConfig, ServingBudget
 from us_visa.entity.estimator import USvisaModel
 from us_visa.logger import logging
+from us_visa.store.fit_cache import FitCache
 from us_visa.exception import USvisaException
-from us_visa.utils.main_utils import load_numpy_array_data, load_object, save_object
+from us_visa.utils.main_utils import load_numpy_array_data, load_object, read_yaml_file, save_object
+from us_visa.utils.model_artifact import save_model_artifact
 
 
 class ModelTrainer:
@@ -20,25 +33,155 @@ class ModelTrainer:
         except Exception as e:
             raise USvisaException(e, sys)
 
-    def _get_model_object_and_report(self, trainArr: np.array, testArr: np.array) -> Tuple[object, object]:
+    def _get_serving_budget(self) -> ServingBudget:
+        modelConfig = read_yaml_file(self.modelTrainerConfig.modelConfigFilePath)
+        return ServingBudget(**(modelConfig.get("serving_budget") or {}))
+
+    def _search_candidates(self, X_train: np.array, y_train: np.array) -> List[GridSearchedBestModel]:
+        """
+        Best parameters and refitted model of every model_selection candidate
+        """
+        modelConfig = read_yaml_file(self.modelTrainerConfig.modelConfigFilePath)
+        searchConfig = ModelSearchConfig(**(modelConfig.get("search") or {}))
+
+        if searchConfig.engine == "parallel":
+            fitCache = FitCache(cacheDir=FIT_CACHE_DIR,
+                                maxBytes=FIT_CACHE_MAX_BYTES,
+                                storeEstimators=FIT_CACHE_STORE_ESTIMATORS,
+                                maxScores=FIT_CACHE_MAX_SCORES,
+                                ) if FIT_CACHE_ENABLED else None
+            return ParallelModelSearch(modelConfig, searchConfig, fitCache).search(X_train, y_train)
+
+        modelFactory = ModelFactory(
+            model_config_path=self.modelTrainerConfig.modelConfigFilePath
+        )
+        return modelFactory.initiate_best_parameter_search_for_initialized_models(
+            initialized_model_list=modelFactory.get_initialized_model_list(),
+            input_feature=X_train,
+            output_feature=y_train,
+        )
+
+    def _save_model(self, filePath: str, usvisaModel: USvisaModel) -> None:
+        if self.modelTrainerConfig.modelArtifactFormat == "artifact":
+            save_model_artifact(
+                filePath, usvisaModel,
+                compression=self.modelTrainerConfig.modelArtifactCompression,
+            )
+        else:
+            save_object(filePath, usvisaModel)
+
+    def _measure_serving_cost(self, usvisaModel: USvisaModel, X: np.array, batchSize: int,
+                              repeat: int = 50) -> dict:
+        """
+        Median single-row and batch latency of the serving path, compiled
+        forest included, and size of the model file as saved, preprocessor
+        and KNN index included
+        """
+        rowTimings = []
+        for index in range(repeat + 1):
+            row = X[index % len(X):index % len(X) + 1]
+            start = time.perf_counter()
+            usvisaModel.predict_features(row)
+            rowTimings.append(time.perf_counter() - start)
+
+        batch = np.resize(X, (batchSize, X.shape[1]))
+        batchTimings = []
+        for _ in range(max(3, repeat // 10) + 1):
+            start = time.perf_counter()
+            usvisaModel.predict_features(batch)
+            batchTimings.append(time.perf_counter() - start)
+
+        with tempfile.TemporaryDirectory() as tmpDir:
+            modelFilePath = os.path.join(tmpDir, "model.pkl")
+            self._save_model(modelFilePath, usvisaModel)
+            modelSizeBytes = os.path.getsize(modelFilePath)
+
+        # The first call of each kind is a warm-up
+        return {
+            "row_latency_ms": float(np.median(rowTimings[1:])) * 1000,
+            "batch_latency_ms": float(np.median(batchTimings[1:])) * 1000,
+            "model_size_bytes": modelSizeBytes,
+        }
+
+    @staticmethod
+    def _apply_serving_budget(score: float, cost: dict, budget: ServingBudget) -> Optional[float]:
+        """
+        :return: Selection score of a candidate, None when the budget rejects it
+        """
+        limits = [
+            (cost["row_latency_ms"], budget.max_row_latency_ms),
+            (cost["batch_latency_ms"], budget.max_batch_latency_ms),
+            (cost["model_size_bytes"] / 1024 ** 2, budget.max_model_size_mb),
+        ]
+        overshoot = sum(max(0.0, measured / limit - 1) for measured, limit in limits
+                        if limit is not None)
+        if overshoot == 0:
+            return score
+        if budget.policy == "reject":
+            return None
+        return score - budget.penalty * overshoot
+
+    def _select_model(self,
+                      candidates: List[GridSearchedBestModel],
+                      preprocessingObj: object,
+                      X_test: np.array,
+                      ) -> Tuple[GridSearchedBestModel, USvisaModel, dict]:
+        """
+        Pick the candidate with the best cross-validation score, adjusted or
+        filtered by the serving budget of the model config
+        """
+        budget = self._get_serving_budget()
+        best = None
+        for candidate in candidates:
+            usvisaModel = USvisaModel(preprocessing_object=preprocessingObj,
+                                      trained_model_object=candidate.best_model)
+            usvisaModel.compile_forest()
+            cost = self._measure_serving_cost(usvisaModel, X_test, budget.batch_size)
+            score = self._apply_serving_budget(candidate.best_score, cost, budget)
+
+            logging.info(
+                f"Candidate {type(candidate.best_model).__name__} {candidate.best_parameters}: "
+                f"score {candidate.best_score:.4f}, selection score {score}, "
+                f"row {cost['row_latency_ms']:.2f}ms, "
+                f"batch of {budget.batch_size} {cost['batch_latency_ms']:.1f}ms, "
+                f"{cost['model_size_bytes']} bytes")
+
+            if score is None or score < self.modelTrainerConfig.expectedAccuracy:
+                continue
+            if best is None or score > best[0]:
+                best = (score, candidate, usvisaModel, cost)
+
+        if best is None:
+            raise Exception(
+                f"None of Model has base accuracy {self.modelTrainerConfig.expectedAccuracy} "
+                f"within the serving budget")
+
+        _, candidate, usvisaModel, cost = best
+        # Only the selected model is saved, so only it gets an index, and its
+        # serving cost is measured again with the index search
+        if isinstance(candidate.best_model, KNeighborsClassifier) \
+                and usvisaModel.build_knn_index(sampleFeatures=X_test) and usvisaModel.compile_knn():
+            cost = self._measure_serving_cost(usvisaModel, X_test, budget.batch_size)
+        return candidate, usvisaModel, cost
+
+    def _get_model_object_and_report(self, trainArr: np.array, testArr: np.array,
+                                     preprocessingObj: object,
+                                     ) -> Tuple[object, USvisaModel, ClassificationMetricArtifact]:
         try:
             logging.info("Performing model training")
-            modelFactory = ModelFactory(
-                model_config_path=self.modelTrainerConfig.modelConfigFilePath
-            )
 
             X_train, y_train = trainArr[:, :-1], trainArr[:, -1]
             X_test, y_test = testArr[:, :-1], testArr[:, -1]
 
-            bestModelDetail = modelFactory.get_best_model(
-                X=X_train, y=y_train, base_accuracy=self.modelTrainerConfig.expectedAccuracy
-            )
-
-            modelObj = bestModelDetail.best_model
+            candidates = self._search_candidates(X_train, y_train)
+            bestModelDetail, usvisaModel, servingCost = self._select_model(
+                candidates, preprocessingObj, X_test)
 
             logging.info("Generating report")
 
-            y_pred = modelObj.predict(X_test)
+            # Through the serving path, so that the metrics describe the
+            # approximate KNN search or the compiled forest when they are used
+            y_pred = usvisaModel.predict_features(X_test)
 
             accuracy = accuracy_score(y_test, y_pred)
             f1 = f1_score(y_test, y_pred)
@@ -46,10 +189,11 @@ class ModelTrainer:
             recall = recall_score(y_test, y_pred)
 
             metricArtifact = ClassificationMetricArtifact(
-                accuracy=accuracy, f1_score=f1, precision_score=precision, recall_score=recall
+                accuracy=accuracy, f1_score=f1, precision_score=precision, recall_score=recall,
+                **servingCost,
             )
 
-            return bestModelDetail, metricArtifact
+            return bestModelDetail, usvisaModel, metricArtifact
 
         except Exception as e:
             raise USvisaException(e, sys)
@@ -64,13 +208,13 @@ class ModelTrainer:
                 file_path=self.dataTransformationArtifact.transformedTestFilePath
             )
 
-            bestModelDetail, metricArtifact = self._get_model_object_and_report(
-                trainArr=trainArr, testArr=testArr)
-
             preprocessingObj = load_object(
                 file_path=self.dataTransformationArtifact.transformedObjectFilePath
             )
 
+            bestModelDetail, usvisa_model, metricArtifact = self._get_model_object_and_report(
+                trainArr=trainArr, testArr=testArr, preprocessingObj=preprocessingObj)
+
             if bestModelDetail.best_score < self.modelTrainerConfig.expectedAccuracy:
                 logging.info(
                     "No models metrics was higher than the base score"
@@ -78,12 +222,7 @@ class ModelTrainer:
                 raise Exception(
                     "No models metrics was higher than the base score"
                 )
-            usvisa_model = USvisaModel(preprocessing_object=preprocessingObj,
-                                       trained_model_object=bestModelDetail.best_model,
-                                       )
-            save_object(
-                self.modelTrainerConfig.trainedModelFilePath, usvisa_model
-            )
+            self._save_model(self.modelTrainerConfig.trainedModelFilePath, usvisa_model)
 
             modelTrainerArtifact = ModelTrainerArtifact(
                 trainedModelFilePath=self.modelTrainerConfig.trainedModelFilePath,
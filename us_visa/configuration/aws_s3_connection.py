@@ -1,6 +1,6 @@
 import boto3
 import os
-from us_visa.constants import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, REGION_NAME
+from us_visa.constants import AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_S3_ENDPOINT_URL, REGION_NAME
 
 
 class S3Client:
@@ -27,12 +27,14 @@ class S3Client:
             S3Client.s3_resource = boto3.resource('s3',
                                                   aws_access_key_id=__access_key_id,
                                                   aws_secret_access_key=__secret_access_key,
-                                                  region_name=region_name
+                                                  region_name=region_name,
+                                                  endpoint_url=AWS_S3_ENDPOINT_URL,
                                                   )
             S3Client.s3_client = boto3.client('s3',
                                               aws_access_key_id=__access_key_id,
                                               aws_secret_access_key=__secret_access_key,
-                                              region_name=region_name
+                                              region_name=region_name,
+                                              endpoint_url=AWS_S3_ENDPOINT_URL,
                                               )
         self.s3_resource = S3Client.s3_resource
         self.s3_client = S3Client.s3_client
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 from dotenv import load_dotenv
 
 # Relative path (if .env is in a parent folder)
@@ -20,6 +21,28 @@ AWS_SECRET_ACCESS_KEY: str = os.getenv(
     "AWS_SECRET_ACCESS_KEY_ENV_KEY", "please-get-your-own"
 )
 REGION_NAME: str = os.getenv("AWS_REGION_NAME", "please-get-your-own")
+# Alternative S3 endpoint, e.g. a local moto or minio server
+AWS_S3_ENDPOINT_URL: Optional[str] = os.getenv("AWS_S3_ENDPOINT_URL")
+
+# Model Cache Configs, local copies of s3 objects keyed by their ETag
+MODEL_CACHE_DIR: str = os.getenv(
+    "MODEL_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "us_visa", "models"))
+MODEL_CACHE_MAX_BYTES: int = int(
+    os.getenv("MODEL_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# false disables the disk tier, the in-memory tier always keeps the bytes of the last object per key
+MODEL_CACHE_ENABLED: bool = os.getenv(
+    "MODEL_CACHE_ENABLED", "true").lower() == "true"
+
+# Fit Cache Configs, cross-validation scores and refitted estimators of the
+# model search, keyed by the content of the transformed training data
+FIT_CACHE_DIR: str = os.getenv(
+    "FIT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "us_visa", "fits"))
+FIT_CACHE_MAX_BYTES: int = int(os.getenv("FIT_CACHE_MAX_BYTES", 1024 ** 3))
+# Scores kept in the score index, the oldest written are dropped first
+FIT_CACHE_MAX_SCORES: int = int(os.getenv("FIT_CACHE_MAX_SCORES", 100000))
+FIT_CACHE_ENABLED: bool = os.getenv("FIT_CACHE_ENABLED", "true").lower() == "true"
+FIT_CACHE_STORE_ESTIMATORS: bool = os.getenv(
+    "FIT_CACHE_STORE_ESTIMATORS", "true").lower() == "true"
 
 # Common Configs
 FILE_NAME: str = "usvisa.csv"
@@ -28,6 +51,13 @@ SCHEMA_FILE_PATH: str = os.path.join("config", "schema.yaml")
 # Training Pipeline Configs
 PIPELINE_NAME: str = "usvisa"
 ARTIFACT_DIR: str = "artifact"
+# Completed stages indexed by a fingerprint of their inputs, a run whose
+# inputs match a previous run reuses its outputs instead of recomputing them
+STAGE_CACHE_ENABLED: bool = os.getenv("STAGE_CACHE_ENABLED", "true").lower() == "true"
+STAGE_CACHE_DIR: str = os.getenv("STAGE_CACHE_DIR", os.path.join(ARTIFACT_DIR, "stage_cache"))
+# Start method of the training process pools. Training also runs on a thread of
+# the multithreaded server, which must not fork, hence forkserver or spawn
+TRAINING_PROCESS_START_METHOD: str = os.getenv("TRAINING_PROCESS_START_METHOD", "forkserver")
 
 # Data Ingestion Configs
 DATA_INGESTION_DIR_NAME: str = "data_ingestion"
@@ -52,6 +82,11 @@ PREPROCSSING_OBJECT_FILE_NAME: str = "preprocessing.pkl"
 MODEL_TRAINER_DIR_NAME: str = "model_trainer"
 MODEL_TRAINER_TRAINED_MODEL_DIR: str = "trained_model"
 MODEL_FILE_NAME: str = "model.pkl"
+# "artifact" writes the memory-mappable format of us_visa.utils.model_artifact,
+# "pickle" a plain dill pickle; loading detects the format from the file itself
+MODEL_ARTIFACT_FORMAT: str = os.getenv("MODEL_ARTIFACT_FORMAT", "artifact")
+# Empty, "zlib" or "lzma": smaller uploads, but compressed arrays are not memory-mapped
+MODEL_ARTIFACT_COMPRESSION: str = os.getenv("MODEL_ARTIFACT_COMPRESSION", "")
 MODEL_TRAINER_EXPECTED_SCORE: float = 0.8
 MODEL_TRAINER_MODEL_CONFIG_FILE_PATH: str = os.path.join(
     "config", "model.yaml"
@@ -64,3 +99,54 @@ MODEL_BUCKET_NAME: str = "ml-models-2025"
 # Server Config, note that the app port need to conver to int!
 APP_HOST: str = os.getenv("APP_HOST", "0.0.0.0")
 APP_PORT: int = int(os.getenv("APP_PORT", 8000))
+# Worker processes forked by server.prefork, they share the model loaded by the master
+SERVING_WORKERS: int = int(os.getenv("SERVING_WORKERS", os.cpu_count() or 1))
+
+# Prediction Configs
+PREDICT_BATCH_MAX_RECORDS: int = int(
+    os.getenv("PREDICT_BATCH_MAX_RECORDS", 10000))
+# Coalesce concurrent /v1/predict calls into one model call
+PREDICT_MICRO_BATCHING: bool = os.getenv(
+    "PREDICT_MICRO_BATCHING", "true").lower() == "true"
+PREDICT_MICRO_BATCH_MAX_SIZE: int = int(
+    os.getenv("PREDICT_MICRO_BATCH_MAX_SIZE", 64))
+PREDICT_MICRO_BATCH_MAX_WAIT_MS: float = float(
+    os.getenv("PREDICT_MICRO_BATCH_MAX_WAIT_MS", 2))
+# In-process cache of predictions, 0 disables it
+PREDICTION_CACHE_SIZE: int = int(os.getenv("PREDICTION_CACHE_SIZE", 100000))
+PREDICTION_CACHE_TTL_SECONDS: float = float(
+    os.getenv("PREDICTION_CACHE_TTL_SECONDS", 3600))
+# Rows parsed and scored at a time when streaming an uploaded file
+PREDICT_UPLOAD_CHUNK_ROWS: int = int(
+    os.getenv("PREDICT_UPLOAD_CHUNK_ROWS", 5000))
+# Largest batch scored by the flat-array forest evaluator, larger batches go
+# through sklearn, which is faster once its dispatch cost is amortized; 0 disables it
+COMPILED_FOREST_MAX_ROWS: int = int(os.getenv("COMPILED_FOREST_MAX_ROWS", 256))
+# Neighbor search of KNN models: "exact" keeps the exact search of the fitted
+# classifier, "approximate" opts in to the index built at training time, which
+# probes the clusters nearest to the query and trades recall for latency,
+# "off" does not build the index at all
+KNN_INDEX_MODE: str = os.getenv("KNN_INDEX_MODE", "exact")
+# Clusters probed first, doubled at training time up to KNN_INDEX_MAX_PROBE
+# until the recall@k on the test set reaches KNN_INDEX_MIN_RECALL; models whose
+# index stays below it keep the exact search in approximate mode too
+KNN_INDEX_N_PROBE: int = int(os.getenv("KNN_INDEX_N_PROBE", 8))
+KNN_INDEX_MAX_PROBE: int = int(os.getenv("KNN_INDEX_MAX_PROBE", 64))
+KNN_INDEX_MIN_RECALL: float = float(os.getenv("KNN_INDEX_MIN_RECALL", 0.95))
+# Clusters of the index, 0 for the square root of the training set size
+KNN_INDEX_N_LISTS: int = int(os.getenv("KNN_INDEX_N_LISTS", 0))
+
+# Executor Configs, blocking inference and training run off the event loop
+INFERENCE_MAX_WORKERS: int = int(
+    os.getenv("INFERENCE_MAX_WORKERS", min(4, os.cpu_count() or 1)))
+INFERENCE_MAX_QUEUED: int = int(os.getenv("INFERENCE_MAX_QUEUED", 256))
+TRAINING_MAX_WORKERS: int = int(os.getenv("TRAINING_MAX_WORKERS", 1))
+# Uploads hold their slot until the client has read the whole response, they
+# get their own threads so that slow clients cannot starve the prediction routes
+UPLOAD_MAX_WORKERS: int = int(os.getenv("UPLOAD_MAX_WORKERS", 2))
+
+# Batch Prediction Configs, offline scoring of a whole collection
+BATCH_PREDICTION_CHUNK_SIZE: int = int(
+    os.getenv("BATCH_PREDICTION_CHUNK_SIZE", 10000))
+BATCH_PREDICTION_WORKERS: int = int(
+    os.getenv("BATCH_PREDICTION_WORKERS", os.cpu_count() or 1))
@@ -1,17 +1,23 @@
 from dataclasses import dataclass
+from typing import Optional
 
 
 @dataclass
 class DataIngestionArtifact:
     trainFilePath: str
     testFilePath: str
+    # Stage cache fingerprint of the inputs the artifact was produced from
+    fingerprint: Optional[str] = None
 
 
 @dataclass
 class DataValidationArtifact:
     validationStatus: bool
     message: str
-    driftReportFilePath: str
+    # Only set once the drift stage wrote its report
+    driftReportFilePath: Optional[str] = None
+    # Stage cache fingerprint of the inputs the artifact was produced from
+    fingerprint: Optional[str] = None
 
 
 @dataclass
@@ -19,6 +25,8 @@ class DataTransformationArtifact:
     transformedObjectFilePath: str
     transformedTrainFilePath: str
     transformedTestFilePath: str
+    # Stage cache fingerprint of the inputs the artifact was produced from
+    fingerprint: Optional[str] = None
 
 
 @dataclass
@@ -27,12 +35,25 @@ class ClassificationMetricArtifact:
     f1_score: float
     precision_score: float
     recall_score: float
+    # Serving cost measured by the trainer, None for metrics computed elsewhere
+    row_latency_ms: Optional[float] = None
+    batch_latency_ms: Optional[float] = None
+    model_size_bytes: Optional[int] = None
 
 
 @dataclass
 class ModelTrainerArtifact:
     trainedModelFilePath: str
     metricArtifact: ClassificationMetricArtifact
+    # Stage cache fingerprint of the inputs the artifact was produced from
+    fingerprint: Optional[str] = None
+
+
+@dataclass
+class ProductionModelScoreArtifact:
+    s3ModelPath: str
+    # F1 score of the production model on the test set, None without one in s3
+    f1Score: Optional[float]
 
 
 @dataclass
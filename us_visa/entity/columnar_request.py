@@ -0,0 +1,84 @@
+import sys
+from typing import Any, Dict, List, Mapping, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from us_visa.constants import SCHEMA_FILE_PATH
+from us_visa.exception import USvisaException
+from us_visa.utils.main_utils import read_yaml_file
+
+
+class ColumnarRequestBuilder:
+    """
+    Writes validated request fields straight into typed numpy column buffers,
+    one buffer per model input column in schema order, so that no intermediate
+    dict or DataFrame is built between the request and the preprocessor
+    """
+
+    def __init__(self, schemaFilePath: str = SCHEMA_FILE_PATH):
+        try:
+            schemaConfig = read_yaml_file(file_path=schemaFilePath)
+
+            self.categoricalColumns: List[str] = list(dict.fromkeys(
+                schemaConfig["oh_columns"] + schemaConfig["or_columns"]
+            ))
+            self.numericalColumns: List[str] = list(dict.fromkeys(
+                schemaConfig["num_features"] + schemaConfig["transform_columns"]
+            ))
+            self.columns: List[str] = self.categoricalColumns + self.numericalColumns
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def build(self, records: Sequence[Any]) -> Dict[str, np.ndarray]:
+        """
+        :param records: Pydantic forms, dataclasses or mappings holding the input columns
+        :return: Column name to buffer of length len(records)
+        """
+        try:
+            nRows = len(records)
+            categorical = [np.empty(nRows, dtype=object) for _ in self.categoricalColumns]
+            numerical = [np.empty(nRows, dtype=np.float64) for _ in self.numericalColumns]
+
+            for row, record in enumerate(records):
+                get = record.get if isinstance(record, Mapping) else record.__getattribute__
+
+                for buffer, column in zip(categorical, self.categoricalColumns):
+                    buffer[row] = get(column)
+
+                for buffer, column in zip(numerical, self.numericalColumns):
+                    value = get(column)
+                    buffer[row] = np.nan if value is None else value
+
+            return dict(zip(self.columns, categorical + numerical))
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def build_from_frame(self, dataFrame: pd.DataFrame) -> Dict[str, np.ndarray]:
+        """
+        Same buffers as build, taken column by column from a parsed DataFrame
+        """
+        try:
+            missingColumns = [column for column in self.columns if column not in dataFrame]
+            if missingColumns:
+                raise ValueError(f"Missing input columns: {missingColumns}")
+
+            columns = {column: dataFrame[column].to_numpy(dtype=object)
+                       for column in self.categoricalColumns}
+            for column in self.numericalColumns:
+                columns[column] = pd.to_numeric(dataFrame[column]).to_numpy(
+                    dtype=np.float64, na_value=np.nan)
+
+            return columns
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def build_key(self, record: Any) -> Tuple:
+        """
+        Normalized feature tuple of a record, numbers compare equal whether
+        they were sent as int or float
+        """
+        get = record.get if isinstance(record, Mapping) else record.__getattribute__
+        return tuple(get(column) for column in self.categoricalColumns) + tuple(
+            None if get(column) is None else float(get(column)) for column in self.numericalColumns
+        )
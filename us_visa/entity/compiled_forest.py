@@ -0,0 +1,171 @@
+import sys
+from typing import Optional
+
+import numpy as np
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+
+class CompiledForest:
+    """
+    Flat-array export of a fitted RandomForestClassifier (or ExtraTreesClassifier),
+    evaluated with a handful of vectorized numpy operations per tree level
+    instead of the per-tree joblib dispatch of forest.predict, which dominates
+    the latency of single-row and small-batch predictions.
+
+    The nodes of all trees are concatenated into contiguous arrays. Leaves
+    point back to themselves, so every row walks down all trees at once for
+    maxDepth steps. The evaluation repeats what sklearn does: inputs are cast
+    to float32 before comparison, the leaf class fractions are summed tree by
+    tree in fitting order and divided by the number of trees, so predictions
+    are identical to forest.predict.
+    """
+
+    def __init__(self,
+                 feature: np.ndarray,
+                 threshold: np.ndarray,
+                 left: np.ndarray,
+                 right: np.ndarray,
+                 missingLeft: np.ndarray,
+                 value: np.ndarray,
+                 roots: np.ndarray,
+                 maxDepth: int,
+                 nFeatures: int,
+                 classes: np.ndarray,
+                 ):
+        """
+        :param feature: Feature compared at every node, 0 for leaves
+        :param threshold: Threshold compared at every node
+        :param left: Global index of the left child of every node, the node itself for leaves
+        :param right: Global index of the right child of every node, the node itself for leaves
+        :param missingLeft: Whether nan inputs go to the left child at every node
+        :param value: (nNodes, nClasses) class fractions of every node
+        :param roots: Global index of the root of every tree
+        :param maxDepth: Depth of the deepest tree
+        :param nFeatures: Width of the input feature vector
+        :param classes: Class label of every column of value
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missingLeft = missingLeft
+        self.value = value
+        self.roots = roots
+        self.maxDepth = maxDepth
+        self.nFeatures = nFeatures
+        self.classes = classes
+
+    @classmethod
+    def from_forest(cls, forest: RandomForestClassifier) -> "CompiledForest":
+        """
+        Export a fitted forest, raises ValueError for forests that cannot be
+        reproduced exactly
+        """
+        if not isinstance(forest, (RandomForestClassifier, ExtraTreesClassifier)):
+            raise ValueError(f"Unsupported model {type(forest).__name__}")
+        if forest.n_outputs_ != 1:
+            raise ValueError("Unsupported multi-output forest")
+
+        nClasses = int(forest.n_classes_)
+        features, thresholds, lefts, rights, missingLefts, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            isLeaf = tree.children_left < 0
+            nodes = np.arange(tree.node_count)
+
+            roots.append(offset)
+            features.append(np.where(isLeaf, 0, tree.feature))
+            thresholds.append(tree.threshold)
+            lefts.append(np.where(isLeaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(isLeaf, nodes, tree.children_right) + offset)
+            missingLeft = getattr(tree, "missing_go_to_left", None)
+            missingLefts.append(np.zeros(tree.node_count, dtype=bool) if missingLeft is None
+                                else np.asarray(missingLeft, dtype=bool))
+            values.append(tree.value[:, 0, :nClasses])
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.intp),
+            right=np.concatenate(rights).astype(np.intp),
+            missingLeft=np.concatenate(missingLefts),
+            value=np.ascontiguousarray(np.concatenate(values), dtype=np.float64),
+            roots=np.asarray(roots, dtype=np.intp),
+            maxDepth=max(estimator.tree_.max_depth for estimator in forest.estimators_),
+            nFeatures=int(forest.n_features_in_),
+            classes=forest.classes_,
+        )
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """
+        :return: (nTrees, nRows) global index of the leaf reached in every tree
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.nFeatures:
+            raise ValueError(
+                f"X has shape {X.shape}, the forest expects {self.nFeatures} features")
+
+        flat = X.ravel()
+        rowStart = (np.arange(X.shape[0], dtype=np.intp) * self.nFeatures)[np.newaxis, :]
+        node = np.repeat(self.roots[:, np.newaxis], X.shape[0], axis=1)
+        hasNan = np.isnan(flat).any()
+
+        for _ in range(self.maxDepth):
+            # float32 inputs against float64 thresholds, as in the sklearn tree
+            values = flat[rowStart + self.feature[node]]
+            goLeft = values <= self.threshold[node]
+            if hasNan:
+                goLeft |= np.isnan(values) & self.missingLeft[node]
+            node = np.where(goLeft, self.left[node], self.right[node])
+
+        return node
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        try:
+            leafValues = self.value[self.apply(X)]
+            # cumsum adds the trees one after the other, in the same order and
+            # therefore with the same rounding as the forest's accumulation
+            proba = np.cumsum(leafValues, axis=0)[-1]
+            proba /= len(self.roots)
+            return proba
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+    def sample_features(self, nRows: int = 256, seed: int = 42) -> np.ndarray:
+        """
+        Build inputs sitting on and right next to the split thresholds of the
+        forest, where a rounding difference would change the path taken
+        """
+        rng = np.random.default_rng(seed)
+        isSplit = self.left != np.arange(len(self.left))
+        splitFeatures = self.feature[isSplit]
+        splitThresholds = self.threshold[isSplit]
+
+        X = rng.normal(size=(nRows, self.nFeatures))
+        for column in range(self.nFeatures):
+            thresholds = splitThresholds[splitFeatures == column]
+            if len(thresholds) == 0:
+                continue
+            picked = rng.choice(thresholds, nRows)
+            X[:, column] = picked + rng.choice([-1e-7, 0.0, 1e-7], nRows) * np.abs(picked)
+        return X
+
+    def matches(self, forest: RandomForestClassifier, X: Optional[np.ndarray] = None) -> bool:
+        """
+        Check that probabilities and predictions are identical to the forest
+        """
+        try:
+            X = self.sample_features() if X is None else X
+            return np.array_equal(self.predict_proba(X), forest.predict_proba(X)) \
+                and np.array_equal(self.predict(X), forest.predict(X))
+        except Exception as e:
+            logging.info(f"Compiled forest parity check failed: {e}")
+            return False
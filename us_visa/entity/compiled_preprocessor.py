@@ -0,0 +1,300 @@
+import sys
+import threading
+from typing import Any, Dict, List, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.compose import ColumnTransformer
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, PowerTransformer, StandardScaler
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+
+class CompiledPreprocessor:
+    """
+    Numpy-only replacement of the fitted ColumnTransformer built by
+    DataTransformation, meant for the serving path where pandas and sklearn
+    dispatch cost far more than the arithmetic on a handful of rows.
+
+    Categorical columns are encoded through precomputed category-to-index
+    lookup tables. Numeric columns of the Yeo-Johnson and StandardScaler blocks
+    share one vector of means and one of scales, so both are standardized in
+    a single pass. The output is bit-identical to preprocessor.transform.
+    """
+
+    def __init__(self,
+                 nFeatures: int,
+                 oneHotColumns: List[Tuple[str, Dict[Any, int], int]],
+                 ordinalColumns: List[Tuple[str, Dict[Any, int], int]],
+                 numericColumns: List[str],
+                 numericOffsets: np.ndarray,
+                 lambdas: np.ndarray,
+                 mean: np.ndarray,
+                 scale: np.ndarray,
+                 ):
+        """
+        :param nFeatures: Width of the transformed feature vector
+        :param oneHotColumns: (column, category lookup, output offset) per one-hot encoded column
+        :param ordinalColumns: (column, category lookup, output offset) per ordinal encoded column
+        :param numericColumns: Source column of every numeric output
+        :param numericOffsets: Output position of every numeric output
+        :param lambdas: Yeo-Johnson lambda per numeric output, nan when not power transformed
+        :param mean: Mean subtracted from every numeric output
+        :param scale: Scale dividing every numeric output
+        """
+        self.nFeatures = nFeatures
+        self.oneHotColumns = oneHotColumns
+        self.ordinalColumns = ordinalColumns
+        self.numericColumns = numericColumns
+        self.numericOffsets = numericOffsets
+        self.lambdas = lambdas
+        self.mean = mean
+        self.scale = scale
+        self._powerIndices = np.flatnonzero(~np.isnan(lambdas))
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @property
+    def input_columns(self) -> List[str]:
+        columns = [column for column, _, _ in self.oneHotColumns + self.ordinalColumns]
+        return list(dict.fromkeys(columns + self.numericColumns))
+
+    @classmethod
+    def from_column_transformer(cls, preprocessor: ColumnTransformer) -> "CompiledPreprocessor":
+        """
+        Export a fitted ColumnTransformer, raises ValueError for any layout
+        that cannot be reproduced exactly
+        """
+        if getattr(preprocessor, "sparse_output_", False):
+            raise ValueError("Unsupported sparse output")
+
+        oneHotColumns, ordinalColumns = [], []
+        numericColumns, numericOffsets, lambdas, mean, scale = [], [], [], [], []
+        offset = 0
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop" or len(columns) == 0:
+                continue
+            if transformer == "passthrough":
+                raise ValueError(f"Unsupported passthrough block: {name}")
+
+            if isinstance(transformer, Pipeline):
+                if len(transformer.steps) != 1:
+                    raise ValueError(f"Unsupported multi-step pipeline: {name}")
+                transformer = transformer.steps[0][1]
+
+            if isinstance(transformer, (OneHotEncoder, OrdinalEncoder)):
+                lookups = cls._get_category_lookups(transformer)
+                if isinstance(transformer, OneHotEncoder):
+                    if transformer.drop is not None or transformer.handle_unknown != "error":
+                        raise ValueError(f"Unsupported OneHotEncoder options: {name}")
+                    for column, lookup in zip(columns, lookups):
+                        oneHotColumns.append((column, lookup, offset))
+                        offset += len(lookup)
+                else:
+                    if transformer.handle_unknown != "error":
+                        raise ValueError(f"Unsupported OrdinalEncoder options: {name}")
+                    for column, lookup in zip(columns, lookups):
+                        ordinalColumns.append((column, lookup, offset))
+                        offset += 1
+
+            elif isinstance(transformer, PowerTransformer):
+                if transformer.method != "yeo-johnson":
+                    raise ValueError(f"Unsupported power transform method: {name}")
+                scaler = transformer._scaler if transformer.standardize else None
+                blockMean, blockScale = cls._get_scaling(scaler, len(columns))
+                numericColumns += list(columns)
+                lambdas += list(transformer.lambdas_)
+                mean += blockMean
+                scale += blockScale
+                numericOffsets += range(offset, offset + len(columns))
+                offset += len(columns)
+
+            elif isinstance(transformer, StandardScaler):
+                blockMean, blockScale = cls._get_scaling(transformer, len(columns))
+                numericColumns += list(columns)
+                lambdas += [np.nan] * len(columns)
+                mean += blockMean
+                scale += blockScale
+                numericOffsets += range(offset, offset + len(columns))
+                offset += len(columns)
+
+            else:
+                raise ValueError(
+                    f"Unsupported transformer {type(transformer).__name__}: {name}")
+
+        return cls(
+            nFeatures=offset,
+            oneHotColumns=oneHotColumns,
+            ordinalColumns=ordinalColumns,
+            numericColumns=numericColumns,
+            numericOffsets=np.array(numericOffsets, dtype=np.intp),
+            lambdas=np.array(lambdas, dtype=np.float64),
+            mean=np.array(mean, dtype=np.float64),
+            scale=np.array(scale, dtype=np.float64),
+        )
+
+    @staticmethod
+    def _get_category_lookups(encoder) -> List[Dict[Any, int]]:
+        lookups = []
+        for categories in encoder.categories_:
+            if pd.isna(categories).any():
+                raise ValueError("Unsupported missing value category")
+            lookups.append({category: index for index,
+                           category in enumerate(categories.tolist())})
+        return lookups
+
+    @staticmethod
+    def _get_scaling(scaler, width: int) -> Tuple[List[float], List[float]]:
+        # Subtracting 0.0 and dividing by 1.0 leave the values untouched
+        blockMean = [0.0] * width
+        blockScale = [1.0] * width
+        if scaler is not None and scaler.with_mean:
+            blockMean = list(scaler.mean_)
+        if scaler is not None and scaler.with_std:
+            blockScale = list(scaler.scale_)
+        return blockMean, blockScale
+
+    @staticmethod
+    def _yeo_johnson(x: np.ndarray, lmbda: float) -> np.ndarray:
+        # Mirrors PowerTransformer._yeo_johnson_transform operation by operation
+        # so that results match to the last bit
+        out = np.zeros_like(x)
+        pos = x >= 0
+
+        if abs(lmbda) < np.spacing(1.0):
+            out[pos] = np.log1p(x[pos])
+        else:
+            out[pos] = (np.power(x[pos] + 1, lmbda) - 1) / lmbda
+
+        if abs(lmbda - 2) > np.spacing(1.0):
+            out[~pos] = -(np.power(-x[~pos] + 1, 2 - lmbda) - 1) / (2 - lmbda)
+        else:
+            out[~pos] = -np.log1p(-x[~pos])
+
+        return out
+
+    @staticmethod
+    def _encode(column: str, values: np.ndarray, lookup: Dict[Any, int]) -> np.ndarray:
+        codes = np.fromiter((lookup.get(value, -1) for value in values),
+                            dtype=np.intp, count=len(values))
+        if (codes < 0).any():
+            unknown = sorted({str(value) for value in values if value not in lookup})
+            raise ValueError(
+                f"Found unknown categories {unknown} in column {column} during transform")
+        return codes
+
+    def _scale_numeric(self, numeric: np.ndarray) -> np.ndarray:
+        for index in self._powerIndices:
+            numeric[:, index] = self._yeo_johnson(numeric[:, index], self.lambdas[index])
+        numeric -= self.mean
+        numeric /= self.scale
+        return numeric
+
+    def transform(self, columns: Mapping[str, Any]) -> np.ndarray:
+        """
+        Transform a batch given as a DataFrame or a mapping of column name to values
+        """
+        try:
+            nRows = len(columns[self.numericColumns[0]])
+            out = np.zeros((nRows, self.nFeatures), dtype=np.float64)
+            rows = np.arange(nRows)
+
+            for column, lookup, offset in self.oneHotColumns:
+                codes = self._encode(column, np.asarray(columns[column]), lookup)
+                out[rows, offset + codes] = 1.0
+
+            for column, lookup, offset in self.ordinalColumns:
+                out[:, offset] = self._encode(column, np.asarray(columns[column]), lookup)
+
+            numeric = np.empty((nRows, len(self.numericColumns)), dtype=np.float64)
+            for index, column in enumerate(self.numericColumns):
+                numeric[:, index] = np.asarray(columns[column], dtype=np.float64)
+
+            out[:, self.numericOffsets] = self._scale_numeric(numeric)
+
+            return out
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def transform_row(self, record: Mapping[str, Any]) -> np.ndarray:
+        """
+        Transform a single record into a (1, nFeatures) vector.
+        The vector is preallocated per thread and overwritten by the next call
+        on the same thread, consume or copy it before transforming another row.
+        """
+        try:
+            out = getattr(self._local, "out", None)
+            if out is None:
+                out = self._local.out = np.zeros((1, self.nFeatures), dtype=np.float64)
+            else:
+                out.fill(0.0)
+
+            for column, lookup, offset in self.oneHotColumns:
+                out[0, offset + self._row_code(column, record[column], lookup)] = 1.0
+
+            for column, lookup, offset in self.ordinalColumns:
+                out[0, offset] = self._row_code(column, record[column], lookup)
+
+            numeric = np.array([[record[column] for column in self.numericColumns]],
+                               dtype=np.float64)
+            out[0, self.numericOffsets] = self._scale_numeric(numeric)[0]
+
+            return out
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    @staticmethod
+    def _row_code(column: str, value: Any, lookup: Dict[Any, int]) -> int:
+        code = lookup.get(value)
+        if code is None:
+            raise ValueError(
+                f"Found unknown categories ['{value}'] in column {column} during transform")
+        return code
+
+    def sample_frame(self, nRows: int = 64, seed: int = 42) -> pd.DataFrame:
+        """
+        Build a frame that covers every known category together with a spread
+        of numeric values, used to check parity against the original preprocessor
+        """
+        rng = np.random.default_rng(seed)
+        data = {}
+        for column, lookup, _ in self.oneHotColumns + self.ordinalColumns:
+            categories = list(lookup)
+            data[column] = [categories[index % len(categories)] for index in range(nRows)]
+
+        for column in dict.fromkeys(self.numericColumns):
+            data[column] = np.concatenate([
+                [0.0, 1.0], rng.lognormal(mean=6, sigma=3, size=nRows - 2)
+            ])
+
+        return pd.DataFrame(data)
+
+    def matches(self, preprocessor: ColumnTransformer, dataframe: pd.DataFrame) -> bool:
+        """
+        Check that the compiled output is identical to preprocessor.transform,
+        both for the batch and for the single-row path
+        """
+        try:
+            expected = np.asarray(preprocessor.transform(dataframe), dtype=np.float64)
+            if not np.array_equal(self.transform(dataframe), expected, equal_nan=True):
+                return False
+
+            records = dataframe.to_dict(orient="records")
+            return all(
+                np.array_equal(self.transform_row(record)[0], row, equal_nan=True)
+                for record, row in zip(records, expected)
+            )
+        except Exception as e:
+            logging.info(f"Compiled preprocessor parity check failed: {e}")
+            return False
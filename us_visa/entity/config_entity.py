@@ -1,73 +1,160 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 import os
+import uuid
 from typing import Optional
 
 from us_visa.constants import *
 
-TIMESTAMP: str = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+
+def new_run_id() -> str:
+    return uuid.uuid4().hex[:12]
 
 
 @dataclass
 class TrainingPipelineConfig:
+    """
+    Workspace of one training run, every run gets its own artifactDir so that
+    pipelines running at the same time never share files
+    """
     pipelineName: str = PIPELINE_NAME
-    artifactDir: str = os.path.join(ARTIFACT_DIR, TIMESTAMP)
-    timestamp: str = TIMESTAMP
-
+    runId: str = field(default_factory=new_run_id)
+    timestamp: str = field(
+        default_factory=lambda: datetime.now().strftime("%d_%m_%Y_%H_%M_%S"))
+    # Defaults to artifact/<timestamp>_<runId>
+    artifactDir: Optional[str] = None
 
-trainingPipelineConfig: TrainingPipelineConfig = TrainingPipelineConfig()
+    def __post_init__(self):
+        if self.artifactDir is None:
+            self.artifactDir = os.path.join(
+                ARTIFACT_DIR, f"{self.timestamp}_{self.runId}")
 
 
 @dataclass
 class DataIngestionConfig:
+    trainingPipelineConfig: TrainingPipelineConfig = field(
+        default_factory=TrainingPipelineConfig)
     trainTestSplitRatio: float = TRAIN_TEST_SPLIT_RATIO
     collectionName: str = MONGO_DB_COLLECTION
-    dataIngestionDir: str = os.path.join(
-        trainingPipelineConfig.artifactDir, DATA_INGESTION_DIR_NAME)
-    featureStorePath: str = os.path.join(
-        dataIngestionDir, DATA_INGESTION_FEATURE_STORE_DIR, FILE_NAME)
-    trainFilePath: str = os.path.join(
-        dataIngestionDir, DATA_INGESTION_INGESTED_DIR, TRAIN_FILE_NAME)
-    testFilePath: str = os.path.join(
-        dataIngestionDir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
+    # Paths default to the run workspace
+    dataIngestionDir: Optional[str] = None
+    featureStorePath: Optional[str] = None
+    trainFilePath: Optional[str] = None
+    testFilePath: Optional[str] = None
+
+    def __post_init__(self):
+        self.dataIngestionDir = self.dataIngestionDir or os.path.join(
+            self.trainingPipelineConfig.artifactDir, DATA_INGESTION_DIR_NAME)
+        self.featureStorePath = self.featureStorePath or os.path.join(
+            self.dataIngestionDir, DATA_INGESTION_FEATURE_STORE_DIR, FILE_NAME)
+        self.trainFilePath = self.trainFilePath or os.path.join(
+            self.dataIngestionDir, DATA_INGESTION_INGESTED_DIR, TRAIN_FILE_NAME)
+        self.testFilePath = self.testFilePath or os.path.join(
+            self.dataIngestionDir, DATA_INGESTION_INGESTED_DIR, TEST_FILE_NAME)
 
 
 @dataclass
 class DataValidationConfig:
-    dataValidationDir: str = os.path.join(
-        trainingPipelineConfig.artifactDir, DATA_VALIDATION_DIR_NAME
-    )
-    driftReportFilePath: str = os.path.join(
-        dataValidationDir, DATA_VALIDATION_DRIFT_REPORT_DIR, DATA_VALIDATION_DRIFT_REPORT_FILE_NAME
-    )
+    trainingPipelineConfig: TrainingPipelineConfig = field(
+        default_factory=TrainingPipelineConfig)
+    dataValidationDir: Optional[str] = None
+    driftReportFilePath: Optional[str] = None
+
+    def __post_init__(self):
+        self.dataValidationDir = self.dataValidationDir or os.path.join(
+            self.trainingPipelineConfig.artifactDir, DATA_VALIDATION_DIR_NAME
+        )
+        self.driftReportFilePath = self.driftReportFilePath or os.path.join(
+            self.dataValidationDir, DATA_VALIDATION_DRIFT_REPORT_DIR, DATA_VALIDATION_DRIFT_REPORT_FILE_NAME
+        )
 
 
 @dataclass
 class DataTransformationConfig:
-    dataTransformationDir: str = os.path.join(
-        trainingPipelineConfig.artifactDir, DATA_TRANSFORMATION_DIR_NAME
-    )
-    transformedObjectFilePath: str = os.path.join(
-        dataTransformationDir, DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR, PREPROCSSING_OBJECT_FILE_NAME
-    )
-    transformedTrainFilePath: str = os.path.join(
-        dataTransformationDir, TRAIN_FILE_NAME.replace("csv", 'npy')
-    )
-    transformedTestFilePath: str = os.path.join(
-        dataTransformationDir, TEST_FILE_NAME.replace("csv", 'npy')
-    )
+    trainingPipelineConfig: TrainingPipelineConfig = field(
+        default_factory=TrainingPipelineConfig)
+    dataTransformationDir: Optional[str] = None
+    transformedObjectFilePath: Optional[str] = None
+    transformedTrainFilePath: Optional[str] = None
+    transformedTestFilePath: Optional[str] = None
+
+    def __post_init__(self):
+        self.dataTransformationDir = self.dataTransformationDir or os.path.join(
+            self.trainingPipelineConfig.artifactDir, DATA_TRANSFORMATION_DIR_NAME
+        )
+        self.transformedObjectFilePath = self.transformedObjectFilePath or os.path.join(
+            self.dataTransformationDir, DATA_TRANSFORMATION_TRANSFORMED_OBJECT_DIR, PREPROCSSING_OBJECT_FILE_NAME
+        )
+        self.transformedTrainFilePath = self.transformedTrainFilePath or os.path.join(
+            self.dataTransformationDir, TRAIN_FILE_NAME.replace("csv", 'npy')
+        )
+        self.transformedTestFilePath = self.transformedTestFilePath or os.path.join(
+            self.dataTransformationDir, TEST_FILE_NAME.replace("csv", 'npy')
+        )
 
 
 @dataclass
 class ModelTrainerConfig:
-    modelTrainerDir: str = os.path.join(
-        trainingPipelineConfig.artifactDir, MODEL_TRAINER_DIR_NAME
-    )
-    trainedModelFilePath: str = os.path.join(
-        modelTrainerDir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME
-    )
+    trainingPipelineConfig: TrainingPipelineConfig = field(
+        default_factory=TrainingPipelineConfig)
+    modelTrainerDir: Optional[str] = None
+    trainedModelFilePath: Optional[str] = None
     expectedAccuracy: float = MODEL_TRAINER_EXPECTED_SCORE
     modelConfigFilePath: str = MODEL_TRAINER_MODEL_CONFIG_FILE_PATH
+    modelArtifactFormat: str = MODEL_ARTIFACT_FORMAT
+    modelArtifactCompression: Optional[str] = MODEL_ARTIFACT_COMPRESSION or None
+
+    def __post_init__(self):
+        self.modelTrainerDir = self.modelTrainerDir or os.path.join(
+            self.trainingPipelineConfig.artifactDir, MODEL_TRAINER_DIR_NAME
+        )
+        self.trainedModelFilePath = self.trainedModelFilePath or os.path.join(
+            self.modelTrainerDir, MODEL_TRAINER_TRAINED_MODEL_DIR, MODEL_FILE_NAME
+        )
+
+
+@dataclass
+class ModelSearchConfig:
+    """
+    search section of the model config
+    """
+    engine: str = "parallel"
+    workers: int = 0
+    strategy: str = "grid"
+    # Successive halving settings, see ParallelModelSearch
+    factor: int = 3
+    resource: str = "n_samples"
+    min_resources: int = 0
+    max_resources: int = 0
+    max_fits: int = 0
+    max_seconds: float = 0
+
+    def __post_init__(self):
+        if self.engine not in ("parallel", "model_factory"):
+            raise ValueError(f"Unknown model search engine: {self.engine}")
+        if self.strategy not in ("grid", "halving"):
+            raise ValueError(f"Unknown model search strategy: {self.strategy}")
+        if self.strategy == "halving" and self.engine != "parallel":
+            raise ValueError("The halving strategy needs the parallel engine")
+        if self.factor < 2:
+            raise ValueError("The halving factor must be at least 2")
+
+
+@dataclass
+class ServingBudget:
+    """
+    serving_budget section of the model config, None leaves a limit unchecked
+    """
+    policy: str = "reject"
+    penalty: float = 0.05
+    max_row_latency_ms: Optional[float] = None
+    max_batch_latency_ms: Optional[float] = None
+    batch_size: int = 1000
+    max_model_size_mb: Optional[float] = None
+
+    def __post_init__(self):
+        if self.policy not in ("reject", "penalize"):
+            raise ValueError(f"Unknown serving budget policy: {self.policy}")
 
 
 @dataclass
@@ -89,6 +176,19 @@ class USVisaPredictConfig:
     model_bucket_name: str = MODEL_BUCKET_NAME
 
 
+@dataclass
+class BatchPredictionConfig:
+    collectionName: str = MONGO_DB_COLLECTION
+    databaseName: Optional[str] = None
+    outputFilePath: Optional[str] = None
+    outputCollectionName: Optional[str] = None
+    chunkSize: int = BATCH_PREDICTION_CHUNK_SIZE
+    workers: int = BATCH_PREDICTION_WORKERS
+    model_file_path: str = MODEL_FILE_NAME
+    model_bucket_name: str = MODEL_BUCKET_NAME
+    localModelFilePath: Optional[str] = None
+
+
 @dataclass
 class PredictConfig:
     continent: Optional[str] = None
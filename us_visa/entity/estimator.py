@@ -1,11 +1,23 @@
 from dataclasses import dataclass
 import sys
+from typing import Mapping, Optional
 
+import numpy as np
 from pandas import DataFrame
 from sklearn.pipeline import Pipeline
 
+from us_visa.constants import (COMPILED_FOREST_MAX_ROWS,
+                               KNN_INDEX_MAX_PROBE,
+                               KNN_INDEX_MIN_RECALL,
+                               KNN_INDEX_MODE,
+                               KNN_INDEX_N_LISTS,
+                               KNN_INDEX_N_PROBE,
+                               )
+from us_visa.entity.compiled_forest import CompiledForest
+from us_visa.entity.compiled_preprocessor import CompiledPreprocessor
+from us_visa.entity.knn_index import KNNIndex
 from us_visa.exception import USvisaException
-from us_visa.logger import logging
+from us_visa.logger import logging, servingLogger
 
 
 class TargetValueMapping:
@@ -29,6 +41,120 @@ class USvisaModel:
         """
         self.preprocessing_object = preprocessing_object
         self.trained_model_object = trained_model_object
+        self.compiled_preprocessor: Optional[CompiledPreprocessor] = None
+        self.compiled_forest: Optional[CompiledForest] = None
+        # Built at training time and saved with the model, unlike the compiled objects
+        self.knn_index: Optional[KNNIndex] = None
+        self.knn_search_mode: Optional[str] = None
+
+    def __getstate__(self) -> dict:
+        # Compiled objects are rebuilt by compile() after loading
+        state = self.__dict__.copy()
+        state.update(compiled_preprocessor=None, compiled_forest=None, knn_search_mode=None)
+        return state
+
+    def compile(self) -> None:
+        """
+        Compile the preprocessor and, depending on the trained model, the forest
+        or the KNN index search
+        """
+        self.compile_preprocessor()
+        self.compile_forest()
+        self.compile_knn()
+
+    def build_knn_index(self, sampleFeatures: np.ndarray) -> bool:
+        """
+        Build the KNNIndex of a trained KNeighborsClassifier, probing as many
+        clusters as the approximate search needs to reach KNN_INDEX_MIN_RECALL
+        on the sample. Nothing is built with KNN_INDEX_MODE "off".
+        """
+        if KNN_INDEX_MODE == "off":
+            self.knn_index = None
+            return False
+        try:
+            index = KNNIndex.from_classifier(
+                self.trained_model_object, nLists=KNN_INDEX_N_LISTS, nProbe=KNN_INDEX_N_PROBE)
+            recall = index.tune_n_probe(
+                sampleFeatures[:1000], minRecall=KNN_INDEX_MIN_RECALL, maxProbe=KNN_INDEX_MAX_PROBE)
+            logging.info(
+                f"KNN index approximate recall@{index.nNeighbors} with "
+                f"{index.nProbe}/{index.nLists} clusters probed: {recall:.4f}")
+
+            self.knn_index = index
+            return True
+
+        except Exception as e:
+            logging.info(f"No KNN index built: {e}")
+            self.knn_index = None
+            return False
+
+    def compile_knn(self) -> bool:
+        """
+        With KNN_INDEX_MODE "approximate", serve a KNeighborsClassifier through
+        the approximate search of its KNNIndex, whose cost grows with the square
+        root of the training set instead of linearly, provided its recall
+        reached KNN_INDEX_MIN_RECALL. Otherwise predictions keep the exact
+        search of the classifier.
+        """
+        index = getattr(self, "knn_index", None)
+        self.knn_search_mode = None
+        if index is None or KNN_INDEX_MODE != "approximate":
+            return False
+
+        if index.recall is None or index.recall < KNN_INDEX_MIN_RECALL:
+            logging.info(
+                f"Keeping the sklearn neighbor search, KNN index recall {index.recall} "
+                f"is below {KNN_INDEX_MIN_RECALL}")
+            return False
+
+        self.knn_search_mode = "approximate"
+        logging.info(f"Serving predictions with the approximate KNN index search "
+                     f"(recall {index.recall:.4f}, {index.nProbe}/{index.nLists} clusters probed)")
+        return True
+
+    def compile_preprocessor(self) -> bool:
+        """
+        Export the fitted preprocessor into a numpy-only CompiledPreprocessor and
+        use it for predictions, provided its output is identical to the original.
+        Models pickled before this existed are compiled after loading.
+        """
+        try:
+            compiled = CompiledPreprocessor.from_column_transformer(
+                self.preprocessing_object)
+            if not compiled.matches(self.preprocessing_object, compiled.sample_frame()):
+                raise ValueError("output differs from the preprocessor")
+
+            self.compiled_preprocessor = compiled
+            logging.info("Serving predictions with the compiled preprocessor")
+            return True
+
+        except Exception as e:
+            logging.info(f"Keeping the sklearn preprocessor, cannot compile it: {e}")
+            self.compiled_preprocessor = None
+            return False
+
+    def compile_forest(self) -> bool:
+        """
+        Export a trained random forest into a flat-array CompiledForest, used for
+        batches of up to COMPILED_FOREST_MAX_ROWS rows, provided its predictions
+        are identical to the forest's
+        """
+        try:
+            if COMPILED_FOREST_MAX_ROWS <= 0:
+                raise ValueError("disabled by COMPILED_FOREST_MAX_ROWS")
+
+            compiled = CompiledForest.from_forest(self.trained_model_object)
+            if not compiled.matches(self.trained_model_object):
+                raise ValueError("predictions differ from the forest")
+
+            self.compiled_forest = compiled
+            logging.info("Serving small batches with the compiled forest")
+            return True
+
+        except Exception as e:
+            logging.info(f"Keeping the sklearn model, cannot compile it: {e}")
+            self.compiled_forest = None
+            return False
 
     def predict(self, dataframe: DataFrame) -> DataFrame:
         """
@@ -36,20 +162,69 @@ class USvisaModel:
         which guarantees that the inputs are in the same format as the training data
         At last it performs prediction on transformed features
         """
-        logging.info("Entered predict method of UTruckModel class")
+        servingLogger.debug("Entered predict method of UTruckModel class")
+
+        try:
+            servingLogger.debug("Using the trained model to get predictions")
+
+            compiled = getattr(self, "compiled_preprocessor", None)
+            if compiled is None:
+                transformed_feature = self.preprocessing_object.transform(
+                    dataframe)
+            elif len(dataframe) == 1:
+                transformed_feature = compiled.transform_row(
+                    dataframe.iloc[0])
+            else:
+                transformed_feature = compiled.transform(dataframe)
+
+            servingLogger.debug("Used the trained model to get predictions")
+            return self._predict_transformed(transformed_feature)
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def predict_columns(self, columns: Mapping[str, np.ndarray]) -> np.ndarray:
+        """
+        Same as predict, for inputs given as one numpy buffer per column, as built
+        by ColumnarRequestBuilder. No DataFrame is built unless the preprocessor
+        could not be compiled.
+        """
+        return self.predict_features(self.transform_columns(columns))
 
+    def transform_columns(self, columns: Mapping[str, np.ndarray]) -> np.ndarray:
+        """
+        Preprocessing half of predict_columns
+        """
         try:
-            logging.info("Using the trained model to get predictions")
+            compiled = getattr(self, "compiled_preprocessor", None)
+            if compiled is None:
+                return self.preprocessing_object.transform(DataFrame(columns))
+            if len(next(iter(columns.values()))) == 1:
+                return compiled.transform_row(
+                    {column: values[0] for column, values in columns.items()})
+            return compiled.transform(columns)
 
-            transformed_feature = self.preprocessing_object.transform(
-                dataframe)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
 
-            logging.info("Used the trained model to get predictions")
-            return self.trained_model_object.predict(transformed_feature)
+    def predict_features(self, transformed_feature: np.ndarray) -> np.ndarray:
+        """
+        Model half of predict_columns, on already transformed features
+        """
+        try:
+            return self._predict_transformed(transformed_feature)
 
         except Exception as e:
             raise USvisaException(e, sys) from e
 
+    def _predict_transformed(self, transformed_feature: np.ndarray) -> np.ndarray:
+        compiled = getattr(self, "compiled_forest", None)
+        if compiled is not None and len(transformed_feature) <= COMPILED_FOREST_MAX_ROWS:
+            return compiled.predict(transformed_feature)
+        if getattr(self, "knn_search_mode", None) == "approximate":
+            return self.knn_index.predict(transformed_feature, exact=False)
+        return self.trained_model_object.predict(transformed_feature)
+
     def __repr__(self):
         return f"{type(self.trained_model_object).__name__}()"
 
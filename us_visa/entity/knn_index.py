@@ -0,0 +1,364 @@
+import sys
+from typing import Optional, Tuple
+
+import numpy as np
+from sklearn.cluster import KMeans
+from sklearn.neighbors import KNeighborsClassifier
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+
+class KNNIndex:
+    """
+    Inverted-file index over the training set of a fitted KNeighborsClassifier,
+    built at training time and pickled with the model. The training points are
+    clustered with k-means and the classifier is refitted on them ordered
+    cluster by cluster: the index references its training matrix and labels
+    instead of copying them, every cluster is a contiguous block that the model
+    artifact format memory-maps, and a query only reads the clusters it probes.
+
+    A query first scans the nProbe clusters with the nearest centroids, which
+    is the approximate mode: about sqrt(n) distances per query with the
+    default of sqrt(n) clusters, the serving path. The exact mode, used to
+    measure the recall of the approximate one, then scans every other cluster
+    whose triangle-inequality lower bound, centroid distance minus cluster
+    radius, is below the current k-th neighbor distance; on clustered data
+    that is a small fraction of the clusters.
+
+    Predictions follow KNeighborsClassifier.predict for euclidean distances,
+    uniform or distance weights, and ties between classes going to the
+    smallest class.
+    """
+
+    # Query batches up to this size scan their clusters per query instead of per cluster
+    GATHER_MAX_QUERIES: int = 16
+    # Bound of the (queries, candidates) distance matrix of the probed clusters
+    PROBE_MAX_CELLS: int = 1 << 22
+
+    def __init__(self,
+                 data: np.ndarray,
+                 squaredNorms: np.ndarray,
+                 labels: np.ndarray,
+                 offsets: np.ndarray,
+                 centroids: np.ndarray,
+                 radii: np.ndarray,
+                 classes: np.ndarray,
+                 nNeighbors: int,
+                 weights: str,
+                 nProbe: int,
+                 ):
+        """
+        :param data: (n, nFeatures) training points of the classifier, grouped by cluster
+        :param squaredNorms: Squared norm of every training point
+        :param labels: Class index of every training point
+        :param offsets: Start of every cluster in data, followed by n
+        :param centroids: (nLists, nFeatures) cluster centroids
+        :param radii: Largest distance between a cluster centroid and its points
+        :param classes: Class label of every class index
+        :param nNeighbors: Neighbors voting for a prediction
+        :param weights: "uniform" or "distance"
+        :param nProbe: Clusters scanned first, and only, in approximate mode
+        """
+        self.data = data
+        self.squaredNorms = squaredNorms
+        self.labels = labels
+        self.offsets = offsets
+        self.centroids = centroids
+        self.radii = radii
+        self.classes = classes
+        self.nNeighbors = nNeighbors
+        self.weights = weights
+        self.nProbe = nProbe
+        self.recall: Optional[float] = None
+
+    @property
+    def nLists(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def from_classifier(cls,
+                        classifier: KNeighborsClassifier,
+                        nLists: int = 0,
+                        nProbe: int = 8,
+                        seed: int = 42,
+                        ) -> "KNNIndex":
+        """
+        Build the index of a fitted classifier, raises ValueError for settings
+        it cannot reproduce. The classifier is refitted on its training set
+        reordered by cluster, which leaves its predictions unchanged up to the
+        order of neighbors tied on distance.
+
+        :param nLists: Number of clusters, 0 for sqrt of the training set size
+        """
+        if not isinstance(classifier, KNeighborsClassifier):
+            raise ValueError(f"Unsupported model {type(classifier).__name__}")
+        metric, p = classifier.effective_metric_, classifier.effective_metric_params_.get("p", 2)
+        if not (metric == "euclidean" or (metric == "minkowski" and p == 2)):
+            raise ValueError(f"Unsupported metric {metric}")
+        if classifier.weights not in ("uniform", "distance"):
+            raise ValueError(f"Unsupported weights {classifier.weights}")
+        if np.ndim(classifier._y) != 1:
+            raise ValueError("Unsupported multi-output classifier")
+
+        X = np.asarray(classifier._fit_X, dtype=np.float64)
+        nLists = nLists or max(1, int(np.sqrt(len(X))))
+        nLists = min(nLists, len(X))
+
+        kmeans = KMeans(n_clusters=nLists, n_init=1, max_iter=50, random_state=seed).fit(X)
+        assignment = kmeans.labels_
+        order = np.argsort(assignment, kind="stable")
+        classifier.fit(X[order], classifier.classes_[classifier._y[order]])
+        data = classifier._fit_X
+        centroids = np.ascontiguousarray(kmeans.cluster_centers_, dtype=np.float64)
+
+        offsets = np.zeros(nLists + 1, dtype=np.intp)
+        offsets[1:] = np.cumsum(np.bincount(assignment, minlength=nLists))
+        pointDistances = np.sqrt(((data - centroids[assignment[order]]) ** 2).sum(axis=1))
+        radii = np.zeros(nLists, dtype=np.float64)
+        np.maximum.at(radii, assignment[order], pointDistances)
+
+        logging.info(
+            f"Built KNN index of {len(X)} points in {nLists} clusters, "
+            f"largest cluster {int(np.diff(offsets).max())} points")
+
+        return cls(
+            data=data,
+            squaredNorms=(data ** 2).sum(axis=1),
+            labels=classifier._y,
+            offsets=offsets,
+            centroids=centroids,
+            radii=radii,
+            classes=classifier.classes_,
+            nNeighbors=classifier.n_neighbors,
+            weights=classifier.weights,
+            nProbe=min(nProbe, nLists),
+        )
+
+    @staticmethod
+    def _distances(Q: np.ndarray, points: np.ndarray, pointNorms: np.ndarray) -> np.ndarray:
+        squared = (Q ** 2).sum(axis=1)[:, np.newaxis] - 2 * Q @ points.T + pointNorms
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    @staticmethod
+    def _merge(rows: np.ndarray,
+               distance: np.ndarray,
+               index: np.ndarray,
+               bestDistance: np.ndarray,
+               bestIndex: np.ndarray,
+               ) -> None:
+        k = bestDistance.shape[1]
+        distance = np.concatenate([bestDistance[rows], distance], axis=1)
+        index = np.concatenate([bestIndex[rows], index], axis=1)
+
+        keep = np.argpartition(distance, k - 1, axis=1)[:, :k]
+        distance = np.take_along_axis(distance, keep, axis=1)
+        index = np.take_along_axis(index, keep, axis=1)
+        ranked = np.argsort(distance, axis=1)
+        bestDistance[rows] = np.take_along_axis(distance, ranked, axis=1)
+        bestIndex[rows] = np.take_along_axis(index, ranked, axis=1)
+
+    def _positions(self, lists: np.ndarray) -> np.ndarray:
+        """
+        Index positions of all points of the given clusters
+        """
+        starts, ends = self.offsets[lists], self.offsets[lists + 1]
+        lengths = ends - starts
+        return np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+
+    def _scan(self,
+              Q: np.ndarray,
+              queries: np.ndarray,
+              lists: np.ndarray,
+              bestDistance: np.ndarray,
+              bestIndex: np.ndarray,
+              ) -> None:
+        """
+        Merge the points of the given (query, cluster) pairs into the running
+        k nearest of every query
+        """
+        uniqueQueries = np.unique(queries)
+        if len(uniqueQueries) <= self.GATHER_MAX_QUERIES:
+            # Few queries: gather the points of all their clusters at once
+            for row in uniqueQueries:
+                positions = self._positions(lists[queries == row])
+                if len(positions) == 0:
+                    continue
+                distance = self._distances(Q[row:row + 1], self.data[positions],
+                                           self.squaredNorms[positions])
+                self._merge(np.array([row]), distance, positions[np.newaxis, :],
+                            bestDistance, bestIndex)
+            return
+
+        # Many queries: one matrix product per cluster with all queries probing it
+        order = np.argsort(lists, kind="stable")
+        queries, lists = queries[order], lists[order]
+        boundaries = np.flatnonzero(np.diff(lists)) + 1
+
+        for group in np.split(np.arange(len(lists)), boundaries):
+            if len(group) == 0:
+                continue
+            start, end = self.offsets[lists[group[0]]], self.offsets[lists[group[0]] + 1]
+            if start == end:
+                continue
+            rows = queries[group]
+
+            distance = self._distances(Q[rows], self.data[start:end], self.squaredNorms[start:end])
+            index = np.broadcast_to(np.arange(start, end), (len(rows), end - start))
+            self._merge(rows, distance, index, bestDistance, bestIndex)
+
+    def _scan_probed(self, Q: np.ndarray, probed: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        k nearest of every query among the points of its probed clusters, every
+        distance written once into a (queries, candidates) matrix and selected
+        with a single partition, instead of merged cluster by cluster
+
+        :return: Distances and positions of the k nearest, not ordered, padded
+            with position -1 at an infinite distance when the probed clusters
+            hold fewer than k points
+        """
+        k = self.nNeighbors
+        sizes = self.offsets[probed + 1] - self.offsets[probed]
+        columns = np.cumsum(sizes, axis=1) - sizes
+        width = max(int(sizes.sum(axis=1).max()), k)
+        bestDistance = np.empty((len(Q), k))
+        bestIndex = np.empty((len(Q), k), dtype=np.intp)
+
+        chunkSize = max(1, self.PROBE_MAX_CELLS // width)
+        for chunkStart in range(0, len(Q), chunkSize):
+            chunk = slice(chunkStart, chunkStart + chunkSize)
+            chunkProbed, chunkColumns = probed[chunk], columns[chunk]
+            nQueries = len(chunkProbed)
+            distance = np.full((nQueries, width), np.inf)
+            index = np.full((nQueries, width), -1, dtype=np.intp)
+
+            if nQueries <= self.GATHER_MAX_QUERIES:
+                # Few queries: gather the points of all their clusters at once
+                for row in range(nQueries):
+                    positions = self._positions(chunkProbed[row])
+                    distance[row, :len(positions)] = self._distances(
+                        Q[chunkStart + row:chunkStart + row + 1], self.data[positions],
+                        self.squaredNorms[positions])[0]
+                    index[row, :len(positions)] = positions
+            else:
+                # Many queries: one matrix product per cluster with all queries probing it
+                queries = np.repeat(np.arange(nQueries), chunkProbed.shape[1])
+                lists, starts = chunkProbed.ravel(), chunkColumns.ravel()
+                order = np.argsort(lists, kind="stable")
+                queries, lists, starts = queries[order], lists[order], starts[order]
+                boundaries = np.flatnonzero(np.diff(lists)) + 1
+                for group in np.split(np.arange(len(lists)), boundaries):
+                    start, end = self.offsets[lists[group[0]]], self.offsets[lists[group[0]] + 1]
+                    if start == end:
+                        continue
+                    rows = queries[group]
+                    cells = (rows[:, np.newaxis], starts[group][:, np.newaxis] + np.arange(end - start))
+                    distance[cells] = self._distances(
+                        Q[chunkStart + rows], self.data[start:end], self.squaredNorms[start:end])
+                    index[cells] = np.arange(start, end)
+
+            keep = np.argpartition(distance, k - 1, axis=1)[:, :k]
+            bestDistance[chunk] = np.take_along_axis(distance, keep, axis=1)
+            bestIndex[chunk] = np.take_along_axis(index, keep, axis=1)
+        return bestDistance, bestIndex
+
+    def _search(self, X: np.ndarray, exact: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Distances and positions in the classifier of the k nearest
+            training points of every row, nearest first; the approximate search
+            pads rows with position -1 at an infinite distance when its probed
+            clusters hold fewer than k points
+        """
+        try:
+            Q = np.ascontiguousarray(X, dtype=np.float64)
+            nQueries, k = len(Q), self.nNeighbors
+
+            centroidDistance = self._distances(Q, self.centroids, (self.centroids ** 2).sum(axis=1))
+            probed = np.argpartition(centroidDistance, self.nProbe - 1, axis=1)[:, :self.nProbe] \
+                if self.nProbe < self.nLists else np.tile(np.arange(self.nLists), (nQueries, 1))
+
+            bestDistance, bestIndex = self._scan_probed(Q, probed)
+
+            if exact and self.nProbe < self.nLists:
+                # _merge keeps the running k nearest sorted
+                ranked = np.argsort(bestDistance, axis=1)
+                bestDistance = np.take_along_axis(bestDistance, ranked, axis=1)
+                bestIndex = np.take_along_axis(bestIndex, ranked, axis=1)
+                lowerBound = centroidDistance - self.radii
+                candidates = lowerBound <= bestDistance[:, -1:] * (1 + 1e-9) + 1e-12
+                candidates[np.arange(nQueries)[:, np.newaxis], probed] = False
+                queries, lists = np.nonzero(candidates)
+                self._scan(Q, queries, lists, bestDistance, bestIndex)
+
+            # Exact distances of the neighbors found, ties ordered by training position
+            found = bestIndex >= 0
+            distance = np.sqrt(
+                ((Q[:, np.newaxis, :] - self.data[np.where(found, bestIndex, 0)]) ** 2).sum(axis=2))
+            distance[~found] = np.inf
+            ranked = np.lexsort((bestIndex, distance), axis=1)
+            return (np.take_along_axis(distance, ranked, axis=1),
+                    np.take_along_axis(bestIndex, ranked, axis=1))
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def kneighbors(self, X: np.ndarray, exact: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :return: Distances and positions in the fitted classifier of the k
+            nearest training points of every row, nearest first, position -1
+            for the slots the approximate search found no point for
+        """
+        return self._search(X, exact)
+
+    def predict_proba(self, X: np.ndarray, exact: bool = True) -> np.ndarray:
+        distance, position = self._search(X, exact)
+        found = position >= 0
+        labels = np.where(found, self.labels[position], 0)
+
+        if self.weights == "uniform":
+            weights = found.astype(np.float64)
+        else:
+            with np.errstate(divide="ignore"):
+                weights = 1.0 / distance
+            # Rows with a training point at distance zero only count those points
+            exactMatch = np.isinf(weights).any(axis=1)
+            weights[exactMatch] = np.isinf(weights[exactMatch]).astype(np.float64)
+
+        proba = np.zeros((len(distance), len(self.classes)))
+        np.add.at(proba, (np.arange(len(distance))[:, np.newaxis], labels), weights)
+        proba /= proba.sum(axis=1, keepdims=True)
+        return proba
+
+    def predict(self, X: np.ndarray, exact: bool = True) -> np.ndarray:
+        return self.classes.take(np.argmax(self.predict_proba(X, exact=exact), axis=1), axis=0)
+
+    def measure_recall(self, X: np.ndarray) -> float:
+        """
+        Share of the exact k nearest neighbors that the approximate mode finds,
+        stored in recall
+        """
+        _, exactNeighbors = self.kneighbors(X, exact=True)
+        _, approximateNeighbors = self.kneighbors(X, exact=False)
+        found = sum(len(np.intersect1d(expected, approximate))
+                    for expected, approximate in zip(exactNeighbors, approximateNeighbors))
+        self.recall = found / exactNeighbors.size
+        return self.recall
+
+    def tune_n_probe(self, X: np.ndarray, minRecall: float, maxProbe: int) -> float:
+        """
+        Double nProbe until the approximate search reaches minRecall on the
+        sample or probes maxProbe clusters
+
+        :return: The recall reached
+        """
+        recall = self.measure_recall(X)
+        while recall < minRecall and self.nProbe < min(maxProbe, self.nLists):
+            self.nProbe = min(2 * self.nProbe, maxProbe, self.nLists)
+            recall = self.measure_recall(X)
+        return recall
+
+    def agreement(self, classifier: KNeighborsClassifier, X: np.ndarray, exact: bool = True) -> float:
+        """
+        Share of rows predicted like the classifier, below 1 only through
+        neighbors tied on distance that the classifier orders differently
+        """
+        return float(np.mean(self.predict(X, exact=exact) == classifier.predict(X)))
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class PredictionCache:
+    """
+    Bounded in-process LRU cache of predictions with a time-to-live.
+
+    Keys are normalized feature tuples, every entry is tagged with the version
+    of the model that produced it and the whole cache is dropped as soon as a
+    lookup arrives for another model version.
+    """
+
+    def __init__(self, maxSize: int, ttlSeconds: float):
+        """
+        :param maxSize: Maximum number of cached predictions
+        :param ttlSeconds: Seconds a prediction stays valid, 0 keeps it until evicted
+        """
+        self.maxSize = maxSize
+        self.ttlSeconds = ttlSeconds
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._modelVersion: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, modelVersion: int) -> None:
+        if modelVersion != self._modelVersion:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._modelVersion = modelVersion
+
+    def get(self, key: Hashable, modelVersion: int) -> Any:
+        """
+        Return the cached prediction, or None on a miss
+        """
+        with self._lock:
+            self._check_version(modelVersion)
+
+            value, expiresAt = self._entries.get(key, (_MISSING, 0.0))
+            if value is _MISSING:
+                self.misses += 1
+                return None
+
+            if self.ttlSeconds and expiresAt < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, modelVersion: int) -> None:
+        with self._lock:
+            self._check_version(modelVersion)
+
+            self._entries[key] = (value, time.monotonic() + self.ttlSeconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxSize": self.maxSize,
+            "ttlSeconds": self.ttlSeconds,
+            "modelVersion": self._modelVersion,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRatio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
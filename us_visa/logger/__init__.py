@@ -1,5 +1,11 @@
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
+import threading
+import time
+from typing import Dict, Tuple
 
 from from_root import from_root
 from datetime import datetime
@@ -12,8 +18,111 @@ logs_path = os.path.join(from_root(), log_dir, LOG_FILE)
 
 os.makedirs(log_dir, exist_ok=True)
 
-logging.basicConfig(
-    filename=logs_path,
-    format="[ %(asctime)s ] %(name)s - %(levelname)s - %(message)s",
-    level=logging.DEBUG,
-)
\ No newline at end of file
+# Root level, and per-logger overrides such as "us_visa.serving=DEBUG,uvicorn=WARNING"
+LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+# Records waiting for the writer thread, further records are dropped
+LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+# Records per second let through for each per-request message of the serving logger
+LOG_SAMPLE_RATE_PER_SECOND: float = float(os.getenv("LOG_SAMPLE_RATE_PER_SECOND", 10))
+
+SERVING_LOGGER_NAME: str = "us_visa.serving"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops records instead of blocking the caller when the
+    writer thread falls behind
+    """
+
+    def __init__(self, logQueue: queue.Queue):
+        super().__init__(logQueue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through at most ratePerSecond records per call site, the next record
+    let through reports how many were suppressed in between
+    """
+
+    def __init__(self, ratePerSecond: float):
+        super().__init__()
+        self.ratePerSecond = ratePerSecond
+        self._lock = threading.Lock()
+        # call site -> (window start, records in window, suppressed records)
+        self._windows: Dict[Tuple[str, int], Tuple[float, int, int]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.ratePerSecond <= 0 or record.levelno >= logging.WARNING:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            windowStart, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - windowStart >= 1.0:
+                windowStart, count = now, 0
+
+            if count >= self.ratePerSecond:
+                self._windows[key] = (windowStart, count, suppressed + 1)
+                return False
+            self._windows[key] = (windowStart, count + 1, 0)
+
+        if suppressed:
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+def _parse_levels(levels: str) -> Dict[str, str]:
+    parsed = {}
+    for item in levels.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            parsed[name.strip()] = level.strip().upper()
+    return parsed
+
+
+# Callers only enqueue records, file I/O happens on the listener thread
+fileHandler = logging.FileHandler(logs_path)
+fileHandler.setFormatter(logging.Formatter(
+    "[ %(asctime)s ] %(name)s - %(levelname)s - %(message)s"))
+
+queueHandler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+# Only merges the arguments into the message, the file handler adds the prefix
+queueHandler.setFormatter(logging.Formatter("%(message)s"))
+queueListener = logging.handlers.QueueListener(queueHandler.queue, fileHandler)
+
+logging.basicConfig(handlers=[queueHandler], level=LOG_LEVEL)
+for loggerName, loggerLevel in _parse_levels(LOG_LEVELS).items():
+    logging.getLogger(loggerName).setLevel(loggerLevel)
+
+# Per-request messages of the prediction path, debug by default and sampled
+servingLogger = logging.getLogger(SERVING_LOGGER_NAME)
+servingLogger.addFilter(RateLimitFilter(LOG_SAMPLE_RATE_PER_SECOND))
+
+queueListener.start()
+
+
+@atexit.register
+def _stop_listener() -> None:
+    # Flush the records still queued before the interpreter exits
+    queueListener.stop()
+
+
+def _restart_listener_after_fork() -> None:
+    # The writer thread does not survive a fork, give the child its own queue
+    # and thread, the parent queue may have been locked mid-operation
+    global queueListener
+    queueHandler.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queueListener = logging.handlers.QueueListener(queueHandler.queue, fileHandler)
+    queueListener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
@@ -0,0 +1,213 @@
+import argparse
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from typing import Deque, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from us_visa.entity.columnar_request import ColumnarRequestBuilder
+from us_visa.entity.config_entity import BatchPredictionConfig
+from us_visa.entity.estimator import USvisaModel
+from us_visa.entity.s3_estimator import USVisaEstimator
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+from us_visa.utils.data_extract_utils import USVisaDataExtractionUtil
+from us_visa.utils.main_utils import batch_result_mapping, load_object
+
+ID_COLUMN: str = "case_id"
+
+# Set once per worker process by _init_worker
+_workerModel: Optional[USvisaModel] = None
+_workerRequestBuilder: Optional[ColumnarRequestBuilder] = None
+
+
+def _init_worker(config: BatchPredictionConfig) -> None:
+    """
+    Load and compile the model once per worker process instead of once per chunk
+    """
+    global _workerModel, _workerRequestBuilder
+
+    if config.localModelFilePath is not None:
+        model = load_object(file_path=config.localModelFilePath)
+    else:
+        model = USVisaEstimator(
+            bucketName=config.model_bucket_name,
+            modelPath=config.model_file_path,
+        ).load_model()
+
+    model.compile()
+    _workerModel = model
+    _workerRequestBuilder = ColumnarRequestBuilder()
+    logging.info(f"Batch prediction worker {os.getpid()} loaded model {model}")
+
+
+def _score_chunk(chunk: pd.DataFrame, currentYear: int) -> pd.DataFrame:
+    """
+    Runs in a worker process, returns the identifier and prediction of every row
+    """
+    try:
+        if "company_age" not in chunk:
+            chunk["company_age"] = currentYear - chunk["yr_of_estab"]
+
+        columns = _workerRequestBuilder.build_from_frame(dataFrame=chunk)
+        predictions = np.asarray(_workerModel.predict_columns(columns)).astype(int)
+
+        result = pd.DataFrame({
+            "prediction": predictions,
+            "visaStatus": batch_result_mapping(values=predictions),
+        })
+        if ID_COLUMN in chunk:
+            result.insert(0, ID_COLUMN, chunk[ID_COLUMN].to_numpy())
+
+        return result
+    except Exception as e:
+        raise USvisaException(e, sys) from e
+
+
+class BatchPredictionPipeline:
+    """
+    Scores a whole MongoDB collection offline. Chunks read from a cursor are
+    fanned out to a process pool, every worker holding its own copy of the
+    model, and predictions are written in order to Parquet or to a collection.
+    """
+
+    def __init__(self, batchPredictionConfig: BatchPredictionConfig = BatchPredictionConfig()):
+        try:
+            if batchPredictionConfig.outputFilePath is None \
+                    and batchPredictionConfig.outputCollectionName is None:
+                raise ValueError("Set an output file path or an output collection name")
+
+            self.batchPredictionConfig = batchPredictionConfig
+            self.dataExtractionUtil = USVisaDataExtractionUtil()
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def _score_chunks(self, chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        Yield scored chunks in input order, keeping at most two chunks per
+        worker in flight so that memory does not grow with the collection
+        """
+        config = self.batchPredictionConfig
+        currentYear = date.today().year
+        maxInFlight = 2 * config.workers
+
+        with ProcessPoolExecutor(max_workers=config.workers,
+                                 initializer=_init_worker,
+                                 initargs=(config,),
+                                 ) as executor:
+            pending: Deque[Future] = deque()
+            for chunk in chunks:
+                pending.append(executor.submit(_score_chunk, chunk, currentYear))
+                if len(pending) >= maxInFlight:
+                    yield pending.popleft().result()
+
+            while pending:
+                yield pending.popleft().result()
+
+    def _write_parquet(self, results: Iterator[pd.DataFrame]) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        outputFilePath = self.batchPredictionConfig.outputFilePath
+        os.makedirs(os.path.dirname(outputFilePath) or ".", exist_ok=True)
+
+        rowCount = 0
+        writer = None
+        try:
+            for result in results:
+                table = pa.Table.from_pandas(result, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(outputFilePath, table.schema)
+                writer.write_table(table)
+                rowCount += len(result)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        logging.info(f"Predictions written to {outputFilePath}")
+        return rowCount
+
+    def _write_collection(self, results: Iterator[pd.DataFrame]) -> int:
+        config = self.batchPredictionConfig
+        mongoClient = self.dataExtractionUtil.mongoClient
+        database = mongoClient.database if config.databaseName is None \
+            else mongoClient.client[config.databaseName]
+        collection = database[config.outputCollectionName]
+
+        rowCount = 0
+        for result in results:
+            collection.insert_many(result.to_dict(orient="records"), ordered=False)
+            rowCount += len(result)
+
+        logging.info(f"Predictions written to collection {config.outputCollectionName}")
+        return rowCount
+
+    def run_pipeline(self) -> dict:
+        """
+        :return: Number of rows scored, elapsed seconds and rows per second
+        """
+        try:
+            config = self.batchPredictionConfig
+            logging.info(
+                f"Batch scoring {config.collectionName} with {config.workers} workers")
+            start = time.perf_counter()
+
+            chunks = self.dataExtractionUtil.iter_collection_chunks(
+                collectionName=config.collectionName,
+                chunkSize=config.chunkSize,
+                databaseName=config.databaseName,
+            )
+            results = self._score_chunks(chunks)
+
+            if config.outputFilePath is not None:
+                rowCount = self._write_parquet(results)
+            else:
+                rowCount = self._write_collection(results)
+
+            elapsed = time.perf_counter() - start
+            report = {
+                "rows": rowCount,
+                "seconds": elapsed,
+                "rowsPerSecond": rowCount / elapsed if elapsed else 0.0,
+            }
+            logging.info(f"Complete process: batch prediction {report}")
+            return report
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+
+def main() -> None:
+    defaults = BatchPredictionConfig()
+    parser = argparse.ArgumentParser(description="Score a MongoDB collection offline")
+    parser.add_argument("--collection", default=defaults.collectionName)
+    parser.add_argument("--database", default=defaults.databaseName)
+    output = parser.add_mutually_exclusive_group(required=True)
+    output.add_argument("--output-file", help="Parquet file receiving the predictions")
+    output.add_argument("--output-collection", help="Collection receiving the predictions")
+    parser.add_argument("--chunk-size", type=int, default=defaults.chunkSize)
+    parser.add_argument("--workers", type=int, default=defaults.workers)
+    parser.add_argument("--model-file", default=None,
+                        help="Local model file, the production model is read from s3 otherwise")
+    args = parser.parse_args()
+
+    pipeline = BatchPredictionPipeline(BatchPredictionConfig(
+        collectionName=args.collection,
+        databaseName=args.database,
+        outputFilePath=args.output_file,
+        outputCollectionName=args.output_collection,
+        chunkSize=args.chunk_size,
+        workers=args.workers,
+        localModelFilePath=args.model_file,
+    ))
+    report = pipeline.run_pipeline()
+    print(f"Scored {report['rows']} rows in {report['seconds']:.1f}s "
+          f"({report['rowsPerSecond']:.0f} rows/sec)")
+
+
+if __name__ == "__main__":
+    main()
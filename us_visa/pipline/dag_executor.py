@@ -0,0 +1,253 @@
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+from us_visa.exception import USvisaException
+
+
+@dataclass
+class DagNode:
+    """
+    A stage of a DagExecutor: run is called with the artifacts named in inputs
+    as keyword arguments and returns the artifacts named in outputs, a tuple
+    when there are several
+    """
+    name: str
+    run: Callable[..., Any]
+    inputs: List[str] = field(default_factory=list)
+    outputs: List[str] = field(default_factory=list)
+    # "thread" for I/O bound stages and those releasing the GIL, "process" for
+    # CPU bound python, whose run, inputs and outputs must pickle
+    pool: str = "thread"
+    # Called with the same inputs before the node is submitted, on the thread
+    # running the DAG; a result other than None is used as the outputs of the
+    # node without running it, for stages served from a cache
+    lookup: Optional[Callable[..., Any]] = None
+
+    def __post_init__(self):
+        if self.pool not in ("thread", "process"):
+            raise ValueError(f"Unknown pool {self.pool} of stage {self.name}")
+
+
+@dataclass
+class NodeTiming:
+    start: float
+    end: Optional[float] = None
+    status: str = "running"
+
+    @property
+    def seconds(self) -> float:
+        return (self.end if self.end is not None else self.start) - self.start
+
+
+class DagExecutor:
+    """
+    Runs the nodes of a directed acyclic graph as soon as the artifacts they
+    read exist, independent nodes at the same time in a thread pool or a
+    process pool. The process pool is only started for the first process node
+    its lookup did not serve. The first failure stops scheduling, waits for
+    the nodes already running and raises.
+    """
+
+    def __init__(self,
+                 nodes: List[DagNode],
+                 maxThreads: int = 0,
+                 maxProcesses: int = 0,
+                 startMethod: str = "forkserver",
+                 onNodeStart: Optional[Callable[[str], None]] = None,
+                 onNodeFinish: Optional[Callable[[str], None]] = None,
+                 ):
+        """
+        :param maxThreads: Size of the thread pool, 0 for one thread per node
+        :param maxProcesses: Size of the process pool, 0 for one process per
+            process node, up to the number of cores
+        :param startMethod: How the process pool starts its workers, forking
+            is unsafe when the caller runs other threads
+        :param onNodeStart: Called with the node name before it is submitted,
+            raising from it fails the run
+        :param onNodeFinish: Called with the node name once it succeeded or
+            its lookup served it
+        """
+        self.nodes = nodes
+        self.producers: Dict[str, DagNode] = {}
+        for node in nodes:
+            for output in node.outputs:
+                if output in self.producers:
+                    raise ValueError(
+                        f"Artifact {output} produced by {self.producers[output].name} and {node.name}")
+                self.producers[output] = node
+        self.order = self._topological_order()
+
+        processNodes = sum(node.pool == "process" for node in nodes)
+        self.maxThreads = maxThreads or max(1, len(nodes) - processNodes)
+        self.maxProcesses = maxProcesses or min(processNodes, os.cpu_count() or 1)
+        self.startMethod = startMethod
+        self.onNodeStart = onNodeStart
+        self.onNodeFinish = onNodeFinish
+        self.timings: Dict[str, NodeTiming] = {}
+        self.wallSeconds = 0.0
+
+    def dependencies(self, node: DagNode) -> List[DagNode]:
+        return [self.producers[name] for name in node.inputs if name in self.producers]
+
+    def _topological_order(self) -> List[DagNode]:
+        order: List[DagNode] = []
+        state: Dict[str, str] = {}
+
+        def visit(node: DagNode) -> None:
+            if state.get(node.name) == "done":
+                return
+            if state.get(node.name) == "visiting":
+                raise ValueError(f"Stage {node.name} depends on itself")
+            state[node.name] = "visiting"
+            for dependency in self.dependencies(node):
+                visit(dependency)
+            state[node.name] = "done"
+            order.append(node)
+
+        for node in self.nodes:
+            visit(node)
+        return order
+
+    def run(self, artifacts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        :param artifacts: Artifacts available before any node runs
+        :return: These artifacts and all the node outputs
+        """
+        artifacts = dict(artifacts or {})
+        missing = {name for node in self.nodes for name in node.inputs} \
+            - set(self.producers) - set(artifacts)
+        if missing:
+            raise USvisaException(ValueError(f"No stage produces {sorted(missing)}"), sys)
+
+        pending = list(self.order)
+        running: Dict[Future, DagNode] = {}
+        self.timings = {}
+        threadPool = ThreadPoolExecutor(max_workers=self.maxThreads, thread_name_prefix="dag")
+        processPool = None
+
+        start = time.perf_counter()
+
+        def record_end(timing: NodeTiming, future: Future) -> None:
+            # Runs when the node returns, also for nodes still running after a failure
+            if timing.end is None:
+                timing.end = time.perf_counter() - start
+
+        try:
+            while pending or running:
+                for node in [node for node in pending if all(name in artifacts for name in node.inputs)]:
+                    pending.remove(node)
+                    if self.onNodeStart is not None:
+                        self.onNodeStart(node.name)
+                    timing = self.timings[node.name] = NodeTiming(start=time.perf_counter() - start)
+                    kwargs = {name: artifacts[name] for name in node.inputs}
+
+                    try:
+                        result = node.lookup(**kwargs) if node.lookup is not None else None
+                    except Exception:
+                        timing.end, timing.status = time.perf_counter() - start, "failed"
+                        raise
+                    if result is not None:
+                        timing.end, timing.status = time.perf_counter() - start, "reused"
+                        self._store_outputs(node, result, artifacts)
+                        continue
+
+                    if node.pool == "process":
+                        if processPool is None:
+                            processPool = ProcessPoolExecutor(
+                                max_workers=self.maxProcesses,
+                                mp_context=multiprocessing.get_context(self.startMethod))
+                        future = processPool.submit(node.run, **kwargs)
+                    else:
+                        future = threadPool.submit(node.run, **kwargs)
+                    future.add_done_callback(partial(record_end, timing))
+                    running[future] = node
+
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    timing = self.timings[node.name]
+                    record_end(timing, future)
+                    try:
+                        result = future.result()
+                    except Exception:
+                        timing.status = "failed"
+                        raise
+                    timing.status = "completed"
+                    self._store_outputs(node, result, artifacts)
+            return artifacts
+        except Exception as e:
+            for future in running:
+                future.cancel()
+            raise USvisaException(e, sys) from e
+        finally:
+            # Nodes already running cannot be interrupted, wait for them
+            threadPool.shutdown(wait=True, cancel_futures=True)
+            if processPool is not None:
+                processPool.shutdown(wait=True, cancel_futures=True)
+            self.wallSeconds = time.perf_counter() - start
+            # Outcome of the nodes left running when another one failed, their
+            # outputs are discarded
+            for future, node in running.items():
+                timing = self.timings[node.name]
+                if future.cancelled():
+                    timing.status = "cancelled"
+                elif future.exception() is not None:
+                    timing.status = "failed"
+                else:
+                    timing.status = "completed"
+                if timing.end is None:
+                    timing.end = self.wallSeconds
+
+    def _store_outputs(self, node: DagNode, result: Any, artifacts: Dict[str, Any]) -> None:
+        outputs = (result,) if len(node.outputs) == 1 else tuple(result or ())
+        if len(outputs) != len(node.outputs):
+            raise ValueError(
+                f"Stage {node.name} returned {len(outputs)} artifacts for {node.outputs}")
+        artifacts.update(zip(node.outputs, outputs))
+        if self.onNodeFinish is not None:
+            self.onNodeFinish(node.name)
+
+    def critical_path(self) -> List[str]:
+        """
+        Chain of nodes that determined the wall time: from the node that
+        finished last, back through the dependency each node waited for longest
+        """
+        timed = [node for node in self.order if node.name in self.timings]
+        if not timed:
+            return []
+        node = max(timed, key=lambda n: self.timings[n.name].end)
+        path = [node.name]
+        while True:
+            dependencies = [dependency for dependency in self.dependencies(node)
+                            if dependency.name in self.timings]
+            if not dependencies:
+                break
+            node = max(dependencies, key=lambda n: self.timings[n.name].end)
+            path.append(node.name)
+        return path[::-1]
+
+    def summary(self) -> str:
+        criticalPath = self.critical_path()
+        serialSeconds = sum(timing.seconds for timing in self.timings.values())
+        lines = [f"{'stage':<20} {'pool':<8} {'start':>9} {'end':>9} {'seconds':>9}  status"]
+        for node in self.order:
+            timing = self.timings.get(node.name)
+            if timing is None:
+                lines.append(f"{node.name:<20} {node.pool:<8} {'':>9} {'':>9} {'':>9}  not run")
+                continue
+            marker = "  *" if node.name in criticalPath else ""
+            lines.append(f"{node.name:<20} {node.pool:<8} {timing.start:>9.2f} {timing.end:>9.2f} "
+                         f"{timing.seconds:>9.2f}  {timing.status}{marker}")
+        criticalSeconds = sum(self.timings[name].seconds for name in criticalPath)
+        lines.append(f"critical path (*): {' -> '.join(criticalPath)}, {criticalSeconds:.2f}s")
+        lines.append(f"wall time {self.wallSeconds:.2f}s, stages in sequence {serialSeconds:.2f}s, "
+                     f"overlap saved {max(0.0, serialSeconds - self.wallSeconds):.2f}s")
+        return "\n".join(lines)
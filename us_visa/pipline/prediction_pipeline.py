@@ -1,35 +1,184 @@
 import sys
+import threading
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
 import pandas as pd
 
+from us_visa.entity.columnar_request import ColumnarRequestBuilder
 from us_visa.entity.config_entity import PredictConfig, USVisaPredictConfig
+from us_visa.entity.estimator import USvisaModel
+from us_visa.entity.prediction_cache import PredictionCache
 from us_visa.entity.s3_estimator import USVisaEstimator
 from us_visa.exception import USvisaException
-from us_visa.logger import logging
+from us_visa.logger import logging, servingLogger
 
 
-class USVisaClassifier:
+class USVisaModelHolder:
+    """
+    Process-wide holder that keeps the production model in memory, so that
+    predictions do not download and unpickle the model from s3 on every call
+    """
+
     def __init__(self, predictionPipelineConfig: USVisaPredictConfig = USVisaPredictConfig()):
         try:
             self.predictionPipelineConfig = predictionPipelineConfig
+            self._lock = threading.RLock()
+            # (model, version) swapped as a single reference, so readers never
+            # pair a model with the version of another one
+            self._loaded: Optional[Tuple[USvisaModel, int]] = None
+
+            # load stats
+            self.loadCount = 0
+            self.loadFailures = 0
+            self.loadSecondsTotal = 0.0
+            self.lastLoadSeconds: Dict[str, float] = {"download": 0.0, "compile": 0.0}
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    @property
+    def is_ready(self) -> bool:
+        return self._loaded is not None
+
+    @property
+    def version(self) -> int:
+        loaded = self._loaded
+        return loaded[1] if loaded is not None else 0
+
+    def set_model(self, model: USvisaModel) -> USvisaModel:
+        """
+        Compile and serve the given model as a new version
+        """
+        try:
+            with self._lock:
+                start = time.perf_counter()
+                model.compile()
+                self.lastLoadSeconds["compile"] = time.perf_counter() - start
+
+                self._loaded = (model, self.version + 1)
+                logging.info(
+                    f"Complete process: model {model} loaded as version {self.version}")
+
+                return model
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def load_model(self) -> USvisaModel:
+        """
+        Download the model from s3 and swap it in place of the cached one.
+        Requests keep being served by the previous model while this runs.
+        """
+        try:
+            with self._lock:
+                logging.info("Loading production model into memory")
+                start = time.perf_counter()
+                try:
+                    estimator = USVisaEstimator(
+                        bucketName=self.predictionPipelineConfig.model_bucket_name,
+                        modelPath=self.predictionPipelineConfig.model_file_path,
+                    )
+                    model = estimator.load_model()
+                    self.lastLoadSeconds["download"] = time.perf_counter() - start
+
+                    model = self.set_model(model)
+                except Exception:
+                    self.loadFailures += 1
+                    raise
+                finally:
+                    self.loadSecondsTotal += time.perf_counter() - start
+
+                self.loadCount += 1
+                return model
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def get_load_stats(self) -> dict:
+        return {
+            "ready": self.is_ready,
+            "version": self.version,
+            "loads": self.loadCount,
+            "failures": self.loadFailures,
+            "secondsTotal": self.loadSecondsTotal,
+            "lastSeconds": dict(self.lastLoadSeconds),
+        }
+
+    def get_versioned_model(self) -> Tuple[USvisaModel, int]:
+        """
+        Return the in-memory model and its version, loading it first if the
+        warm-up has not completed yet
+        """
+        try:
+            loaded = self._loaded
+            if loaded is None:
+                with self._lock:
+                    if self._loaded is None:
+                        self.load_model()
+                    loaded = self._loaded
+
+            return loaded
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def get_model(self) -> USvisaModel:
+        return self.get_versioned_model()[0]
+
+
+usVisaModelHolder: USVisaModelHolder = USVisaModelHolder()
+
+PAYLOAD_COLUMNS: List[str] = [
+    "continent",
+    "education_of_employee",
+    "has_job_experience",
+    "region_of_employment",
+    "unit_of_wage",
+    "full_time_position",
+    "no_of_employees",
+    "company_age",
+    "prevailing_wage",
+]
+
+
+class USVisaClassifier:
+    def __init__(self,
+                 predictionPipelineConfig: USVisaPredictConfig = USVisaPredictConfig(),
+                 modelHolder: USVisaModelHolder = usVisaModelHolder,
+                 predictionCache: Optional[PredictionCache] = None,
+                 stageObserver: Optional[Callable[[str, float], None]] = None,
+                 ):
+        """
+        :param stageObserver: Called with the stage name and its duration in seconds
+            for each step of predict_records: cache_lookup, frame_build, transform
+            and model_predict
+        """
+        try:
+            self.predictionPipelineConfig = predictionPipelineConfig
+            self.modelHolder = modelHolder
+            self.predictionCache = predictionCache
+            self.stageObserver = stageObserver
+            self.requestBuilder = ColumnarRequestBuilder()
         except Exception as e:
             raise USvisaException(e, sys) from e
 
     def get_payload_data_as_df(self, payload: PredictConfig) -> pd.DataFrame:
         try:
-            logging.info("Converting payload dict into dataframe")
-            payload_dict = {
-                "continent": payload.continent,
-                "education_of_employee": payload.education_of_employee,
-                "has_job_experience": payload.has_job_experience,
-                "region_of_employment": payload.region_of_employment,
-                "unit_of_wage": payload.unit_of_wage,
-                "full_time_position": payload.full_time_position,
-                "no_of_employees": payload.no_of_employees,
-                "company_age": payload.company_age,
-                "prevailing_wage": payload.prevailing_wage,
-            }
-
-            df = pd.DataFrame([payload_dict])
+            servingLogger.debug("Converting payload dict into dataframe")
+            return self.get_payloads_data_as_df(payloads=[payload])
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def get_payloads_data_as_df(self, payloads: List[PredictConfig]) -> pd.DataFrame:
+        """
+        Build a single DataFrame out of many payloads, one row per payload,
+        so that a batch goes through the preprocessor and model only once
+        """
+        try:
+            servingLogger.debug("Converting %d payloads into dataframe", len(payloads))
+            df = pd.DataFrame(
+                [asdict(payload) for payload in payloads],
+                columns=PAYLOAD_COLUMNS,
+            )
 
             return df
         except Exception as e:
@@ -37,15 +186,101 @@ class USVisaClassifier:
 
     def predict(self, dataFrame: pd.DataFrame) -> pd.DataFrame:
         try:
-            logging.info("Starting prediction pipeline")
-            model = USVisaEstimator(
-                bucketName=self.predictionPipelineConfig.model_bucket_name,
-                modelPath=self.predictionPipelineConfig.model_file_path,
-            )
+            servingLogger.debug("Starting prediction pipeline")
+            model = self.modelHolder.get_model()
 
             result = model.predict(dataFrame)
 
-            logging.info(f"Complete process: prediction result {result}")
+            servingLogger.debug("Complete process: prediction result %s", result)
             return result
         except Exception as e:
             raise USvisaException(e, sys) from e
+
+    def get_cached_prediction(self, record: Any) -> Any:
+        """
+        Return the cached prediction of a record for the model being served,
+        or None when it has to be scored
+        """
+        try:
+            # Never trigger a model download from here, callers may be on the event loop
+            if self.predictionCache is None or not self.modelHolder.is_ready:
+                return None
+
+            _, version = self.modelHolder.get_versioned_model()
+            return self.predictionCache.get(self.requestBuilder.build_key(record), version)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def predict_records(self, records: Sequence[Any], lookupCache: bool = True) -> np.ndarray:
+        """
+        Predict validated request forms without building a DataFrame, the
+        fields are written straight into column buffers in schema order.
+        Only records missing from the prediction cache reach the model.
+
+        :param lookupCache: False when the caller already looked the records up
+        """
+        try:
+            model, version = self.modelHolder.get_versioned_model()
+            if self.predictionCache is None:
+                return self._score_records(model, records)
+
+            start = time.perf_counter()
+            keys = [self.requestBuilder.build_key(record) for record in records]
+            results = [
+                self.predictionCache.get(key, version) if lookupCache else None
+                for key in keys
+            ]
+            missing = [index for index, value in enumerate(results) if value is None]
+            self._observe_stage("cache_lookup", start)
+
+            if missing:
+                predictions = self._score_records(model, [records[index] for index in missing])
+                for index, value in zip(missing, predictions):
+                    results[index] = value
+                    self.predictionCache.put(keys[index], value, version)
+
+            return np.asarray(results)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def predict_frame(self, dataFrame: pd.DataFrame) -> np.ndarray:
+        """
+        Predict a chunk of parsed rows holding the input columns, bypassing the
+        prediction cache since bulk rows are rarely repeated
+        """
+        try:
+            model = self.modelHolder.get_model()
+
+            start = time.perf_counter()
+            columns = self.requestBuilder.build_from_frame(dataFrame=dataFrame)
+            start = self._observe_stage("frame_build", start)
+
+            return self._score_columns(model, columns, start)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def _score_records(self, model: USvisaModel, records: Sequence[Any]) -> np.ndarray:
+        start = time.perf_counter()
+        columns = self.requestBuilder.build(records=records)
+        start = self._observe_stage("frame_build", start)
+
+        return self._score_columns(model, columns, start)
+
+    def _score_columns(self,
+                       model: USvisaModel,
+                       columns: Dict[str, np.ndarray],
+                       start: float,
+                       ) -> np.ndarray:
+        features = model.transform_columns(columns)
+        start = self._observe_stage("transform", start)
+
+        predictions = model.predict_features(features)
+        self._observe_stage("model_predict", start)
+
+        return predictions
+
+    def _observe_stage(self, stage: str, start: float) -> float:
+        now = time.perf_counter()
+        if self.stageObserver is not None:
+            self.stageObserver(stage, now - start)
+        return now
@@ -1,4 +1,11 @@
+import multiprocessing
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date
+from functools import partial
+from typing import Any, Callable, List, Optional, Set, Tuple, Type
 
 from us_visa.components.data_ingestion import DataIngestion
 from us_visa.components.data_transformation import DataTransformation
@@ -6,41 +13,210 @@ from us_visa.components.data_validation import DataValidation
 from us_visa.components.model_evaluation import ModelEvaluator
 from us_visa.components.model_pusher import ModelPusher
 from us_visa.components.model_trainer import ModelTrainer
+from us_visa.constants import (KNN_INDEX_MAX_PROBE,
+                               TRAINING_PROCESS_START_METHOD,
+                               KNN_INDEX_MIN_RECALL,
+                               KNN_INDEX_MODE,
+                               KNN_INDEX_N_LISTS,
+                               KNN_INDEX_N_PROBE,
+                               SCHEMA_FILE_PATH,
+                               STAGE_CACHE_DIR,
+                               STAGE_CACHE_ENABLED,
+                               )
 from us_visa.entity.config_entity import (DataIngestionConfig,
                                           DataTransformationConfig,
                                           DataValidationConfig,
                                           ModelEvaluationConfig,
                                           ModelPusherConfig,
                                           ModelTrainerConfig,
+                                          TrainingPipelineConfig,
                                           )
 from us_visa.logger import logging
 from us_visa.entity.artifact_entity import (DataIngestionArtifact,
                                             DataTransformationArtifact,
                                             DataValidationArtifact, ModelEvaluationArtifact,
                                             ModelPusherArtifact,
-                                            ModelTrainerArtifact
+                                            ModelTrainerArtifact,
+                                            ProductionModelScoreArtifact,
                                             )
 from us_visa.exception import USvisaException
+from us_visa.pipline.dag_executor import DagExecutor, DagNode
+from us_visa.store.stage_cache import StageCache
+
+
+TRAINING_STAGES: List[str] = [
+    "ingestion",
+    "validation",
+    "drift",
+    "transformation",
+    "training",
+    "production_scoring",
+    "evaluation",
+    "pushing",
+]
+# Stages indexed by StageCache, the others depend on the model in s3 and always run
+CACHED_STAGES: List[str] = [
+    "ingestion",
+    "validation",
+    "drift",
+    "transformation",
+    "training",
+]
+
+
+def _get_cached_stage(stageCache: Optional[StageCache],
+                      stage: str,
+                      inputs: dict,
+                      artifactType: Type,
+                      ) -> Optional[Any]:
+    """
+    Return the artifact of a previous run of the stage with the same inputs, or None
+    """
+    if stageCache is None:
+        return None
+    fingerprint = StageCache.fingerprint(stage, inputs)
+    artifact = stageCache.get(stage, fingerprint, artifactType)
+    if artifact is not None:
+        logging.info(f"Reusing {stage} stage {fingerprint}: {artifact}")
+    return artifact
+
+
+def _run_cached_stage(stageCache: Optional[StageCache],
+                      stage: str,
+                      inputs: dict,
+                      artifactType: Type,
+                      run: Callable[[], Any],
+                      ) -> Tuple[Any, bool]:
+    """
+    Return the artifact of a previous run of the stage with the same inputs,
+    else run the stage and index its artifact under the fingerprint of inputs
+
+    :return: The artifact and whether it was reused
+    """
+    artifact = _get_cached_stage(stageCache, stage, inputs, artifactType)
+    if artifact is not None:
+        return artifact, True
+
+    artifact = run()
+    artifact.fingerprint = StageCache.fingerprint(stage, inputs)
+    if stageCache is not None:
+        stageCache.put(stage, artifact.fingerprint, inputs, artifact)
+    return artifact, False
+
+
+def _drift_inputs(schemaValidationArtifact: DataValidationArtifact) -> dict:
+    return {"validation": schemaValidationArtifact.fingerprint}
+
+
+def _detect_drift(stageCache: Optional[StageCache],
+                  dataValidationConfig: DataValidationConfig,
+                  dataIngestionArtifact: DataIngestionArtifact,
+                  schemaValidationArtifact: DataValidationArtifact,
+                  ) -> DataValidationArtifact:
+    # Drift stage, CPU bound and run in the process pool of the DAG
+    try:
+        logging.info("Running TrainingPipeline: drift detection")
+        dataValidation = DataValidation(
+            dataIngestionArtifact=dataIngestionArtifact,
+            dataValidationConfig=dataValidationConfig,
+        )
+        dataValidationArtifact, _ = _run_cached_stage(
+            stageCache, "drift", _drift_inputs(schemaValidationArtifact), DataValidationArtifact,
+            lambda: dataValidation.detect_drift(schemaValidationArtifact))
+        logging.info(f"Complete Process: drift detection, {dataValidationArtifact}")
+
+        return dataValidationArtifact
+    except Exception as e:
+        raise USvisaException(e, sys) from e
 
 
 class TrainPipeline:
-    def __init__(self):
+    def __init__(self,
+                 stageCallback: Optional[Callable[[str, str], None]] = None,
+                 trainingPipelineConfig: Optional[TrainingPipelineConfig] = None,
+                 collectionName: Optional[str] = None,
+                 modelConfigFilePath: Optional[str] = None,
+                 s3ModelKeyPath: Optional[str] = None,
+                 ):
+        """
+        :param stageCallback: Optional callable invoked as (stage, status) when a stage
+        is "running" and when it is "completed", or "reused" when the stage cache
+        served its outputs, raising from it aborts the pipeline; independent
+        stages run at the same time, but it is only called from the thread
+        running run_pipeline
+        :param trainingPipelineConfig: Run id and workspace, a new one by default
+        :param collectionName: Mongo collection to train on instead of MONGO_DB_COLLECTION
+        :param modelConfigFilePath: Model config to search instead of config/model.yaml
+        :param s3ModelKeyPath: Key of the production model compared against and
+            replaced instead of MODEL_FILE_NAME
+        """
         try:
-            self.dataIngestionConfig = DataIngestionConfig()
-            self.dataValidationConfig = DataValidationConfig()
-            self.dataTransformationConfig = DataTransformationConfig()
-            self.modelTrainerConfig = ModelTrainerConfig()
+            self.stageCallback = stageCallback
+            self.stageCache = StageCache(STAGE_CACHE_DIR) if STAGE_CACHE_ENABLED else None
+            self._reusedStages: Set[str] = set()
+            self.trainingPipelineConfig = trainingPipelineConfig or TrainingPipelineConfig()
+            runConfig = self.trainingPipelineConfig
+
+            self.dataIngestionConfig = DataIngestionConfig(trainingPipelineConfig=runConfig)
+            if collectionName is not None:
+                self.dataIngestionConfig.collectionName = collectionName
+            self.dataValidationConfig = DataValidationConfig(trainingPipelineConfig=runConfig)
+            self.dataTransformationConfig = DataTransformationConfig(trainingPipelineConfig=runConfig)
+            self.modelTrainerConfig = ModelTrainerConfig(trainingPipelineConfig=runConfig)
+            if modelConfigFilePath is not None:
+                self.modelTrainerConfig.modelConfigFilePath = modelConfigFilePath
             self.modelEvaluationConfig = ModelEvaluationConfig()
             self.modelPusherConfig = ModelPusherConfig()
+            if s3ModelKeyPath is not None:
+                self.modelEvaluationConfig.s3ModelKeyPath = s3ModelKeyPath
+                self.modelPusherConfig.s3ModelKeyPath = s3ModelKeyPath
         except Exception as e:
             raise USvisaException(e, sys) from e
 
+    def _report_stage(self, stage: str, status: str) -> None:
+        if self.stageCallback is not None:
+            self.stageCallback(stage, status)
+
+    def _run_cached_stage(self,
+                          stage: str,
+                          inputs: dict,
+                          artifactType: Type,
+                          run: Callable[[], Any],
+                          ) -> Any:
+        artifact, reused = _run_cached_stage(self.stageCache, stage, inputs, artifactType, run)
+        if reused:
+            self._reusedStages.add(stage)
+        return artifact
+
+    def _reuse_drift(self,
+                     dataIngestionArtifact: DataIngestionArtifact,
+                     schemaValidationArtifact: DataValidationArtifact,
+                     ) -> Optional[DataValidationArtifact]:
+        # Looked up before the drift stage is submitted, so that a cached drift
+        # report does not start the process pool
+        artifact = _get_cached_stage(
+            self.stageCache, "drift", _drift_inputs(schemaValidationArtifact), DataValidationArtifact)
+        if artifact is not None:
+            self._reusedStages.add("drift")
+        return artifact
+
+    def _finish_stage(self, stage: str) -> None:
+        self._report_stage(stage, "reused" if stage in self._reusedStages else "completed")
+
     def _start_data_ingestion(self) -> DataIngestionArtifact:
         try:
             logging.info("Running TrainingPipeline: data ingestion")
             dataIngestion = DataIngestion(
                 dataIngestionConfig=self.dataIngestionConfig)
-            dataIngestionArtifact = dataIngestion.initiate_data_ingestion()
+            # The export is always needed, it is what the source data hash is taken of
+            dataFrame = dataIngestion.export_data_into_feature_store()
+            inputs = {
+                "source": StageCache.file_digest(self.dataIngestionConfig.featureStorePath),
+                "trainTestSplitRatio": self.dataIngestionConfig.trainTestSplitRatio,
+            }
+            dataIngestionArtifact = self._run_cached_stage(
+                "ingestion", inputs, DataIngestionArtifact,
+                lambda: dataIngestion.initiate_data_ingestion(dataFrame=dataFrame))
             logging.info("Complete Process: data ingestion")
 
             return dataIngestionArtifact
@@ -54,7 +230,14 @@ class TrainPipeline:
                 dataIngestionArtifact=dataIngestionArtifact,
                 dataValidationConfig=self.dataValidationConfig,
             )
-            dataValidationArtifact = dataValidation.initiate_data_validation()
+            inputs = {
+                "ingestion": dataIngestionArtifact.fingerprint,
+                "schema": StageCache.file_digest(SCHEMA_FILE_PATH),
+            }
+            # Schema checks only, the drift stage runs alongside the transformation
+            dataValidationArtifact = self._run_cached_stage(
+                "validation", inputs, DataValidationArtifact,
+                lambda: dataValidation.initiate_data_validation(detectDrift=False))
             logging.info("Complete Process: data validation")
 
             return dataValidationArtifact
@@ -69,7 +252,16 @@ class TrainPipeline:
                 dataValidationArtifact=dataValidationArtifact,
                 dataTransformationConfig=self.dataTransformationConfig,
             )
-            dataTransformationArtifact = dataTransformation.initiate_data_transformation()
+            inputs = {
+                "ingestion": dataIngestionArtifact.fingerprint,
+                "validation": dataValidationArtifact.fingerprint,
+                "schema": StageCache.file_digest(SCHEMA_FILE_PATH),
+                # company_age is derived from the current year
+                "year": date.today().year,
+            }
+            dataTransformationArtifact = self._run_cached_stage(
+                "transformation", inputs, DataTransformationArtifact,
+                dataTransformation.initiate_data_transformation)
             logging.info("Complete Process: data transformation")
 
             return dataTransformationArtifact
@@ -83,14 +275,47 @@ class TrainPipeline:
                 dataTransformationArtifact=dataTransformationArtifact,
                 modelTrainerConfig=self.modelTrainerConfig,
             )
-            modelTrainerArtifact = modelTrainer.initiate_model_trainer()
+            inputs = {
+                "transformation": dataTransformationArtifact.fingerprint,
+                "modelConfig": StageCache.file_digest(self.modelTrainerConfig.modelConfigFilePath),
+                "expectedAccuracy": self.modelTrainerConfig.expectedAccuracy,
+                "modelArtifactFormat": self.modelTrainerConfig.modelArtifactFormat,
+                "modelArtifactCompression": self.modelTrainerConfig.modelArtifactCompression,
+                "knnIndexMode": KNN_INDEX_MODE,
+                "knnIndexLists": KNN_INDEX_N_LISTS,
+                "knnIndexProbe": KNN_INDEX_N_PROBE,
+                "knnIndexMaxProbe": KNN_INDEX_MAX_PROBE,
+                "knnIndexMinRecall": KNN_INDEX_MIN_RECALL,
+            }
+            modelTrainerArtifact = self._run_cached_stage(
+                "training", inputs, ModelTrainerArtifact,
+                modelTrainer.initiate_model_trainer)
             logging.info("Complete Process: Model Training")
 
             return modelTrainerArtifact
         except Exception as e:
             raise USvisaException(e, sys) from e
 
-    def _start_model_evaluation(self, dataIngestionArtifact: DataIngestionArtifact, modelTrainerArtifact: ModelTrainerArtifact) -> ModelEvaluationArtifact:
+    def _start_production_scoring(self, dataIngestionArtifact: DataIngestionArtifact) -> ProductionModelScoreArtifact:
+        try:
+            logging.info("Running TrainingPipeline: Production Model Scoring")
+            modelEvaluator = ModelEvaluator(
+                dataIngestionArtifact=dataIngestionArtifact,
+                modelTrainerArtifact=None,
+                modelEvaluationConfig=self.modelEvaluationConfig,
+            )
+            productionModelScoreArtifact = modelEvaluator.score_production_model()
+            logging.info("Complete Process: Production Model Scoring")
+
+            return productionModelScoreArtifact
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def _start_model_evaluation(self,
+                                dataIngestionArtifact: DataIngestionArtifact,
+                                modelTrainerArtifact: ModelTrainerArtifact,
+                                productionModelScoreArtifact: ProductionModelScoreArtifact,
+                                ) -> ModelEvaluationArtifact:
         try:
             logging.info("Running TrainingPipeline: Model Evaluation")
             modelEvaluator = ModelEvaluator(
@@ -98,15 +323,27 @@ class TrainPipeline:
                 modelTrainerArtifact=modelTrainerArtifact,
                 modelEvaluationConfig=self.modelEvaluationConfig,
             )
-            modelEvaluationArtifact = modelEvaluator.initiate_model_evaluation()
+            modelEvaluationArtifact = modelEvaluator.initiate_model_evaluation(
+                productionModelScore=productionModelScoreArtifact)
             logging.info("Complete Process: Model Evaluation")
 
             return modelEvaluationArtifact
         except Exception as e:
             raise USvisaException(e, sys) from e
 
-    def _start_model_pushing(self, modelEvaluationArtifact: ModelEvaluationArtifact) -> ModelPusherArtifact:
+    def _start_model_pushing(self,
+                             modelEvaluationArtifact: ModelEvaluationArtifact,
+                             dataValidationArtifact: DataValidationArtifact,
+                             ) -> ModelPusherArtifact:
+        """
+        :param dataValidationArtifact: Outcome of the drift stage, only waited
+            for so that a failed drift report stops the push
+        """
         try:
+            if not modelEvaluationArtifact.isModelAccepted:
+                logging.info("Model trained is not accepted")
+                raise Exception("Model trained is not accepted")
+
             logging.info("Running TrainingPipeline: Model Pushing")
             modelPusher = ModelPusher(
                 modelPusherConfig=self.modelPusherConfig,
@@ -119,42 +356,113 @@ class TrainPipeline:
         except Exception as e:
             raise USvisaException(e, sys) from e
 
+    def _build_dag(self) -> List[DagNode]:
+        """
+        Stages and the artifacts they exchange: drift reporting overlaps with
+        the transformation and training, scoring the production model from s3
+        with everything after the ingestion
+        """
+        return [
+            DagNode("ingestion", self._start_data_ingestion,
+                    outputs=["dataIngestionArtifact"]),
+            DagNode("validation", self._start_data_validation,
+                    inputs=["dataIngestionArtifact"],
+                    outputs=["schemaValidationArtifact"]),
+            DagNode("drift",
+                    partial(_detect_drift, self.stageCache, self.dataValidationConfig),
+                    inputs=["dataIngestionArtifact", "schemaValidationArtifact"],
+                    outputs=["dataValidationArtifact"],
+                    pool="process",
+                    lookup=self._reuse_drift),
+            DagNode("transformation",
+                    lambda dataIngestionArtifact, schemaValidationArtifact: self._start_data_transformation(
+                        dataIngestionArtifact, schemaValidationArtifact),
+                    inputs=["dataIngestionArtifact", "schemaValidationArtifact"],
+                    outputs=["dataTransformationArtifact"]),
+            DagNode("training", self._start_model_trainer,
+                    inputs=["dataTransformationArtifact"],
+                    outputs=["modelTrainerArtifact"]),
+            DagNode("production_scoring", self._start_production_scoring,
+                    inputs=["dataIngestionArtifact"],
+                    outputs=["productionModelScoreArtifact"]),
+            DagNode("evaluation", self._start_model_evaluation,
+                    inputs=["dataIngestionArtifact", "modelTrainerArtifact", "productionModelScoreArtifact"],
+                    outputs=["modelEvaluationArtifact"]),
+            DagNode("pushing", self._start_model_pushing,
+                    inputs=["modelEvaluationArtifact", "dataValidationArtifact"],
+                    outputs=["modelPusherArtifact"]),
+        ]
+
     def run_pipeline(self) -> None:
         try:
-            logging.info("Starting training pipeline")
-            # Start data ingestion:
-            dataIngestionArtifact: DataIngestionArtifact = self._start_data_ingestion()
-
-            # Start data validation:
-            dataValidationArtifact: DataValidationArtifact = self._start_data_validation(
-                dataIngestionArtifact=dataIngestionArtifact
+            logging.info(
+                f"Starting training pipeline run {self.trainingPipelineConfig.runId} "
+                f"in {self.trainingPipelineConfig.artifactDir}")
+            self._reusedStages = set()
+            executor = DagExecutor(
+                self._build_dag(),
+                startMethod=TRAINING_PROCESS_START_METHOD,
+                onNodeStart=lambda stage: self._report_stage(stage, "running"),
+                onNodeFinish=self._finish_stage,
             )
+            try:
+                executor.run()
+            finally:
+                summary = executor.summary()
+                logging.info(f"Training pipeline stage timings:\n{summary}")
+            logging.info("Complete All Processes")
 
-            # Start data transformation:
-            dataTransformationArtifact: DataTransformationArtifact = self._start_data_transformation(
-                dataIngestionArtifact=dataIngestionArtifact,
-                dataValidationArtifact=dataValidationArtifact,
-            )
+        except Exception as e:
+            raise USvisaException(e, sys) from e
 
-            # Start model training:
-            modelTrainerArtifact: ModelTrainerArtifact = self._start_model_trainer(
-                dataTransformationArtifact=dataTransformationArtifact
-            )
 
-            # Start model evaluation:
-            modelEvaluateArtifact: ModelEvaluationArtifact = self._start_model_evaluation(
-                dataIngestionArtifact=dataIngestionArtifact,
-                modelTrainerArtifact=modelTrainerArtifact,
-            )
+@dataclass
+class TrainingRun:
+    """
+    One pipeline of run_pipelines_concurrently, None keeps the default setting
+    """
+    collectionName: Optional[str] = None
+    modelConfigFilePath: Optional[str] = None
+    s3ModelKeyPath: Optional[str] = None
+    trainingPipelineConfig: TrainingPipelineConfig = field(
+        default_factory=TrainingPipelineConfig)
+    # Set by run_pipelines_concurrently when the run failed
+    error: Optional[str] = None
 
-            if not modelEvaluateArtifact.isModelAccepted:
-                logging.info("Model trained is not accepted")
-                raise Exception("Model trained is not accepted")
 
-            modelPusherArtifact = self._start_model_pushing(
-                modelEvaluationArtifact=modelEvaluateArtifact
-            )
-            logging.info("Complete All Processes")
+def _run_training(run: TrainingRun) -> Optional[str]:
+    # Runs in a pipeline process, the error goes back as text since the
+    # exception may not survive pickling
+    try:
+        TrainPipeline(
+            trainingPipelineConfig=run.trainingPipelineConfig,
+            collectionName=run.collectionName,
+            modelConfigFilePath=run.modelConfigFilePath,
+            s3ModelKeyPath=run.s3ModelKeyPath,
+        ).run_pipeline()
+        return None
+    except Exception as e:
+        logging.error(f"Training run {run.trainingPipelineConfig.runId} failed: {e}")
+        return str(e)
 
-        except Exception as e:
-            raise USvisaException(e, sys) from e
+
+def run_pipelines_concurrently(runs: List[TrainingRun], workers: int = 0) -> List[TrainingRun]:
+    """
+    Train several pipelines, e.g. one per collection or model config, each in
+    its own process and workspace; a failed run does not stop the others.
+    Every pipeline still sizes the process pool of its model search from the
+    search section of its model config, lower its workers to share the cores.
+
+    :param workers: Pipelines running at the same time, 0 for one per core
+    :return: The runs, with error set on those that failed
+    """
+    try:
+        workers = min(len(runs), workers or os.cpu_count() or 1)
+        logging.info(f"Running {len(runs)} training pipelines in {workers} processes")
+        mpContext = multiprocessing.get_context(TRAINING_PROCESS_START_METHOD)
+        with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=mpContext) as executor:
+            for run, error in zip(runs, executor.map(_run_training, runs)):
+                run.error = error
+        return runs
+    except Exception as e:
+        raise USvisaException(e, sys) from e
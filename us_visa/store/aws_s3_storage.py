@@ -1,33 +1,54 @@
 import os
 import sys
-from io import StringIO
-from typing import Union, List
+from io import BytesIO, StringIO
+from typing import Any, Callable, Optional, Union, List
 from mypy_boto3_s3.service_resource import Bucket
 from botocore.exceptions import ClientError
 import pandas as pd
-import pickle
 
 from us_visa.configuration.aws_s3_connection import S3Client
+from us_visa.constants import MODEL_CACHE_DIR, MODEL_CACHE_ENABLED, MODEL_CACHE_MAX_BYTES
 from us_visa.logger import logging
 from us_visa.exception import USvisaException
+from us_visa.store.model_cache import ModelCache
+from us_visa.utils.main_utils import load_object, load_object_from_bytes
+
+# Shared by every SimpleStorageService of the process
+modelCache: ModelCache = ModelCache(
+    cacheDir=MODEL_CACHE_DIR,
+    maxBytes=MODEL_CACHE_MAX_BYTES,
+    diskEnabled=MODEL_CACHE_ENABLED,
+)
 
 
 class SimpleStorageService:
 
-    def __init__(self):
+    def __init__(self, cache: ModelCache = modelCache):
         s3_client = S3Client()
         self.s3_resource = s3_client.s3_resource
         self.s3_client = s3_client.s3_client
+        self.cache = cache
+
+    def head_object(self, bucket_name: str, s3_key: str) -> Optional[dict]:
+        """
+        Metadata of the exact s3_key, ETag included, or None when it does not exist.
+        A single HEAD request, much cheaper than listing the bucket prefix.
+        """
+        try:
+            return self.s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise USvisaException(e, sys) from e
 
     def s3_key_path_available(self, bucket_name, s3_key) -> bool:
         try:
-            bucket = self.get_bucket(bucket_name)
-            file_objects = [
-                file_object for file_object in bucket.objects.filter(Prefix=s3_key)]
-            if len(file_objects) > 0:
+            if self.head_object(bucket_name, s3_key) is not None:
                 return True
-            else:
-                return False
+
+            # s3_key may be a folder prefix rather than an object
+            bucket = self.get_bucket(bucket_name)
+            return any(True for _ in bucket.objects.filter(Prefix=s3_key).limit(1))
         except Exception as e:
             raise USvisaException(e, sys)
 
@@ -93,6 +114,9 @@ class SimpleStorageService:
             "Entered the get_file_object method of S3Operations class")
 
         try:
+            if self.head_object(bucket_name, filename) is not None:
+                return self.s3_resource.Object(bucket_name, filename)
+
             bucket = self.get_bucket(bucket_name)
 
             file_objects = [
@@ -129,15 +153,57 @@ class SimpleStorageService:
                 else model_dir + "/" + model_name
             )
             model_file = func()
-            file_object = self.get_file_object(model_file, bucket_name)
-            model_obj = self.read_object(file_object, decode=False)
-            model = pickle.loads(model_obj)
+            # Loaded from the path of the disk cache entry, so that model artifacts are memory-mapped
+            model = self.read_cached_object(model_file, bucket_name, load_object_from_bytes,
+                                            deserialize_file=load_object)
             logging.info("Exited the load_model method of S3Operations class")
             return model
 
         except Exception as e:
             raise USvisaException(e, sys) from e
 
+    def read_cached_object(self,
+                           filename: str,
+                           bucket_name: str,
+                           deserialize: Callable[[bytes], Any],
+                           keep_in_memory: bool = True,
+                           deserialize_file: Optional[Callable[[str], Any]] = None,
+                           ) -> Any:
+        """
+        Read and deserialize the filename object through the local model cache,
+        revalidated against s3 with a HEAD request on every call
+
+        :param deserialize_file: Loads the object from the path of its disk
+            cache entry, when there is one, instead of deserialize
+        """
+        try:
+            head = self.head_object(bucket_name, filename)
+            if head is None:
+                # Not an exact key, keep the prefix lookup of get_file_object
+                file_object = self.get_file_object(filename, bucket_name)
+                return deserialize(self.read_object(file_object, decode=False))
+
+            etag, versionId = head["ETag"], head.get("VersionId")
+            getArgs = {"Bucket": bucket_name, "Key": filename, "IfMatch": etag}
+            if versionId:
+                getArgs["VersionId"] = versionId
+
+            def download() -> bytes:
+                logging.info(f"Downloading {filename} from {bucket_name} bucket")
+                return self.s3_client.get_object(**getArgs)["Body"].read()
+
+            return self.cache.fetch(
+                bucketName=bucket_name,
+                key=filename,
+                address=ModelCache.content_address(etag, versionId),
+                download=download,
+                deserialize=deserialize,
+                keepInMemory=keep_in_memory,
+                deserializeFile=deserialize_file,
+            )
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
     def create_folder(self, folder_name: str, bucket_name: str) -> None:
         """
         Method Name :   create_folder
@@ -265,8 +331,12 @@ class SimpleStorageService:
         logging.info("Entered the read_csv method of S3Operations class")
 
         try:
-            csv_obj = self.get_file_object(filename, bucket_name)
-            df = self.get_df_from_object(csv_obj)
+            df = self.read_cached_object(
+                filename,
+                bucket_name,
+                lambda content: pd.read_csv(BytesIO(content), na_values="na"),
+                keep_in_memory=False,
+            )
             logging.info("Exited the read_csv method of S3Operations class")
             return df
         except Exception as e:
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import os
+import pickle
+import sys
+import tempfile
+from typing import Any, Dict, Optional
+
+import numpy as np
+import sklearn
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+from us_visa.store.model_cache import ModelCache
+
+
+class FitCache:
+    """
+    Cross-run memo of the model search: the cross-validation score of every
+    (training data, estimator, parameters, fold) fit, kept in one score index
+    file written once per search by flush, and, optionally, the refitted
+    estimators, kept on local disk in the least recently used eviction tier
+    of ModelCache.
+
+    Keys hash the content of the transformed training arrays, so any change
+    to the data, the parameters or the sklearn version misses the cache.
+    Estimators whose random_state is None are not cached, their fits differ
+    from run to run.
+    """
+
+    def __init__(self,
+                 cacheDir: str,
+                 maxBytes: int,
+                 storeEstimators: bool = False,
+                 maxScores: int = 100000,
+                 ):
+        """
+        :param cacheDir: Directory holding the cached entries
+        :param maxBytes: Size the estimator entries are trimmed down to after every write
+        :param storeEstimators: Also cache refitted estimators, not only scores
+        :param maxScores: Scores kept in the index, the oldest written are dropped first
+        """
+        self.store = ModelCache(cacheDir=cacheDir, maxBytes=maxBytes)
+        self.storeEstimators = storeEstimators
+        self.maxScores = maxScores
+        self.scoreIndexPath = os.path.join(cacheDir, "scores.json")
+        self._scores: Optional[Dict[str, float]] = None
+        self._newScores: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def data_fingerprint(X: np.ndarray, y: np.ndarray) -> str:
+        digest = hashlib.sha256()
+        for array in (X, y):
+            array = np.ascontiguousarray(array)
+            digest.update(f"{array.dtype.str}{array.shape}".encode())
+            digest.update(memoryview(array).cast("B"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def fit_key(dataFingerprint: str,
+                estimatorName: str,
+                params: dict,
+                fold: int,
+                nFolds: int,
+                nSamples: Optional[int] = None,
+                ) -> str:
+        """
+        :param fold: Cross-validation fold, -1 for the refit on all rows
+        """
+        description = json.dumps({
+            "data": dataFingerprint,
+            "estimator": estimatorName,
+            "params": params,
+            "fold": fold,
+            "nFolds": nFolds,
+            "nSamples": nSamples,
+            "sklearn": sklearn.__version__,
+        }, sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _read_score_index(self) -> Dict[str, float]:
+        try:
+            with open(self.scoreIndexPath) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.info(f"Ignoring unreadable fit cache score index: {e}")
+            return {}
+
+    def get_score(self, key: str) -> Optional[float]:
+        if self._scores is None:
+            self._scores = self._read_score_index()
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return score
+
+    def put_score(self, key: str, score: float) -> None:
+        """
+        Record a score in memory, written to the index by the next flush
+        """
+        if self._scores is None:
+            self._scores = self._read_score_index()
+        self._scores[key] = score
+        self._newScores[key] = score
+
+    def flush(self) -> None:
+        """
+        Merge the scores put since the last flush into the index file, on top
+        of what other runs wrote meanwhile
+        """
+        if not self._newScores:
+            return
+        try:
+            scores = self._read_score_index()
+            for key, score in self._newScores.items():
+                # Reinserted last, so that trimming drops the oldest first
+                scores.pop(key, None)
+                scores[key] = score
+            for key in list(scores)[:max(0, len(scores) - self.maxScores)]:
+                del scores[key]
+
+            os.makedirs(os.path.dirname(self.scoreIndexPath), exist_ok=True)
+            # Write then rename, so that concurrent searches never read a partial index
+            fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(self.scoreIndexPath), suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump(scores, file)
+            os.replace(tmpPath, self.scoreIndexPath)
+
+            self._scores = scores
+            self._newScores = {}
+        except OSError as e:
+            logging.info(f"Could not write the fit cache score index: {e}")
+
+    def get_estimator(self, key: str) -> Optional[Any]:
+        if not self.storeEstimators:
+            return None
+        content = self.store.get_bytes(key)
+        if content is None:
+            self.misses += 1
+            return None
+        try:
+            estimator = pickle.loads(content)
+        except Exception as e:
+            logging.info(f"Ignoring unreadable fit cache entry {key}: {e}")
+            return None
+        self.hits += 1
+        return estimator
+
+    def put_estimator(self, key: str, estimator: Any) -> None:
+        if not self.storeEstimators:
+            return
+        try:
+            self.store.put_bytes(key, pickle.dumps(estimator, protocol=5))
+        except Exception as e:
+            raise USvisaException(e, sys) from e
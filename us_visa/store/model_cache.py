@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+
+class ModelCache:
+    """
+    Two local tiers in front of s3, addressed by the ETag (and version id when
+    the bucket is versioned) that a HEAD request returns for the object:
+
+    - memory: the raw bytes of the last object of every bucket key
+    - disk: the raw bytes, one file per content address, evicted least
+      recently used first once the directory grows past maxBytes; callers
+      that can load a file, such as memory-mapped model artifacts, are
+      handed its path instead of its bytes
+
+    Every fetch deserializes a new object, so that callers, such as the model
+    evaluator and the serving model holder, never share mutable state.
+
+    An object that changed in s3 gets a new ETag, so stale entries are never
+    served, they only wait for eviction.
+    """
+
+    def __init__(self, cacheDir: str, maxBytes: int, diskEnabled: bool = True):
+        """
+        :param cacheDir: Directory holding the cached object bytes
+        :param maxBytes: Size the directory is trimmed down to after every write
+        :param diskEnabled: False keeps only the in-memory tier
+        """
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.diskEnabled = diskEnabled
+        self._lock = threading.Lock()
+        # (bucket, key) -> (content address, object bytes)
+        self._contents: Dict[Tuple[str, str], Tuple[str, bytes]] = {}
+
+        self.memoryHits = 0
+        self.diskHits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_address(etag: str, versionId: Optional[str] = None) -> str:
+        return hashlib.sha256(f"{etag.strip(chr(34))}:{versionId or ''}".encode()).hexdigest()
+
+    def _path(self, address: str) -> str:
+        return os.path.join(self.cacheDir, f"{address}.bin")
+
+    def get_memory_bytes(self, bucketName: str, key: str, address: str) -> Optional[bytes]:
+        """
+        Return the object bytes cached in memory for this content, or None
+        """
+        with self._lock:
+            cachedAddress, content = self._contents.get((bucketName, key), (None, None))
+            if cachedAddress == address:
+                self.memoryHits += 1
+                return content
+            return None
+
+    def put_memory_bytes(self, bucketName: str, key: str, address: str, content: bytes) -> None:
+        with self._lock:
+            self._contents[(bucketName, key)] = (address, content)
+
+    def get_bytes(self, address: str) -> Optional[bytes]:
+        if not self.diskEnabled:
+            return None
+        try:
+            path = self._path(address)
+            with open(path, "rb") as file:
+                content = file.read()
+            # mtime orders the entries for eviction
+            os.utime(path)
+            self.diskHits += 1
+            return content
+        except FileNotFoundError:
+            return None
+
+    def get_path(self, address: str) -> Optional[str]:
+        if not self.diskEnabled:
+            return None
+        path = self._path(address)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        self.diskHits += 1
+        return path
+
+    def put_bytes(self, address: str, content: bytes) -> None:
+        if not self.diskEnabled:
+            return
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            # Write then rename, so that concurrent readers never see a partial file
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+            os.replace(tmpPath, self._path(address))
+            self._evict()
+        except OSError as e:
+            logging.info(f"Could not write model cache entry {address}: {e}")
+
+    def _evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.cacheDir):
+            if name.endswith(".bin"):
+                stat = os.stat(os.path.join(self.cacheDir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        totalBytes = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if totalBytes <= self.maxBytes:
+                break
+            os.remove(os.path.join(self.cacheDir, name))
+            totalBytes -= size
+            logging.info(f"Evicted model cache entry {name}")
+
+    def fetch(self,
+              bucketName: str,
+              key: str,
+              address: str,
+              download: Callable[[], bytes],
+              deserialize: Callable[[bytes], Any],
+              keepInMemory: bool = True,
+              deserializeFile: Optional[Callable[[str], Any]] = None,
+              ) -> Any:
+        """
+        Return a new object loaded from disk, else from memory, else downloaded
+        from s3, filling the tiers it was missing from
+
+        :param keepInMemory: False for objects read once, such as DataFrames,
+            whose bytes are not worth holding in memory
+        :param deserializeFile: Loads the object from the path of its disk
+            entry, used instead of deserialize whenever the entry exists
+        """
+        try:
+            if deserializeFile is not None:
+                path = self.get_path(address)
+                if path is not None:
+                    return deserializeFile(path)
+
+            content = self.get_memory_bytes(bucketName, key, address) if keepInMemory else None
+            if content is None and deserializeFile is None:
+                content = self.get_bytes(address)
+            if content is None:
+                self.misses += 1
+                content = download()
+                self.put_bytes(address, content)
+
+                # The entry is missing when the disk tier is disabled, failed to
+                # write or evicted it straight away for being larger than maxBytes
+                path = self._path(address)
+                if deserializeFile is not None and self.diskEnabled and os.path.exists(path):
+                    return deserializeFile(path)
+
+            if keepInMemory:
+                self.put_memory_bytes(bucketName, key, address, content)
+            return deserialize(content)
+        except Exception as e:
+            raise USvisaException(e, sys) from e
+
+    def get_stats(self) -> dict:
+        return {
+            "memoryHits": self.memoryHits,
+            "diskHits": self.diskHits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,127 @@
+import dataclasses
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from functools import lru_cache
+from typing import Any, Optional, Type
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+
+class StageCache:
+    """
+    Index of the completed stages of the training pipeline, keyed by a
+    fingerprint of everything a stage reads: the content of its input files,
+    the configuration it depends on, the source code of the package and the
+    fingerprint of the stage before it.
+
+    Every completed stage writes one manifest, <cacheDir>/<stage>/<fingerprint>.json,
+    holding its inputs and its artifact. A later run computing the same
+    fingerprint gets that artifact back, pointing into the workspace of the
+    run that produced it, as long as its files still exist. A run that fails
+    halfway has indexed the stages it completed, so the next run with the same
+    inputs resumes after them.
+    """
+
+    def __init__(self, cacheDir: str):
+        """
+        :param cacheDir: Directory holding the stage manifests
+        """
+        self.cacheDir = cacheDir
+
+    @staticmethod
+    def file_digest(filePath: str) -> str:
+        digest = hashlib.sha256()
+        with open(filePath, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def code_version() -> str:
+        """
+        Digest of the python sources of the us_visa package, so that any code
+        change invalidates every stage
+        """
+        packageDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(packageDir):
+            dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+            for name in sorted(files):
+                if name.endswith(".py"):
+                    path = os.path.join(root, name)
+                    digest.update(os.path.relpath(path, packageDir).encode())
+                    with open(path, "rb") as file:
+                        digest.update(file.read())
+        return digest.hexdigest()
+
+    @classmethod
+    def fingerprint(cls, stage: str, inputs: dict) -> str:
+        description = json.dumps(
+            {"stage": stage, "code": cls.code_version(), "inputs": inputs},
+            sort_keys=True, default=repr)
+        return hashlib.sha256(description.encode()).hexdigest()
+
+    def _path(self, stage: str, fingerprint: str) -> str:
+        return os.path.join(self.cacheDir, stage, f"{fingerprint}.json")
+
+    @staticmethod
+    def _from_dict(artifactType: Type, data: dict) -> Any:
+        values = {}
+        for field in dataclasses.fields(artifactType):
+            if field.name not in data:
+                continue
+            value = data[field.name]
+            if dataclasses.is_dataclass(field.type) and isinstance(value, dict):
+                value = StageCache._from_dict(field.type, value)
+            values[field.name] = value
+        return artifactType(**values)
+
+    @staticmethod
+    def _files_exist(data: dict) -> bool:
+        return all(os.path.exists(value) for key, value in data.items()
+                   if key.endswith("Path") and isinstance(value, str) and value)
+
+    def get(self, stage: str, fingerprint: str, artifactType: Type) -> Optional[Any]:
+        """
+        Return the artifact of a completed stage with this fingerprint, or None
+        when there is none or its files were removed
+        """
+        try:
+            with open(self._path(stage, fingerprint)) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.info(f"Ignoring unreadable {stage} stage manifest {fingerprint}: {e}")
+            return None
+
+        if not self._files_exist(manifest["artifact"]):
+            logging.info(f"Files of the cached {stage} stage {fingerprint} are gone")
+            return None
+        return self._from_dict(artifactType, manifest["artifact"])
+
+    def put(self, stage: str, fingerprint: str, inputs: dict, artifact: Any) -> None:
+        try:
+            stageDir = os.path.join(self.cacheDir, stage)
+            os.makedirs(stageDir, exist_ok=True)
+            manifest = {
+                "stage": stage,
+                "fingerprint": fingerprint,
+                "code": self.code_version(),
+                "inputs": inputs,
+                "artifact": dataclasses.asdict(artifact),
+                "completedAt": time.time(),
+            }
+            # Write then rename, so that a concurrent run never reads a partial manifest
+            fd, tmpPath = tempfile.mkstemp(dir=stageDir, suffix=".tmp")
+            with os.fdopen(fd, "w") as file:
+                json.dump(manifest, file, indent=2, default=repr)
+            os.replace(tmpPath, self._path(stage, fingerprint))
+        except Exception as e:
+            raise USvisaException(e, sys) from e
@@ -1,5 +1,6 @@
 import sys
-from typing import Optional
+from itertools import islice
+from typing import Iterator, Optional
 
 from us_visa.logger import logging
 from us_visa.configuration.mongo_db_connection import MongoDBClient
@@ -33,3 +34,32 @@ class USVisaDataExtractionUtil:
 
         except Exception as e:
             raise USvisaException(e, sys) from e
+
+    def iter_collection_chunks(self,
+                               collectionName: str,
+                               chunkSize: int,
+                               databaseName: Optional[str] = None,
+                               ) -> Iterator[pd.DataFrame]:
+        """
+        Read a collection through a single cursor, chunkSize documents at a
+        time, so that the whole collection is never held in memory
+        """
+        logging.info(f"Reading collection {collectionName} in chunks of {chunkSize}")
+        try:
+            if databaseName is None:
+                collection = self.mongoClient.database[collectionName]
+            else:
+                collection = self.mongoClient.client[databaseName][collectionName]
+
+            cursor = collection.find({}, {"_id": 0}).batch_size(chunkSize)
+            while True:
+                documents = list(islice(cursor, chunkSize))
+                if not documents:
+                    break
+
+                df = pd.DataFrame(documents)
+                df.replace({"na": np.nan}, inplace=True)
+                yield df
+
+        except Exception as e:
+            raise USvisaException(e, sys) from e
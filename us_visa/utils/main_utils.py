@@ -2,15 +2,21 @@ import sys
 import dill
 import kagglehub
 import os
+import pickle
 import numpy as np
 import pandas as pd
 
-from typing import Union
+from typing import List, Union
 
 import yaml
 
 from us_visa.exception import USvisaException
-from us_visa.logger import logging
+from us_visa.logger import logging, servingLogger
+from us_visa.utils.model_artifact import (ARTIFACT_MAGIC,
+                                          is_model_artifact,
+                                          load_model_artifact,
+                                          loads_model_artifact,
+                                          )
 
 
 def download_dataset(dataset: str,
@@ -108,14 +114,21 @@ def save_object(file_path: str, obj: object) -> None:
 
 
 def load_object(file_path: str) -> object:
-    logging.info("Entered the load_object method of utils")
+    logging.debug("Entered the load_object method of utils")
 
     try:
 
         with open(file_path, "rb") as file_obj:
-            obj = dill.load(file_obj)
+            if is_model_artifact(file_obj.read(len(ARTIFACT_MAGIC))):
+                obj = None
+            else:
+                file_obj.seek(0)
+                obj = dill.load(file_obj)
 
-        logging.info("Exited the load_object method of utils")
+        if obj is None:
+            obj = load_model_artifact(file_path)
+
+        logging.debug("Exited the load_object method of utils")
 
         return obj
 
@@ -123,6 +136,19 @@ def load_object(file_path: str) -> object:
         raise USvisaException(e, sys) from e
 
 
+def load_object_from_bytes(content: bytes) -> object:
+    """
+    Deserialize an object read into memory, either a model artifact or a pickle
+    """
+    try:
+        if is_model_artifact(content):
+            return loads_model_artifact(content)
+        return pickle.loads(content)
+
+    except Exception as e:
+        raise USvisaException(e, sys) from e
+
+
 def save_numpy_array_data(file_path: str, array: np.array):
     """
     Save numpy array data to file
@@ -153,7 +179,7 @@ def load_numpy_array_data(file_path: str) -> np.array:
 
 def result_mapping(value: int) -> str:
     try:
-        logging.info("Mapping value into str")
+        servingLogger.debug("Mapping value into str")
         status = None
         if value == 1:
             status = "Visa-approved"
@@ -162,3 +188,17 @@ def result_mapping(value: int) -> str:
         return status
     except Exception as e:
         raise USvisaException(e, sys)
+
+
+def batch_result_mapping(values: np.ndarray) -> List[str]:
+    """
+    Vectorized version of result_mapping for an array of predictions
+    """
+    try:
+        servingLogger.debug("Mapping %d values into str", len(values))
+        status = np.where(
+            np.asarray(values).astype(int) == 1, "Visa-approved", "Visa-Not_approved"
+        )
+        return status.tolist()
+    except Exception as e:
+        raise USvisaException(e, sys)
@@ -0,0 +1,172 @@
+"""
+Model artifact format, version 1:
+
+    magic (8 bytes) | manifest length (uint64 little endian) | JSON manifest
+    | pickle stream | array blocks, each starting on a BLOCK_ALIGNMENT boundary
+
+The object is pickled with protocol 5, every contiguous buffer larger than
+OUT_OF_BAND_MIN_BYTES (numpy arrays: tree nodes, KNN training matrices, scaler
+coefficients) is written as a separate block instead of being copied into the
+pickle stream. Uncompressed blocks are handed back to the unpickler as views
+of a copy-on-write memory map, so loading does not read or copy them up front.
+"""
+import json
+import lzma
+import mmap
+import os
+import pickle
+import struct
+import sys
+import zlib
+from typing import Any, List, Optional, Union
+
+from us_visa.exception import USvisaException
+from us_visa.logger import logging
+
+ARTIFACT_MAGIC: bytes = b"USVART\x00\x01"
+ARTIFACT_FORMAT_VERSION: int = 1
+BLOCK_ALIGNMENT: int = 64
+OUT_OF_BAND_MIN_BYTES: int = 1024
+
+_HEADER = struct.Struct("<8sQ")
+_COMPRESSORS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def is_model_artifact(header: bytes) -> bool:
+    """
+    True when the leading bytes of a file belong to the artifact format
+    """
+    return bytes(header[:len(ARTIFACT_MAGIC)]) == ARTIFACT_MAGIC
+
+
+def _align(offset: int) -> int:
+    return -(-offset // BLOCK_ALIGNMENT) * BLOCK_ALIGNMENT
+
+
+def save_model_artifact(file_path: str, obj: object, compression: Optional[str] = None) -> None:
+    """
+    :param file_path: Destination file, written atomically
+    :param obj: Object to serialize, usually a USvisaModel
+    :param compression: None, "zlib" or "lzma", compressed blocks cannot be memory-mapped
+    """
+    try:
+        if compression is not None and compression not in _COMPRESSORS:
+            raise ValueError(f"Unsupported artifact compression: {compression}")
+
+        buffers: List[memoryview] = []
+
+        def buffer_callback(buffer: pickle.PickleBuffer) -> bool:
+            view = buffer.raw()
+            if view.nbytes < OUT_OF_BAND_MIN_BYTES:
+                return True
+            buffers.append(view)
+            return False
+
+        stream = pickle.dumps(obj, protocol=5, buffer_callback=buffer_callback)
+
+        payloads = [
+            _COMPRESSORS[compression][0](view) if compression else view for view in buffers
+        ]
+        blocks = [
+            {"length": view.nbytes, "storedLength": len(payload) if compression else view.nbytes}
+            for view, payload in zip(buffers, payloads)
+        ]
+        manifest = {
+            "formatVersion": ARTIFACT_FORMAT_VERSION,
+            "objectType": f"{type(obj).__module__}.{type(obj).__qualname__}",
+            "compression": compression,
+            "pickleLength": len(stream),
+            "blocks": blocks,
+        }
+
+        # Offsets depend on the manifest length, which depends on the offsets:
+        # lay the file out again until the manifest length settles
+        manifestBytes = b""
+        while True:
+            offset = _HEADER.size + len(manifestBytes) + len(stream)
+            for block in blocks:
+                offset = _align(offset)
+                block["offset"] = offset
+                offset += block["storedLength"]
+
+            layoutBytes = json.dumps(manifest).encode()
+            if len(layoutBytes) == len(manifestBytes):
+                manifestBytes = layoutBytes
+                break
+            manifestBytes = layoutBytes
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        tmpPath = f"{file_path}.tmp"
+        with open(tmpPath, "wb") as file:
+            file.write(_HEADER.pack(ARTIFACT_MAGIC, len(manifestBytes)))
+            file.write(manifestBytes)
+            file.write(stream)
+            for block, payload in zip(blocks, payloads):
+                file.write(b"\x00" * (block["offset"] - file.tell()))
+                file.write(payload)
+        os.replace(tmpPath, file_path)
+
+        logging.info(
+            f"Saved model artifact {file_path}: {len(blocks)} array blocks, "
+            f"{os.path.getsize(file_path)} bytes")
+    except Exception as e:
+        raise USvisaException(e, sys) from e
+
+
+def _read_manifest(content: Union[bytes, memoryview, mmap.mmap]) -> dict:
+    magic, manifestLength = _HEADER.unpack_from(content, 0)
+    if magic != ARTIFACT_MAGIC:
+        raise ValueError("Not a model artifact")
+
+    manifest = json.loads(bytes(content[_HEADER.size:_HEADER.size + manifestLength]))
+    if manifest["formatVersion"] > ARTIFACT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version {manifest['formatVersion']}")
+
+    manifest["pickleOffset"] = _HEADER.size + manifestLength
+    return manifest
+
+
+def _unpickle(content: Union[bytes, memoryview, mmap.mmap]) -> Any:
+    manifest = _read_manifest(content)
+    view = memoryview(content)
+
+    compression = manifest["compression"]
+    buffers = []
+    for block in manifest["blocks"]:
+        stored = view[block["offset"]:block["offset"] + block["storedLength"]]
+        buffers.append(bytearray(_COMPRESSORS[compression][1](stored)) if compression else stored)
+
+    start = manifest["pickleOffset"]
+    return pickle.loads(view[start:start + manifest["pickleLength"]], buffers=buffers)
+
+
+def load_model_artifact(file_path: str, use_mmap: bool = True) -> Any:
+    """
+    Load an artifact, its array blocks mapped copy-on-write: pages are read
+    lazily, shared with other processes mapping the same file, and only
+    copied once written to
+    """
+    try:
+        with open(file_path, "rb") as file:
+            if not use_mmap:
+                return _unpickle(file.read())
+            content = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+        # The arrays keep the map alive, it is released once they are collected
+        return _unpickle(content)
+    except Exception as e:
+        raise USvisaException(e, sys) from e
+
+
+def loads_model_artifact(content: Union[bytes, bytearray]) -> Any:
+    """
+    Load an artifact already read into memory, for instance downloaded from s3
+    """
+    try:
+        # A bytearray keeps the arrays writable, as they are after unpickling
+        return _unpickle(content if isinstance(content, bytearray) else bytearray(content))
+    except Exception as e:
+        raise USvisaException(e, sys) from e